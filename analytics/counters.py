@@ -0,0 +1,186 @@
+"""
+Sharded counters for the daily analytics rows.
+
+Incrementing a field on one hot row (today's SalesAnalytics, a popular product's ProductAnalytics)
+makes every concurrent writer queue on that row's lock. Here each increment goes to one of
+ANALYTICS_COUNTER_SHARDS AnalyticsCounterShard rows chosen at random. Reads add up the shards,
+and compact() periodically folds them into the canonical rows.
+"""
+from collections import defaultdict
+from decimal import Decimal
+import random
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from analytics.models import AnalyticsCounterShard, SalesAnalytics, CustomerAnalytics, ProductAnalytics, WebsiteTraffic
+
+# metric -> (canonical model, field, field holding the sub-key or None)
+COUNTERS = {
+    'sales.total_revenue': (SalesAnalytics, 'total_revenue', None),
+    'sales.total_orders': (SalesAnalytics, 'total_orders', None),
+    'sales.discount_usage_count': (SalesAnalytics, 'discount_usage_count', None),
+    'sales.discount_total_amount': (SalesAnalytics, 'discount_total_amount', None),
+    'customers.new_customers': (CustomerAnalytics, 'new_customers', None),
+    'customers.returning_customers': (CustomerAnalytics, 'returning_customers', None),
+    'products.views': (ProductAnalytics, 'views', 'product_id'),
+    # No longer incremented (flush_traffic_cache upserts visits directly); kept so older shards still compact
+    'traffic.total_visits': (WebsiteTraffic, 'total_visits', None),
+}
+
+# When an unkeyed counter (sales, customers) last received an increment. Cached reports that add
+# pending_totals() to their figures include it in their version, since shards have no updated_at.
+# Keyed counters (one increment per product view) do not set it, to keep that path at one write.
+CHANGED_CACHE_KEY = 'analytics_counters_changed'
+
+
+def increment(date, amounts, key=''):
+    """
+    Add to one or more counters for a date. All metrics land on the same randomly chosen shard.
+
+    Args:
+        date: The day the increments count towards.
+        amounts (dict): metric -> amount, e.g. {'sales.total_orders': 1}. Zero amounts are skipped.
+        key: Sub-key for keyed metrics such as 'products.views' (the product id).
+    """
+    amounts = {metric: amount for metric, amount in amounts.items() if amount}
+    if not amounts:
+        return
+    key = str(key)
+    shard = random.randrange(settings.ANALYTICS_COUNTER_SHARDS)
+    shards = AnalyticsCounterShard.objects.filter(date=date, key=key, shard=shard)
+    missing = []
+    for metric, amount in amounts.items():
+        if not shards.filter(metric=metric).update(value=F('value') + amount):
+            missing.append(metric)
+    if missing:
+        # First write to this shard: create the rows (losing a race to another writer is fine) and retry
+        AnalyticsCounterShard.objects.bulk_create([
+            AnalyticsCounterShard(metric=metric, date=date, key=key, shard=shard) for metric in missing
+        ], ignore_conflicts=True)
+        for metric in missing:
+            shards.filter(metric=metric).update(value=F('value') + amounts[metric])
+    if not key:
+        cache.set(CHANGED_CACHE_KEY, timezone.now(), timeout=None)
+
+
+def last_changed():
+    """
+    When an unkeyed counter was last incremented, or None if it is not known.
+    """
+    return cache.get(CHANGED_CACHE_KEY)
+
+
+def pending_totals(metrics, date_from=None, date_to=None):
+    """
+    Sum the not yet compacted shard values per metric over a date range, so that dashboard totals
+    read from the canonical rows can include them.
+
+    Returns:
+        dict: metric -> Decimal total (0 for metrics with no pending increments).
+    """
+    shards = AnalyticsCounterShard.objects.filter(metric__in=metrics)
+    if date_from is not None:
+        shards = shards.filter(date__gte=date_from)
+    if date_to is not None:
+        shards = shards.filter(date__lte=date_to)
+    totals = dict(shards.values('metric').annotate(total=Sum('value')).values_list('metric', 'total'))
+    return {metric: totals.get(metric) or Decimal('0') for metric in metrics}
+
+
+def counter_value(metric, date, key=''):
+    """
+    The current value of one counter: the canonical field plus its pending shards.
+    """
+    model, field, key_field = COUNTERS[metric]
+    filters = {'date': date}
+    if key_field:
+        filters[key_field] = key
+    canonical = model.objects.filter(**filters).values_list(field, flat=True).first() or 0
+    pending = AnalyticsCounterShard.objects.filter(metric=metric, date=date, key=str(key)).aggregate(total=Sum('value'))['total'] or 0
+    return canonical + pending
+
+
+def compact():
+    """
+    Fold every shard into its canonical row and delete it. Shards keyed by a deleted object are
+    deleted without being folded.
+
+    Shards are locked with SELECT ... FOR UPDATE SKIP LOCKED before being read. A shard that a
+    writer's transaction is holding is left for the next run. A writer that reaches a shard after
+    it has been locked here waits, finds the row deleted and recreates it, so no increment is lost.
+    Derived fields (average order value, retention rate, lifetime value) are recomputed for the days touched,
+    and so are the week, month and quarter rollups containing them.
+
+    Returns:
+        tuple: (number of shard rows folded, number of analytics rows updated)
+    """
+    from analytics.aggregation import calculate_average_order_value, update_customer_metrics, update_customer_lifetime_value
+    touched = defaultdict(set)
+    with transaction.atomic():
+        shards = list(AnalyticsCounterShard.objects.select_for_update(skip_locked=True).order_by('id'))
+        if not shards:
+            return 0, 0
+
+        # (model, key field, date, key) -> {field: total}
+        totals = defaultdict(lambda: defaultdict(Decimal))
+        for shard in shards:
+            if shard.metric not in COUNTERS:
+                continue
+            model, field, key_field = COUNTERS[shard.metric]
+            totals[(model, key_field, shard.date, shard.key)][field] += shard.value
+
+        # Shards keyed by an object that has since been deleted (e.g. a product) have no row to fold
+        # into; they are dropped with the rest rather than failing the foreign key on every run
+        for entry in _orphaned(totals):
+            del totals[entry]
+
+        for (model, key_field, date, key), fields in totals.items():
+            lookup = {'date': date}
+            if key_field:
+                lookup[key_field] = int(key)
+            model.objects.get_or_create(**lookup)
+            updates = {field: F(field) + _as_field_value(model, field, amount) for field, amount in fields.items()}
+            if model is SalesAnalytics:
+                updates['average_order_value'] = calculate_average_order_value(
+                    F('total_revenue') + fields.get('total_revenue', 0),
+                    F('total_orders') + int(fields.get('total_orders', 0))
+                )
+            model.objects.filter(**lookup).update(updated_at=timezone.now(), **updates)
+            touched[model].add(date)
+
+        for date in touched.get(CustomerAnalytics, ()):
+            update_customer_metrics(date)
+        if touched.get(CustomerAnalytics):
+            update_customer_lifetime_value(max(touched[CustomerAnalytics]))
+
+        AnalyticsCounterShard.objects.filter(id__in=[shard.id for shard in shards]).delete()
+
+    from analytics import rollups
+    for model, dates in touched.items():
+        rollups.refresh(dates, models=[model])
+    return len(shards), len(totals)
+
+
+def _orphaned(totals):
+    # The totals entries whose key is not the id of an existing object of their key field's model
+    keys = defaultdict(set)
+    for model, key_field, date, key in totals:
+        if key_field:
+            keys[(model, key_field)].add(key)
+    existing = {}
+    for (model, key_field), model_keys in keys.items():
+        related_model = model._meta.get_field(key_field).related_model
+        ids = [int(key) for key in model_keys if key.isdigit()]
+        existing[(model, key_field)] = {str(pk) for pk in related_model.objects.filter(pk__in=ids).values_list('pk', flat=True)}
+    return [entry for entry in totals if entry[1] and entry[3] not in existing[(entry[0], entry[1])]]
+
+
+def _as_field_value(model, field, amount):
+    # Integer counters must not be incremented with a Decimal
+    if model._meta.get_field(field).get_internal_type() == 'DecimalField':
+        return amount
+    return int(amount)
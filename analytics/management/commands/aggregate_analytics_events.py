@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from analytics.models import AnalyticsEvent
+from analytics.aggregation import fold_events
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Folds queued order and signup events into the daily sales and customer analytics rows.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help='Events folded per transaction (default: 5000)')
+        parser.add_argument('--loop', action='store_true', help='Keep aggregating instead of exiting when the queue is empty')
+        parser.add_argument('--interval', type=float, default=10.0, help='Seconds between runs in --loop mode (default: 10)')
+
+    def handle(self, *args, **options):
+        """
+        Claim events oldest-first with SELECT ... FOR UPDATE SKIP LOCKED, fold them into the daily
+        rows and delete them in the same transaction, so an event is counted exactly once even
+        with several aggregators running.
+        """
+        folded = 0
+        while True:
+            with transaction.atomic():
+                batch = list(
+                    AnalyticsEvent.objects.select_for_update(skip_locked=True)
+                    .order_by('id')[:options['batch_size']]
+                )
+                if batch:
+                    fold_events(batch)
+                    AnalyticsEvent.objects.filter(id__in=[event.id for event in batch]).delete()
+                    folded += len(batch)
+
+            if len(batch) < options['batch_size']:
+                if not options['loop']:
+                    break
+                time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS(f"Folded {folded} analytics events."))
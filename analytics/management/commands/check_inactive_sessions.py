@@ -1,112 +1,56 @@
+from collections import Counter, defaultdict
+from datetime import timedelta, datetime, timezone as dt_timezone
+from django.conf import settings
 from django.core.management.base import BaseCommand
-from django.utils import timezone
 from django.core.cache import cache
-from django.contrib.sessions.models import Session
-from django.contrib.sessions.backends.db import SessionStore
-import json
-from datetime import timedelta
-import re
-
-DATE_FORMAT = "%Y-%m-%d"
+from django.utils import timezone
+from django_redis import get_redis_connection
+from analytics import visits
+from analytics.signals import TRAFFIC_KEY_TTL
 
 class Command(BaseCommand):
-    help = 'Checks for inactive sessions with single page visits and adjusts bounce counts accordingly.'
+    help = 'Closes visits that have gone inactive, counting bounces and visit durations.'
 
-    def adjust_bounce_count(self, session, session_data, visited_pages_key, visited_pages_value, date):
-        """
-        Adjusts the bounce count for a session and marks it as processed.
-        
-        Args:
-            session: The Session object to update.
-            session_data: The decoded session data dictionary.
-            visited_pages_key: The key in session_data for visited pages.
-            visited_pages_value: The value associated with visited_pages_key (list of pages).
-            date: The date object to use for the cache key.
-        
-        Returns:
-            bool: True if bounce count was adjusted, False otherwise.
-        """
-        bounces_key = f"website_traffic_bounces_{date}"
-        # Increment bounce count to track sessions with only one page visit 
-        # that have been inactive for over 30 minutes, indicating a bounce in website traffic analytics.
-        cache.incr(bounces_key)
-        # Mark session as processed by updating the visited_pages data
-        session_data[visited_pages_key] = visited_pages_value + ["processed_bounce"]
-        session.session_data = SessionStore().encode(session_data)
-        session.save()
-        return True
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Visits claimed per Redis call (default: 1000)')
 
     def handle(self, *args, **options):
         """
-        Scan for sessions that have only one page visit and have been inactive for over 30 minutes.
-        Increment bounce counts for these sessions and mark them as processed to avoid double-counting.
-        Only process sessions that haven't been checked recently based on a last_checked timestamp.
+        Claim visits whose visitor has been inactive for TRAFFIC_VISIT_INACTIVITY_TIMEOUT, oldest
+        first, from the activity sorted set (see analytics/visits.py). Those with a single page view
+        are added to the bounce count of the day the visit started, and every visit's duration (last
+        seen minus start) to that day's duration statistics. Sessions are never read or written, and
+        each visit is claimed, and so counted, exactly once.
         """
         self.stdout.write("Starting check for inactive sessions...")
-        inactivity_threshold = timezone.now() - timedelta(minutes=30)
-        recheck_threshold = timezone.now() - timedelta(hours=1)  # Re-check sessions only after 1 hour
+        redis_conn = get_redis_connection("default")
+        cutoff = timezone.now() - timedelta(seconds=settings.TRAFFIC_VISIT_INACTIVITY_TIMEOUT)
         sessions_processed = 0
         bounces_adjusted = 0
 
-        # Get all sessions that are still active in the database, processing in batches
-        for session in Session.objects.filter(expire_date__gte=timezone.now()).iterator(chunk_size=1000):
-            try:
-                session_data = session.get_decoded()
-                # Check if the session has been checked recently
-                last_checked_str = session_data.get('last_checked')
-                if last_checked_str:
-                    try:
-                        last_checked = timezone.datetime.fromisoformat(last_checked_str)
-                        if last_checked > recheck_threshold:
-                            continue  # Skip sessions checked within the last hour
-                    except ValueError:
-                        self.stderr.write(f"Invalid last_checked format for session {session.session_key}")
-                        # Process the session if the format is invalid, to be safe
-
-                # Look for keys that match the visited_pages pattern
-                for key, value in session_data.items():
-                    if key.startswith("visited_pages_"):
-                        # Extract date from the key if possible, format is visited_pages_{visitor_id}_{date}
-                        try:
-                            match = re.search(r'\d{4}-\d{2}-\d{2}$', key)
-                            if match:
-                                date_str = match.group(0)
-                                date = timezone.datetime.strptime(date_str, DATE_FORMAT).date()
-                            else:
-                                date = timezone.now().date()
-                        except (IndexError, ValueError):
-                            date = timezone.now().date()
-
-                        # Check if only one page was visited
-                        if isinstance(value, list) and len(value) == 1:
-                            # Check if the session has been inactive using the last_activity timestamp
-                            last_activity_str = session_data.get('last_activity')
-                            if last_activity_str:
-                                try:
-                                    last_activity = timezone.datetime.fromisoformat(last_activity_str)
-                                    if last_activity < inactivity_threshold:
-                                        if self.adjust_bounce_count(session, session_data, key, value, date):
-                                            bounces_adjusted += 1
-                                            sessions_processed += 1
-                                except ValueError:
-                                    self.stderr.write(f"Invalid last_activity format for session {session.session_key}")
-                                    # Fallback to expire_date for older sessions or format errors
-                                    if session.expire_date < inactivity_threshold:
-                                        if self.adjust_bounce_count(session, session_data, key, value, date):
-                                            bounces_adjusted += 1
-                                            sessions_processed += 1
-                            else:
-                                # Fallback for sessions without last_activity timestamp
-                                if session.expire_date < inactivity_threshold:
-                                    if self.adjust_bounce_count(session, session_data, key, value, date):
-                                        bounces_adjusted += 1
-                                        sessions_processed += 1
-                # Update last_checked timestamp for this session
-                session_data['last_checked'] = timezone.now().isoformat()
-                session.session_data = SessionStore().encode(session_data)
-                session.save()
-            except Exception as e:
-                self.stderr.write(f"Error processing session {session.session_key}: {str(e)}")
+        while True:
+            batch = visits.claim_inactive_visits(redis_conn, cutoff, options['batch_size'])
+            if not batch:
+                break
+            bounces = Counter()
+            durations = defaultdict(list)
+            for visitor_id, start, last_seen, pages in batch:
+                date = datetime.fromtimestamp(start, tz=dt_timezone.utc).date()
+                durations[date].append(max(last_seen - start, 0.0))
+                if pages == 1:
+                    bounces[date] += 1
+
+            pipe = redis_conn.pipeline(transaction=False)
+            for date, count in bounces.items():
+                bounces_key = cache.make_key(f"website_traffic_bounces_{date}")
+                pipe.incrby(bounces_key, count)
+                pipe.expire(bounces_key, TRAFFIC_KEY_TTL)
+            for date, seconds in durations.items():
+                visits.record_durations(pipe, date, seconds, TRAFFIC_KEY_TTL)
+            pipe.sadd(visits.CLOSED_DATES_KEY, *[str(date) for date in durations])
+            pipe.execute()
+            sessions_processed += len(batch)
+            bounces_adjusted += sum(bounces.values())
 
         self.stdout.write(self.style.SUCCESS(
             f"Completed check. Processed {sessions_processed} sessions, adjusted {bounces_adjusted} bounce counts."
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from analytics import counters
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Folds sharded analytics counter increments into the daily analytics rows.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep compacting instead of exiting after one pass')
+        parser.add_argument('--interval', type=float, default=60.0, help='Seconds between passes in --loop mode (default: 60)')
+
+    def handle(self, *args, **options):
+        while True:
+            folded, rows = counters.compact()
+            if folded:
+                self.stdout.write(self.style.SUCCESS(f"Folded {folded} counter shards into {rows} analytics rows."))
+            if not options['loop']:
+                if not folded:
+                    self.stdout.write('No counter shards to compact.')
+                break
+            time.sleep(options['interval'])
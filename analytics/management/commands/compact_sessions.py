@@ -0,0 +1,54 @@
+from importlib import import_module
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+from django.contrib.sessions.models import Session
+from django.contrib.sessions.backends.db import SessionStore
+from django.utils import timezone
+from analytics.session_data import compact_session_data
+
+class Command(BaseCommand):
+    help = 'Rewrites stored sessions to the compact analytics schema, dropping legacy per-day tracking keys.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Sessions rewritten per UPDATE batch (default: 1000)')
+        parser.add_argument('--dry-run', action='store_true', help='Count the sessions that would change without saving them')
+
+    def handle(self, *args, **options):
+        """
+        Decode every unexpired session in the database once, rewrite those holding legacy analytics
+        keys with bulk_update, and drop their cached copies so the cached_db backend reloads the
+        compact version. Sessions that are already compact are not written.
+        """
+        store = SessionStore()
+        # cached_db keeps a copy of each session in the cache; plain db and cache-only backends do not
+        cache_key_prefix = getattr(import_module(settings.SESSION_ENGINE).SessionStore, 'cache_key_prefix', None)
+        checked = 0
+        rewritten = 0
+        batch = []
+
+        for session in Session.objects.filter(expire_date__gte=timezone.now()).iterator(chunk_size=options['batch_size']):
+            checked += 1
+            try:
+                data, changed = compact_session_data(session.get_decoded())
+            except Exception as e:
+                self.stderr.write(f"Error decoding session {session.session_key}: {str(e)}")
+                continue
+            if changed:
+                session.session_data = store.encode(data)
+                batch.append(session)
+            if len(batch) >= options['batch_size']:
+                rewritten += self.save(batch, cache_key_prefix, options['dry_run'])
+                batch = []
+        rewritten += self.save(batch, cache_key_prefix, options['dry_run'])
+
+        verb = 'Would rewrite' if options['dry_run'] else 'Rewrote'
+        self.stdout.write(self.style.SUCCESS(f"{verb} {rewritten} of {checked} sessions."))
+
+    def save(self, batch, cache_key_prefix, dry_run):
+        if not batch or dry_run:
+            return len(batch)
+        Session.objects.bulk_update(batch, ['session_data'])
+        if cache_key_prefix:
+            caches[settings.SESSION_CACHE_ALIAS].delete_many([cache_key_prefix + session.session_key for session in batch])
+        return len(batch)
@@ -1,61 +1,112 @@
+from datetime import date as date_type
 from django.core.management.base import BaseCommand
 from django.utils import timezone
 from django.core.cache import cache
+from django.db import connection
 from django_redis import get_redis_connection
 from analytics.models import WebsiteTraffic
+from analytics import rollups, uniques, visits
+
+# One statement per day: adds the flushed visits to the day's row (creating it if needed) and
+# recomputes the bounce rate from the new total, so concurrent flushes never overwrite each other's visits
+UPSERT_SQL = """
+    INSERT INTO {table} (date, total_visits, unique_visitors, bounce_count, bounce_rate,
+                         average_session_duration, session_duration_histogram, top_referral_source,
+                         created_at, updated_at)
+    VALUES (%(date)s, %(visits)s, %(uniques)s, %(bounces)s,
+            CASE WHEN %(visits)s > 0 THEN %(bounces)s * 100.0 / %(visits)s ELSE 0.0 END,
+            %(duration)s, %(histogram)s, %(referral)s, %(now)s, %(now)s)
+    ON CONFLICT (date) DO UPDATE SET
+        total_visits = {table}.total_visits + excluded.total_visits,
+        unique_visitors = excluded.unique_visitors,
+        bounce_count = excluded.bounce_count,
+        bounce_rate = CASE WHEN {table}.total_visits + excluded.total_visits > 0
+                           THEN excluded.bounce_count * 100.0 / ({table}.total_visits + excluded.total_visits)
+                           ELSE 0.0 END,
+        average_session_duration = excluded.average_session_duration,
+        session_duration_histogram = excluded.session_duration_histogram,
+        top_referral_source = COALESCE(excluded.top_referral_source, {table}.top_referral_source),
+        updated_at = excluded.updated_at
+"""
 
 class Command(BaseCommand):
     help = 'Flushes cached website traffic data to the database'
 
     def handle(self, *args, **options):
-        today = timezone.now().date()
-        total_visits_key = f"website_traffic_total_{today}"
-        unique_visitors_key = f"website_traffic_unique_{today}"
-        bounces_key = f"website_traffic_bounces_{today}"
-        referrals_key = f"website_traffic_referrals_{today}"
-        
-        # Get the current visit count and other metrics from cache
-        visit_count = cache.get(total_visits_key, 0)
-        bounce_count = cache.get(bounces_key, 0)
-        
-        # Get unique visitors count directly from Redis
+        """
+        Flush every day that has visits waiting in Redis, not just today, so counts left in
+        yesterday's keys at midnight are not dropped.
+
+        A day's visit counter is read and deleted in one MULTI/EXEC, so increments landing during
+        the flush go to a fresh key and are picked up by the next run, and two hosts flushing at
+        once each get a disjoint share. Bounces and visit durations (added by check_inactive_sessions
+        as visits end), unique visitors and referrals are running totals for the day, read without
+        being reset; the average session duration is the day's duration sum over its ended visits.
+        """
         redis_conn = get_redis_connection("default")
-        unique_visitors_count = redis_conn.scard(unique_visitors_key)
-        bounce_rate = 0.0
-        if visit_count > 0:
-            bounce_rate = (bounce_count / visit_count) * 100 if bounce_count > 0 else 0.0
-        
-        # Get top referral source from Redis
+        prefix = cache.make_key("website_traffic_total_")
+        dates = set()
+        for key in redis_conn.scan_iter(match=f"{prefix}*", count=1000):
+            dates.add(key.decode('utf-8')[len(prefix):])
+        # Days whose visits ended (adding bounces and durations) after their visit counter was flushed
+        pipe = redis_conn.pipeline(transaction=True)
+        pipe.smembers(visits.CLOSED_DATES_KEY)
+        pipe.delete(visits.CLOSED_DATES_KEY)
+        dates.update(date.decode('utf-8') for date in pipe.execute()[0])
+
+        if not dates:
+            self.stdout.write(self.style.WARNING("No traffic data to flush"))
+            return
+
+        flushed = []
+        for date in sorted(dates):
+            try:
+                date = date_type.fromisoformat(date)
+            except ValueError:
+                continue
+            flushed.append(date)
+            visit_count, bounce_count, unique_visitors_count, top_referral_source, durations = self.claim(redis_conn, date)
+            average_session_duration, sessions, histogram = visits.parse_durations(durations)
+            self.upsert(date, visit_count, unique_visitors_count, bounce_count, top_referral_source, average_session_duration, histogram)
+            self.stdout.write(self.style.SUCCESS(f"Successfully flushed traffic data to database for {date}: {visit_count} visits, {unique_visitors_count} unique visitors, {bounce_count} bounces so far, avg session duration {average_session_duration:.1f}s over {sessions} ended sessions, top referral: {top_referral_source or 'N/A'}"))
+        rollups.refresh(flushed, models=[WebsiteTraffic])
+
+    def claim(self, redis_conn, date):
+        """
+        Atomically take the day's unflushed visit count and read its running totals.
+
+        Returns:
+            tuple: (visits, bounces, unique visitors, top referral source or None, duration statistics hash)
+        """
+        total_visits_key = cache.make_key(f"website_traffic_total_{date}")
+        bounces_key = cache.make_key(f"website_traffic_bounces_{date}")
+        referrals_key = f"website_traffic_referrals_{date}"
+
+        pipe = redis_conn.pipeline(transaction=True)
+        pipe.get(total_visits_key)
+        pipe.delete(total_visits_key)
+        pipe.get(bounces_key)
+        pipe.pfcount(uniques.daily_key(date))
+        pipe.hgetall(referrals_key)
+        pipe.hgetall(visits.durations_key(date))
+        visit_count, _, bounces, unique_visitors_count, referrals, durations = pipe.execute()
+
         top_referral_source = None
-        referrals = redis_conn.hgetall(referrals_key)
         if referrals:
             # Decode bytes to string and find the referral with the highest count
-            decoded_referrals = {k.decode('utf-8'): int(v.decode('utf-8')) for k, v in referrals.items()}
-            top_referral_source = max(decoded_referrals.items(), key=lambda x: x[1], default=('', 0))[0]
-            if not top_referral_source:  # In case the max returns an empty string
-                top_referral_source = None
-        
-        # Placeholder for average session duration (to be implemented)
-        average_session_duration = 0.0  # Default value; actual calculation needs session duration tracking
-        
-        if visit_count > 0 or unique_visitors_count > 0:
-            # Update or create the database record
-            traffic, created = WebsiteTraffic.objects.get_or_create(date=today)
-            # Update all available metrics
-            traffic.total_visits += visit_count
-            traffic.unique_visitors += unique_visitors_count
-            traffic.bounce_rate = bounce_rate
-            traffic.average_session_duration = average_session_duration
-            traffic.top_referral_source = top_referral_source
-            traffic.save()
-            
-            # Reset the cache counters for metrics that were flushed
-            cache.set(total_visits_key, 0, timeout=None)
-            cache.set(bounces_key, 0, timeout=None)
-            # Reset the Redis set for unique visitors and referrals
-            redis_conn.delete(unique_visitors_key)
-            redis_conn.delete(referrals_key)
-            
-            self.stdout.write(self.style.SUCCESS(f"Successfully flushed traffic data to database for {today}: {visit_count} visits, {unique_visitors_count} unique visitors, {bounce_rate:.2f}% bounce rate, avg session duration {average_session_duration}s, top referral: {top_referral_source or 'N/A'}"))
-        else:
-            self.stdout.write(self.style.WARNING(f"No traffic data to flush for {today}"))
+            decoded_referrals = {k.decode('utf-8'): int(v) for k, v in referrals.items()}
+            top_referral_source = max(decoded_referrals.items(), key=lambda x: x[1])[0] or None
+        return int(visit_count or 0), max(int(bounces or 0), 0), unique_visitors_count, top_referral_source, durations
+
+    def upsert(self, date, visit_count, unique_visitors_count, bounces, top_referral_source, average_session_duration, histogram):
+        with connection.cursor() as cursor:
+            cursor.execute(UPSERT_SQL.format(table=connection.ops.quote_name(WebsiteTraffic._meta.db_table)), {
+                'date': connection.ops.adapt_datefield_value(date),
+                'visits': visit_count,
+                'uniques': unique_visitors_count,
+                'bounces': bounces,
+                'duration': average_session_duration,
+                'histogram': connection.ops.adapt_json_value(histogram, None),
+                'referral': top_referral_source,
+                'now': connection.ops.adapt_datetimefield_value(timezone.now()),
+            })
@@ -0,0 +1,36 @@
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from analytics import rollups
+import time
+
+# When the last run started; daily rows updated since then are rolled up on the next run
+WATERMARK_CACHE_KEY = 'analytics:rollups:watermark'
+
+class Command(BaseCommand):
+    help = 'Recomputes the week, month and quarter analytics rollups for days whose daily rows changed.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Rebuild the rollups for every day with analytics data')
+        parser.add_argument('--loop', action='store_true', help='Keep refreshing instead of exiting')
+        parser.add_argument('--interval', type=float, default=300.0, help='Seconds between runs in --loop mode (default: 300)')
+
+    def handle(self, *args, **options):
+        """
+        Find the daily rows updated since the previous run (all of them with --full or on the first
+        run) and recompute only the periods containing their dates. The next watermark is taken
+        before reading, so rows changed while a run is in progress are picked up by the next one.
+        """
+        full = options['full']
+        while True:
+            started = timezone.now()
+            since = None if full else cache.get(WATERMARK_CACHE_KEY)
+            refreshed = 0
+            for model, dates in rollups.changed_dates(since).items():
+                refreshed += rollups.refresh(dates, models=[model])
+            cache.set(WATERMARK_CACHE_KEY, started, timeout=None)
+            self.stdout.write(self.style.SUCCESS(f"Refreshed {refreshed} analytics rollups{' (full rebuild)' if since is None else ''}."))
+            if not options['loop']:
+                break
+            full = False
+            time.sleep(options['interval'])
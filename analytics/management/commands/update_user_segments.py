@@ -1,74 +1,66 @@
+from concurrent.futures import ProcessPoolExecutor
 from django.core.management.base import BaseCommand
 from django.contrib.auth.models import User
-from django.db.models import Count, Avg, Max
+from django.db import connections
+from django.db.models import Max, Min
 from django.utils import timezone
-from datetime import timedelta
-from analytics.models import UserSegment
-from orders.models import Order
+from analytics.segments import update_segments
+import django
 import logging
 
+logger = logging.getLogger(__name__)
+
+
+def _init_worker():
+    # Workers started with spawn import nothing from the parent; forked ones must not share its connections
+    django.setup()
+    connections.close_all()
+
+
 class Command(BaseCommand):
-    help = 'Update user segments based on their behavior and activity'
+    help = 'Reconcile user order totals and segments with the orders table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help='Users aggregated and upserted per query (default: 5000)')
+        parser.add_argument('--workers', type=int, default=1, help='Processes to split the user id range across (default: 1)')
 
     def handle(self, *args, **options):
-        logger = logging.getLogger(__name__)
+        """
+        Rebuild every active user's order totals and segment from their paid orders with grouped
+        queries (see analytics/segments.py), batch_size users at a time. Segments are kept current
+        as payments succeed, so this is a reconciliation pass. With --workers, the user id range is
+        split into that many contiguous ranges processed in parallel, each by its own process and
+        database connection.
+        """
         self.stdout.write(self.style.SUCCESS('Starting user segment updates...'))
-        
-        # Get all active users
-        users = User.objects.filter(is_active=True)
-        total_users = len(users)
-        processed = 0
-        
-        # Time thresholds for activity analysis
-        recent_threshold = timezone.now() - timedelta(days=30)
-        long_term_threshold = timezone.now() - timedelta(days=180)
-        
-        for user in users:
-            try:
-                # Get user's order data for segmentation
-                orders = Order.objects.filter(user=user)
-                order_count = orders.count()
-                recent_orders = orders.filter(created_at__gte=recent_threshold).count()
-                avg_order_value = orders.aggregate(Avg('total_price'))['total_price__avg'] or 0.00
-                last_activity = orders.aggregate(Max('created_at'))['created_at__max']
-                
-                # Calculate purchase frequency (orders per month over the last 6 months)
-                if order_count > 0:
-                    long_term_orders = orders.filter(created_at__gte=long_term_threshold).count()
-                    purchase_frequency = long_term_orders / 6.0  # Average per month over 6 months
-                else:
-                    purchase_frequency = 0.0
-                
-                # Determine segment based on behavior
-                if order_count == 0:
-                    segment_type = 'new'
-                elif recent_orders == 0 and last_activity and last_activity < recent_threshold:
-                    segment_type = 'inactive'
-                elif purchase_frequency >= 2.0:
-                    segment_type = 'frequent_buyer'
-                elif avg_order_value >= 100.00:  # Threshold for high spender
-                    segment_type = 'high_spender'
-                else:
-                    segment_type = 'budget_conscious'
-                
-                # Update or create UserSegment
-                UserSegment.objects.update_or_create(
-                    user=user,
-                    defaults={
-                        'segment_type': segment_type,
-                        'purchase_frequency': purchase_frequency,
-                        'average_order_value': avg_order_value,
-                        'last_activity': last_activity
-                    }
-                )
-                self.stdout.write(f'Updated segment for user {user.username} to {segment_type}')
-                
-            except Exception as e:
-                logger.error(f'Error updating segment for user {user.username}: {str(e)}')
-                self.stdout.write(self.style.ERROR(f'Error for user {user.username}: {str(e)}'))
-            
-            processed += 1
-            if processed % 10 == 0:
-                self.stdout.write(f'Processed {processed}/{total_users} users...')
-        
-        self.stdout.write(self.style.SUCCESS(f'Finished updating segments for {total_users} users.'))
+        now = timezone.now()
+        bounds = User.objects.filter(is_active=True).aggregate(first=Min('id'), last=Max('id'))
+        if bounds['first'] is None:
+            self.stdout.write(self.style.SUCCESS('No active users to segment.'))
+            return
+
+        workers = max(1, options['workers'])
+        span = (bounds['last'] - bounds['first']) // workers + 1
+        ranges = [(start, min(start + span - 1, bounds['last'])) for start in range(bounds['first'], bounds['last'] + 1, span)]
+
+        if workers == 1:
+            results = [update_segments(*ranges[0], now, options['batch_size'])]
+        else:
+            # Connections cannot cross a fork; each worker opens its own
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+                futures = [pool.submit(update_segments, first, last, now, options['batch_size']) for first, last in ranges]
+                results = []
+                for (first, last), future in zip(ranges, futures):
+                    try:
+                        results.append(future.result())
+                    except Exception as e:
+                        logger.error(f'Error updating segments for users {first}..{last}: {str(e)}')
+                        self.stdout.write(self.style.ERROR(f'Error for users {first}..{last}: {str(e)}'))
+
+        totals = {}
+        for counts in results:
+            for segment_type, count in counts.items():
+                totals[segment_type] = totals.get(segment_type, 0) + count
+        summary = ', '.join(f'{segment_type}: {count}' for segment_type, count in sorted(totals.items()))
+        self.stdout.write(self.style.SUCCESS(f'Finished updating segments for {sum(totals.values())} users ({summary}).'))
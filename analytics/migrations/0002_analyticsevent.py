@@ -0,0 +1,64 @@
+# Generated by Django 5.2.3 on 2026-10-19 11:36
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0001_initial'),
+        ('products', '0005_supplier_stockalert'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnalyticsEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_type', models.CharField(choices=[('order_created', 'Order Created'), ('customer_signup', 'Customer Signup')], max_length=20)),
+                ('date', models.DateField(help_text='Day the event counts towards')),
+                ('user_id', models.IntegerField(blank=True, null=True)),
+                ('order_id', models.IntegerField(blank=True, null=True)),
+                ('amount', models.DecimalField(decimal_places=2, default=0.0, max_digits=10)),
+                ('discount_amount', models.DecimalField(decimal_places=2, default=0.0, max_digits=10)),
+                ('used_discount', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Analytics Events',
+            },
+        ),
+        migrations.CreateModel(
+            name='RecommendationInteraction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('interaction_type', models.CharField(choices=[('view', 'View'), ('click', 'Click'), ('add_to_cart', 'Add to Cart'), ('purchase', 'Purchase')], max_length=50)),
+                ('recommendation_source', models.CharField(choices=[('ml', 'Machine Learning'), ('session', 'Session-Based'), ('personalized', 'Personalized'), ('popular', 'Popular')], default='personalized', max_length=50)),
+                ('interacted_at', models.DateTimeField(auto_now_add=True)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recommendation_interactions', to='products.product')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='recommendation_interactions', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name_plural': 'Recommendation Interactions',
+            },
+        ),
+        migrations.CreateModel(
+            name='UserSegment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('segment_type', models.CharField(choices=[('new', 'New User'), ('frequent_buyer', 'Frequent Buyer'), ('high_spender', 'High Spender'), ('budget_conscious', 'Budget Conscious'), ('inactive', 'Inactive')], default='new', max_length=50)),
+                ('purchase_frequency', models.FloatField(default=0.0, help_text='Average purchases per month')),
+                ('average_order_value', models.DecimalField(decimal_places=2, default=0.0, max_digits=10)),
+                ('last_activity', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='segment', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name_plural': 'User Segments',
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.3 on 2026-10-19 11:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0002_analyticsevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnalyticsCounterShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('metric', models.CharField(max_length=50)),
+                ('date', models.DateField()),
+                ('key', models.CharField(blank=True, default='', help_text='Sub-key such as the product id, empty for daily totals', max_length=64)),
+                ('shard', models.PositiveSmallIntegerField()),
+                ('value', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+            ],
+            options={
+                'verbose_name_plural': 'Analytics Counter Shards',
+                'constraints': [models.UniqueConstraint(fields=('metric', 'date', 'key', 'shard'), name='unique_analytics_counter_shard')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-19 11:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0003_analyticscountershard'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='websitetraffic',
+            name='bounce_count',
+            field=models.PositiveIntegerField(default=0, help_text='Single-page visits'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-19 11:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0004_websitetraffic_bounce_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='websitetraffic',
+            name='session_duration_histogram',
+            field=models.JSONField(blank=True, default=dict, help_text="Ended sessions per duration bucket, keyed by the bucket's upper bound in seconds"),
+        ),
+    ]
@@ -0,0 +1,107 @@
+# Generated by Django 5.2.3 on 2026-10-19 11:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0005_websitetraffic_session_duration_histogram'),
+        ('products', '0005_supplier_stockalert'),
+        ('promotions', '0002_promotion_auto_schedule'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CustomerRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('week', 'Week'), ('month', 'Month'), ('quarter', 'Quarter')], max_length=10)),
+                ('period_start', models.DateField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('new_customers', models.PositiveIntegerField(default=0)),
+                ('returning_customers', models.PositiveIntegerField(default=0)),
+                ('retention_rate', models.FloatField(default=0.0, help_text='Percentage of returning customers')),
+            ],
+            options={
+                'verbose_name_plural': 'Customer Rollups',
+                'constraints': [models.UniqueConstraint(fields=('period', 'period_start'), name='unique_customer_rollup')],
+            },
+        ),
+        migrations.CreateModel(
+            name='SalesRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('week', 'Week'), ('month', 'Month'), ('quarter', 'Quarter')], max_length=10)),
+                ('period_start', models.DateField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('total_revenue', models.DecimalField(decimal_places=2, default=0.0, max_digits=14)),
+                ('total_orders', models.PositiveIntegerField(default=0)),
+                ('average_order_value', models.DecimalField(decimal_places=2, default=0.0, max_digits=10)),
+                ('discount_usage_count', models.PositiveIntegerField(default=0)),
+                ('discount_total_amount', models.DecimalField(decimal_places=2, default=0.0, max_digits=12)),
+            ],
+            options={
+                'verbose_name_plural': 'Sales Rollups',
+                'constraints': [models.UniqueConstraint(fields=('period', 'period_start'), name='unique_sales_rollup')],
+            },
+        ),
+        migrations.CreateModel(
+            name='TrafficRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('week', 'Week'), ('month', 'Month'), ('quarter', 'Quarter')], max_length=10)),
+                ('period_start', models.DateField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('total_visits', models.PositiveIntegerField(default=0)),
+                ('unique_visitors', models.PositiveIntegerField(default=0, help_text="Distinct visitors over the whole period where still countable, else the busiest day's")),
+                ('bounce_count', models.PositiveIntegerField(default=0)),
+                ('bounce_rate', models.FloatField(default=0.0, help_text='Percentage of single-page visits')),
+                ('average_session_duration', models.FloatField(default=0.0, help_text='Average time spent per session in seconds')),
+            ],
+            options={
+                'verbose_name_plural': 'Traffic Rollups',
+                'constraints': [models.UniqueConstraint(fields=('period', 'period_start'), name='unique_traffic_rollup')],
+            },
+        ),
+        migrations.CreateModel(
+            name='MarketingRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('week', 'Week'), ('month', 'Month'), ('quarter', 'Quarter')], max_length=10)),
+                ('period_start', models.DateField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('discount_code', models.CharField(blank=True, max_length=50, null=True)),
+                ('impressions', models.PositiveIntegerField(default=0)),
+                ('clicks', models.PositiveIntegerField(default=0)),
+                ('conversions', models.PositiveIntegerField(default=0)),
+                ('click_through_rate', models.FloatField(default=0.0, help_text='Percentage of impressions leading to clicks')),
+                ('conversion_rate', models.FloatField(default=0.0, help_text='Percentage of clicks leading to conversions')),
+                ('revenue_generated', models.DecimalField(decimal_places=2, default=0.0, max_digits=14)),
+                ('campaign', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='analytics_rollups', to='promotions.promotion')),
+            ],
+            options={
+                'verbose_name_plural': 'Marketing Rollups',
+                'indexes': [models.Index(fields=['period', 'period_start'], name='marketing_rollup_period_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ProductRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('week', 'Week'), ('month', 'Month'), ('quarter', 'Quarter')], max_length=10)),
+                ('period_start', models.DateField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('views', models.PositiveIntegerField(default=0)),
+                ('add_to_cart_count', models.PositiveIntegerField(default=0)),
+                ('purchase_count', models.PositiveIntegerField(default=0)),
+                ('conversion_rate', models.FloatField(default=0.0, help_text='Percentage of views leading to purchase')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='analytics_rollups', to='products.product')),
+            ],
+            options={
+                'verbose_name_plural': 'Product Rollups',
+                'constraints': [models.UniqueConstraint(fields=('period', 'period_start', 'product'), name='unique_product_rollup')],
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.3 on 2026-10-19 12:12
+
+from django.db import migrations, models
+
+
+def delete_duplicate_rollups(apps, schema_editor):
+    # Concurrent refreshes could each insert a full copy of a period's marketing rollups; the copies
+    # hold the same totals, so the oldest of each is kept
+    MarketingRollup = apps.get_model('analytics', 'MarketingRollup')
+    seen, duplicates = set(), []
+    for rollup in MarketingRollup.objects.order_by('id').values('id', 'period', 'period_start', 'campaign_id', 'discount_code').iterator():
+        key = (rollup['period'], rollup['period_start'], rollup['campaign_id'], rollup['discount_code'])
+        if key in seen:
+            duplicates.append(rollup['id'])
+        else:
+            seen.add(key)
+    for start in range(0, len(duplicates), 1000):
+        MarketingRollup.objects.filter(id__in=duplicates[start:start + 1000]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0007_userorderstats'),
+        ('promotions', '0002_promotion_auto_schedule'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_duplicate_rollups, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='marketingrollup',
+            name='marketing_rollup_period_idx',
+        ),
+        migrations.AddConstraint(
+            model_name='marketingrollup',
+            constraint=models.UniqueConstraint(fields=('period', 'period_start', 'campaign', 'discount_code'), name='unique_marketing_rollup'),
+        ),
+    ]
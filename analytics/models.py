@@ -86,8 +86,10 @@ class WebsiteTraffic(models.Model):
     date = models.DateField(unique=True)
     total_visits = models.PositiveIntegerField(default=0)
     unique_visitors = models.PositiveIntegerField(default=0)
+    bounce_count = models.PositiveIntegerField(default=0, help_text="Single-page visits")
     bounce_rate = models.FloatField(default=0.0, help_text="Percentage of single-page visits")
     average_session_duration = models.FloatField(default=0.0, help_text="Average time spent per session in seconds")
+    session_duration_histogram = models.JSONField(default=dict, blank=True, help_text="Ended sessions per duration bucket, keyed by the bucket's upper bound in seconds")
     top_referral_source = models.CharField(max_length=255, blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -121,6 +123,26 @@ class UserSegment(models.Model):
         return f"Segment for {self.user.username}: {self.get_segment_type_display()}"
 
 
+class UserOrderStats(models.Model):
+    """
+    Running totals of a user's paid orders, updated as each payment succeeds so the user's segment
+    can be reclassified without reading their order history (see analytics/segments.py).
+    """
+    user = models.OneToOneField('auth.User', on_delete=models.CASCADE, related_name='order_stats')
+    order_count = models.PositiveIntegerField(default=0)
+    total_spent = models.DecimalField(max_digits=12, decimal_places=2, default=0.00)
+    first_order_at = models.DateTimeField(null=True, blank=True)
+    last_order_at = models.DateTimeField(null=True, blank=True)
+    recent_orders = models.JSONField(default=list, blank=True, help_text="Unix timestamps of the paid orders placed in the long-term window (180 days), oldest first")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = "User Order Stats"
+
+    def __str__(self):
+        return f"Order stats for {self.user.username}: {self.order_count} orders"
+
+
 class RecommendationInteraction(models.Model):
     user = models.ForeignKey('auth.User', on_delete=models.CASCADE, related_name='recommendation_interactions', null=True, blank=True)
     product = models.ForeignKey('products.Product', on_delete=models.CASCADE, related_name='recommendation_interactions')
@@ -144,3 +166,160 @@ class RecommendationInteraction(models.Model):
     def __str__(self):
         user_str = self.user.username if self.user else "Anonymous"
         return f"{self.get_interaction_type_display()} by {user_str} on {self.product.name} via {self.get_recommendation_source_display()}"
+
+
+class AnalyticsEvent(models.Model):
+    """
+    Append-only record of a business event, written on the request path instead of updating the
+    daily analytics rows. aggregate_analytics_events folds these into SalesAnalytics and
+    CustomerAnalytics in batches and deletes them.
+    """
+    EVENT_TYPES = (
+        ('order_created', 'Order Created'),
+        ('customer_signup', 'Customer Signup'),
+    )
+
+    event_type = models.CharField(max_length=20, choices=EVENT_TYPES)
+    date = models.DateField(help_text="Day the event counts towards")
+    # Plain ids rather than foreign keys keep the insert free of constraint lookups and locks
+    user_id = models.IntegerField(null=True, blank=True)
+    order_id = models.IntegerField(null=True, blank=True)
+    amount = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
+    discount_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
+    used_discount = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name_plural = "Analytics Events"
+
+    def __str__(self):
+        return f"{self.get_event_type_display()} on {self.date.strftime('%Y-%m-%d')}"
+
+
+class AnalyticsCounterShard(models.Model):
+    """
+    One of several rows that together hold pending increments for a daily analytics counter.
+    Writers add to a randomly chosen shard so that they rarely wait on each other's row locks;
+    compact_analytics_counters folds the shards into the canonical analytics rows.
+    See analytics.counters.
+    """
+    metric = models.CharField(max_length=50)
+    date = models.DateField()
+    key = models.CharField(max_length=64, blank=True, default='', help_text="Sub-key such as the product id, empty for daily totals")
+    shard = models.PositiveSmallIntegerField()
+    value = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name_plural = "Analytics Counter Shards"
+        constraints = [
+            models.UniqueConstraint(fields=['metric', 'date', 'key', 'shard'], name='unique_analytics_counter_shard')
+        ]
+
+    def __str__(self):
+        return f"{self.metric}[{self.key}] shard {self.shard} on {self.date.strftime('%Y-%m-%d')}: {self.value}"
+
+
+class AnalyticsRollup(models.Model):
+    """
+    Totals of the daily analytics rows over a calendar week (starting Monday), month or quarter,
+    kept up to date by refresh_analytics_rollups. See analytics.rollups.
+    """
+    PERIODS = (
+        ('week', 'Week'),
+        ('month', 'Month'),
+        ('quarter', 'Quarter'),
+    )
+
+    period = models.CharField(max_length=10, choices=PERIODS)
+    period_start = models.DateField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        abstract = True
+
+
+class SalesRollup(AnalyticsRollup):
+    total_revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0.00)
+    total_orders = models.PositiveIntegerField(default=0)
+    average_order_value = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
+    discount_usage_count = models.PositiveIntegerField(default=0)
+    discount_total_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0.00)
+
+    class Meta:
+        verbose_name_plural = "Sales Rollups"
+        constraints = [
+            models.UniqueConstraint(fields=['period', 'period_start'], name='unique_sales_rollup')
+        ]
+
+    def __str__(self):
+        return f"Sales for the {self.period} of {self.period_start.strftime('%Y-%m-%d')} - Revenue: {self.total_revenue}"
+
+
+class CustomerRollup(AnalyticsRollup):
+    new_customers = models.PositiveIntegerField(default=0)
+    returning_customers = models.PositiveIntegerField(default=0)
+    retention_rate = models.FloatField(default=0.0, help_text="Percentage of returning customers")
+
+    class Meta:
+        verbose_name_plural = "Customer Rollups"
+        constraints = [
+            models.UniqueConstraint(fields=['period', 'period_start'], name='unique_customer_rollup')
+        ]
+
+    def __str__(self):
+        return f"Customers for the {self.period} of {self.period_start.strftime('%Y-%m-%d')} - New: {self.new_customers}"
+
+
+class ProductRollup(AnalyticsRollup):
+    product = models.ForeignKey('products.Product', on_delete=models.CASCADE, related_name='analytics_rollups')
+    views = models.PositiveIntegerField(default=0)
+    add_to_cart_count = models.PositiveIntegerField(default=0)
+    purchase_count = models.PositiveIntegerField(default=0)
+    conversion_rate = models.FloatField(default=0.0, help_text="Percentage of views leading to purchase")
+
+    class Meta:
+        verbose_name_plural = "Product Rollups"
+        constraints = [
+            models.UniqueConstraint(fields=['period', 'period_start', 'product'], name='unique_product_rollup')
+        ]
+
+    def __str__(self):
+        return f"Product {self.product_id} for the {self.period} of {self.period_start.strftime('%Y-%m-%d')} - Views: {self.views}"
+
+
+class MarketingRollup(AnalyticsRollup):
+    campaign = models.ForeignKey('promotions.Promotion', on_delete=models.CASCADE, related_name='analytics_rollups', null=True, blank=True)
+    discount_code = models.CharField(max_length=50, blank=True, null=True)
+    impressions = models.PositiveIntegerField(default=0)
+    clicks = models.PositiveIntegerField(default=0)
+    conversions = models.PositiveIntegerField(default=0)
+    click_through_rate = models.FloatField(default=0.0, help_text="Percentage of impressions leading to clicks")
+    conversion_rate = models.FloatField(default=0.0, help_text="Percentage of clicks leading to conversions")
+    revenue_generated = models.DecimalField(max_digits=14, decimal_places=2, default=0.00)
+
+    class Meta:
+        verbose_name_plural = "Marketing Rollups"
+        constraints = [
+            models.UniqueConstraint(fields=['period', 'period_start', 'campaign', 'discount_code'], name='unique_marketing_rollup')
+        ]
+
+    def __str__(self):
+        identifier = self.campaign_id or self.discount_code
+        return f"Marketing for {identifier} in the {self.period} of {self.period_start.strftime('%Y-%m-%d')} - Conversions: {self.conversions}"
+
+
+class TrafficRollup(AnalyticsRollup):
+    total_visits = models.PositiveIntegerField(default=0)
+    unique_visitors = models.PositiveIntegerField(default=0, help_text="Distinct visitors over the whole period where still countable, else the busiest day's")
+    bounce_count = models.PositiveIntegerField(default=0)
+    bounce_rate = models.FloatField(default=0.0, help_text="Percentage of single-page visits")
+    average_session_duration = models.FloatField(default=0.0, help_text="Average time spent per session in seconds")
+
+    class Meta:
+        verbose_name_plural = "Traffic Rollups"
+        constraints = [
+            models.UniqueConstraint(fields=['period', 'period_start'], name='unique_traffic_rollup')
+        ]
+
+    def __str__(self):
+        return f"Traffic for the {self.period} of {self.period_start.strftime('%Y-%m-%d')} - Visits: {self.total_visits}"
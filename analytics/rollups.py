@@ -0,0 +1,255 @@
+"""
+Week, month and quarter rollups of the daily analytics rows.
+
+Each rollup row holds the totals of one daily table over one calendar period. When daily rows
+change, refresh() recomputes just the periods containing the changed dates, so a refresh
+touches at most one week, month and quarter per day. counters.compact() and flush_traffic_cache
+call it for the days they write, and refresh_analytics_rollups catches every other change
+through the daily rows' updated_at.
+
+Refreshes of the same period may run at once (a compaction, a traffic flush and the nightly command),
+so each one holds a row lock on the period's SalesRollup row while it rewrites the rollups.
+
+Dashboards sum whole weeks from the rollups and only read the daily rows for the partial
+weeks at either end of their window (see window_totals).
+"""
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+import logging
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q, Sum
+from django.utils import timezone
+
+from analytics.models import (
+    SalesAnalytics, CustomerAnalytics, ProductAnalytics, MarketingAnalytics, WebsiteTraffic,
+    SalesRollup, CustomerRollup, ProductRollup, MarketingRollup, TrafficRollup,
+)
+
+logger = logging.getLogger(__name__)
+
+PERIODS = ('week', 'month', 'quarter')
+
+
+def period_start(period, date):
+    """
+    First day of the week (Monday), month or quarter containing date.
+    """
+    if period == 'week':
+        return date - timedelta(days=date.weekday())
+    if period == 'month':
+        return date.replace(day=1)
+    return date.replace(month=(date.month - 1) // 3 * 3 + 1, day=1)
+
+
+def period_end(period, start):
+    """
+    Last day of the period beginning on start.
+    """
+    if period == 'week':
+        return start + timedelta(days=6)
+    months = 1 if period == 'month' else 3
+    month = start.month - 1 + months
+    return start.replace(year=start.year + month // 12, month=month % 12 + 1, day=1) - timedelta(days=1)
+
+
+def changed_dates(since=None):
+    """
+    Dates of the daily analytics rows updated at or after since (every date when since is None).
+
+    Returns:
+        dict: daily model -> set of dates.
+    """
+    changed = {}
+    for model in REFRESHERS:
+        rows = model.objects.all() if since is None else model.objects.filter(updated_at__gte=since)
+        dates = set(rows.values_list('date', flat=True).distinct())
+        if dates:
+            changed[model] = dates
+    return changed
+
+
+def refresh(dates, models=None):
+    """
+    Recompute the week, month and quarter rollups containing each of dates.
+
+    Args:
+        dates (iterable): Days whose daily rows changed.
+        models (iterable, optional): Daily models to roll up; all of them by default.
+
+    Returns:
+        int: The number of (table, period) rollups recomputed.
+    """
+    periods = sorted({(period, period_start(period, date)) for date in dates for period in PERIODS})
+    refreshed = 0
+    for model in (models or REFRESHERS):
+        for period, start in periods:
+            with transaction.atomic():
+                lock_period(period, start)
+                REFRESHERS[model](period, start, period_end(period, start))
+            refreshed += 1
+    return refreshed
+
+
+def lock_period(period, start):
+    """
+    Lock the period's SalesRollup row, creating it if needed, until the current transaction ends; it
+    serializes the refreshes of one period across processes.
+    """
+    SalesRollup.objects.select_for_update().get_or_create(period=period, period_start=start)
+
+
+def _rate(part, whole):
+    return part * 100.0 / whole if whole else 0.0
+
+
+def refresh_sales(period, start, end):
+    totals = SalesAnalytics.objects.filter(date__range=(start, end)).aggregate(
+        total_revenue=Sum('total_revenue'), total_orders=Sum('total_orders'),
+        discount_usage_count=Sum('discount_usage_count'), discount_total_amount=Sum('discount_total_amount')
+    )
+    totals = {field: value or 0 for field, value in totals.items()}
+    average = Decimal(totals['total_revenue']) / totals['total_orders'] if totals['total_orders'] else Decimal('0')
+    SalesRollup.objects.update_or_create(period=period, period_start=start, defaults={
+        **totals, 'average_order_value': average.quantize(Decimal('0.01'))
+    })
+
+
+def refresh_customers(period, start, end):
+    totals = CustomerAnalytics.objects.filter(date__range=(start, end)).aggregate(
+        new_customers=Sum('new_customers'), returning_customers=Sum('returning_customers')
+    )
+    totals = {field: value or 0 for field, value in totals.items()}
+    CustomerRollup.objects.update_or_create(period=period, period_start=start, defaults={
+        **totals,
+        'retention_rate': _rate(totals['returning_customers'], totals['new_customers'] + totals['returning_customers'])
+    })
+
+
+def refresh_products(period, start, end):
+    rows = ProductAnalytics.objects.filter(date__range=(start, end)).values('product_id').annotate(
+        views=Sum('views'), add_to_cart_count=Sum('add_to_cart_count'), purchase_count=Sum('purchase_count')
+    )
+    rows = list(rows)
+    ProductRollup.objects.bulk_create(
+        [
+            ProductRollup(period=period, period_start=start, conversion_rate=_rate(row['purchase_count'], row['views']), **row)
+            for row in rows
+        ],
+        update_conflicts=True, unique_fields=['period', 'period_start', 'product'],
+        update_fields=['views', 'add_to_cart_count', 'purchase_count', 'conversion_rate', 'updated_at'],
+    )
+    ProductRollup.objects.filter(period=period, period_start=start).exclude(
+        product_id__in=[row['product_id'] for row in rows]
+    ).delete()
+
+
+MARKETING_ROLLUP_FIELDS = [
+    'impressions', 'clicks', 'conversions', 'click_through_rate', 'conversion_rate', 'revenue_generated', 'updated_at'
+]
+
+
+def refresh_marketing(period, start, end):
+    rows = MarketingAnalytics.objects.filter(date__range=(start, end)).values('campaign_id', 'discount_code').annotate(
+        impressions=Sum('impressions'), clicks=Sum('clicks'), conversions=Sum('conversions'),
+        revenue_generated=Sum('revenue_generated')
+    )
+    # Either identifier may be NULL, which ON CONFLICT never matches, so the rows are matched up with
+    # the period's existing ones here: updated in place, created, or deleted when no longer present
+    existing = {
+        (rollup.campaign_id, rollup.discount_code): rollup
+        for rollup in MarketingRollup.objects.filter(period=period, period_start=start)
+    }
+    now = timezone.now()
+    updated, created = [], []
+    for row in rows:
+        rollup = existing.pop((row['campaign_id'], row['discount_code']), None)
+        (created if rollup is None else updated).append(MarketingRollup(
+            pk=rollup.pk if rollup else None, period=period, period_start=start, updated_at=now,
+            click_through_rate=_rate(row['clicks'], row['impressions']),
+            conversion_rate=_rate(row['conversions'], row['clicks']),
+            **row
+        ))
+    MarketingRollup.objects.bulk_update(updated, MARKETING_ROLLUP_FIELDS)
+    MarketingRollup.objects.bulk_create(created)
+    MarketingRollup.objects.filter(pk__in=[rollup.pk for rollup in existing.values()]).delete()
+
+
+def refresh_traffic(period, start, end):
+    days = list(WebsiteTraffic.objects.filter(date__range=(start, end)).values(
+        'total_visits', 'unique_visitors', 'bounce_count', 'average_session_duration', 'session_duration_histogram'
+    ))
+    total_visits = sum(day['total_visits'] for day in days)
+    bounce_count = sum(day['bounce_count'] for day in days)
+    # Weight each day's average duration by the number of sessions it was measured over
+    sessions = [sum((day['session_duration_histogram'] or {}).values()) for day in days]
+    duration = sum(day['average_session_duration'] * count for day, count in zip(days, sessions))
+    TrafficRollup.objects.update_or_create(period=period, period_start=start, defaults={
+        'total_visits': total_visits,
+        'unique_visitors': _period_unique_visitors(start, end, days),
+        'bounce_count': bounce_count,
+        'bounce_rate': _rate(bounce_count, total_visits),
+        'average_session_duration': duration / sum(sessions) if sum(sessions) else 0.0,
+    })
+
+
+def _period_unique_visitors(start, end, days):
+    # Daily uniques cannot be added up (a visitor returning on several days would be counted several
+    # times), so count the period's distinct visitors from the daily HyperLogLogs while they all exist
+    today = timezone.now().date()
+    oldest_countable = today - timedelta(seconds=settings.TRAFFIC_UNIQUES_DAILY_TTL) + timedelta(days=1)
+    if start >= oldest_countable:
+        from analytics.uniques import count_unique_visitors
+        try:
+            return count_unique_visitors(start, min(end, today))
+        except Exception as e:
+            logger.warning(f"Could not count unique visitors for {start}..{end}: {str(e)}")
+    return max((day['unique_visitors'] for day in days), default=0)
+
+
+# Daily model -> function recomputing its rollup for one period
+REFRESHERS = {
+    SalesAnalytics: refresh_sales,
+    CustomerAnalytics: refresh_customers,
+    ProductAnalytics: refresh_products,
+    MarketingAnalytics: refresh_marketing,
+    WebsiteTraffic: refresh_traffic,
+}
+
+
+def window_totals(rollup_model, daily_model, start, end, group_by, fields):
+    """
+    Sum fields per group over the days start..end inclusive in a single query: whole weeks are read
+    from the weekly rollups and only the partial weeks at either end from the daily rows, combined
+    with UNION ALL.
+
+    Args:
+        rollup_model: The rollup model, e.g. ProductRollup.
+        daily_model: The matching daily model, e.g. ProductAnalytics.
+        start, end (date): The window.
+        group_by (tuple): Fields to group by, present on both models (e.g. ('product_id', 'product__name')).
+        fields (tuple): Fields to sum, present on both models.
+
+    Returns:
+        list: One dict per group with the group_by fields and the summed fields.
+    """
+    first_week = period_start('week', start + timedelta(days=6))
+    last_week = period_start('week', end - timedelta(days=6))
+    sums = {field: Sum(field) for field in fields}
+    if first_week <= last_week:
+        daily = daily_model.objects.filter(
+            Q(date__range=(start, first_week - timedelta(days=1))) | Q(date__range=(last_week + timedelta(days=7), end))
+        )
+        weekly = rollup_model.objects.filter(period='week', period_start__range=(first_week, last_week))
+        rows = daily.values(*group_by).annotate(**sums).union(weekly.values(*group_by).annotate(**sums), all=True)
+    else:
+        rows = daily_model.objects.filter(date__range=(start, end)).values(*group_by).annotate(**sums)
+
+    totals = defaultdict(lambda: dict.fromkeys(fields, 0))
+    for row in rows:
+        group = totals[tuple(row[field] for field in group_by)]
+        for field in fields:
+            group[field] += row[field] or 0
+    return [{**dict(zip(group_by, key)), **values} for key, values in totals.items()]
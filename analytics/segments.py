@@ -0,0 +1,224 @@
+"""
+User segments, kept current as orders are paid and reconciled nightly.
+
+Each user has a UserOrderStats row of running totals over their paid orders: order count, total
+spent, first and last order, and the timestamps of the orders still inside the long-term window.
+When a payment succeeds, record_paid_order() adds the order to those totals and reclassifies that
+one user, so the work per order does not grow with the user's history.
+
+update_user_segments rebuilds every active user's totals and segment from the orders table, in
+chunks: one grouped query computes the metrics and classifies the segment with CASE expressions,
+and the chunk is written back with INSERT ... ON CONFLICT DO UPDATE. It corrects any drift (orders
+cancelled after payment, updates lost to a crash) and moves users into 'inactive' once their last
+order leaves the recent window, which no order event would do.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+from django.db.models import Avg, Case, CharField, Count, Max, Min, Q, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from analytics.models import UserOrderStats, UserSegment
+
+# Orders that count towards a user's segment: the payment has succeeded
+PAID_STATUSES = ('completed', 'processing', 'shipped', 'delivered')
+RECENT_DAYS = 30
+LONG_TERM_MONTHS = 6
+LONG_TERM_DAYS = LONG_TERM_MONTHS * 30
+# Orders per month over the last LONG_TERM_MONTHS months that make a frequent buyer
+FREQUENT_BUYER_ORDERS_PER_MONTH = 2.0
+# Average order value that makes a high spender
+HIGH_SPENDER_ORDER_VALUE = Decimal('100.00')
+
+SEGMENT_FIELDS = ['segment_type', 'purchase_frequency', 'average_order_value', 'last_activity', 'updated_at']
+STATS_FIELDS = ['order_count', 'total_spent', 'first_order_at', 'last_order_at', 'recent_orders', 'updated_at']
+
+
+def classify(order_count, recent_orders, long_term_orders, average_order_value, last_activity, now):
+    """
+    The segment of a user with these paid order metrics; the rules of the CASE in segment_metrics().
+    """
+    if order_count == 0:
+        return 'new'
+    if recent_orders == 0 and last_activity and last_activity < now - timedelta(days=RECENT_DAYS):
+        return 'inactive'
+    if long_term_orders / float(LONG_TERM_MONTHS) >= FREQUENT_BUYER_ORDERS_PER_MONTH:
+        return 'frequent_buyer'
+    if average_order_value >= HIGH_SPENDER_ORDER_VALUE:
+        return 'high_spender'
+    return 'budget_conscious'
+
+
+def segment_from_stats(stats, now):
+    """
+    An unsaved UserSegment for the user of a UserOrderStats row, classified from its totals alone.
+    """
+    recent_threshold = (now - timedelta(days=RECENT_DAYS)).timestamp()
+    long_term_threshold = (now - timedelta(days=LONG_TERM_DAYS)).timestamp()
+    long_term_orders = sum(1 for placed in stats.recent_orders if placed >= long_term_threshold)
+    recent_orders = sum(1 for placed in stats.recent_orders if placed >= recent_threshold)
+    average_order_value = (Decimal(stats.total_spent) / stats.order_count if stats.order_count else Decimal('0')).quantize(Decimal('0.01'))
+    return UserSegment(
+        user_id=stats.user_id,
+        segment_type=classify(stats.order_count, recent_orders, long_term_orders, average_order_value, stats.last_order_at, now),
+        purchase_frequency=long_term_orders / float(LONG_TERM_MONTHS),
+        average_order_value=average_order_value,
+        last_activity=stats.last_order_at,
+    )
+
+
+def record_paid_order(order, now=None):
+    """
+    Add a newly paid order to its user's running totals and reclassify that user.
+
+    Call it once per order, inside the transaction that marks the order paid. A user without totals
+    yet (no paid order since the last update_user_segments run) gets them built from their orders,
+    which already include this one.
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        stats = UserOrderStats.objects.select_for_update().filter(user_id=order.user_id).first()
+        if stats is None:
+            stats = _stats_from_orders(order.user_id, now)
+            try:
+                with transaction.atomic():
+                    stats.save(force_insert=True)
+            except IntegrityError:
+                # Another payment for the same user created the totals first; add to those instead
+                stats = UserOrderStats.objects.select_for_update().get(user_id=order.user_id)
+                _add_order(stats, order, now)
+                stats.save()
+        else:
+            _add_order(stats, order, now)
+            stats.save()
+        segment = segment_from_stats(stats, now)
+        UserSegment.objects.update_or_create(user_id=order.user_id, defaults={
+            field: getattr(segment, field) for field in SEGMENT_FIELDS if field != 'updated_at'
+        })
+
+
+def _add_order(stats, order, now):
+    placed = order.created_at
+    stats.order_count += 1
+    stats.total_spent = Decimal(stats.total_spent) + order.total_price
+    stats.first_order_at = min(filter(None, [stats.first_order_at, placed]))
+    stats.last_order_at = max(filter(None, [stats.last_order_at, placed]))
+    # Timestamps that have left the long-term window are dropped, so the list stays bounded
+    long_term_threshold = (now - timedelta(days=LONG_TERM_DAYS)).timestamp()
+    stats.recent_orders = sorted(
+        [timestamp for timestamp in stats.recent_orders if timestamp >= long_term_threshold] + [placed.timestamp()]
+    )
+
+
+def _stats_from_orders(user_id, now):
+    from orders.models import Order
+    paid = Order.objects.filter(user_id=user_id, status__in=PAID_STATUSES)
+    totals = paid.aggregate(order_count=Count('id'), total_spent=Sum('total_price'),
+                            first_order_at=Min('created_at'), last_order_at=Max('created_at'))
+    recent = paid.filter(created_at__gte=now - timedelta(days=LONG_TERM_DAYS)).order_by('created_at').values_list('created_at', flat=True)
+    return UserOrderStats(
+        user_id=user_id,
+        order_count=totals['order_count'],
+        total_spent=totals['total_spent'] or Decimal('0'),
+        first_order_at=totals['first_order_at'],
+        last_order_at=totals['last_order_at'],
+        recent_orders=[placed.timestamp() for placed in recent],
+    )
+
+
+def segment_metrics(now):
+    """
+    Active users annotated with their paid order metrics and segment, grouped by user.
+
+    Args:
+        now (datetime): The time the recent and long-term windows end.
+
+    Returns:
+        QuerySet: values of id, the order totals and segment_type.
+    """
+    recent_threshold = now - timedelta(days=RECENT_DAYS)
+    long_term_threshold = now - timedelta(days=LONG_TERM_DAYS)
+    paid = Q(orders__status__in=PAID_STATUSES)
+    return User.objects.filter(is_active=True).values('id').annotate(
+        order_count=Count('orders', filter=paid),
+        recent_orders=Count('orders', filter=paid & Q(orders__created_at__gte=recent_threshold)),
+        long_term_orders=Count('orders', filter=paid & Q(orders__created_at__gte=long_term_threshold)),
+        total_spent=Coalesce(Sum('orders__total_price', filter=paid), Value(Decimal('0.00'))),
+        average_order_value=Coalesce(Avg('orders__total_price', filter=paid), Value(Decimal('0.00'))),
+        first_order_at=Min('orders__created_at', filter=paid),
+        last_activity=Max('orders__created_at', filter=paid),
+    ).annotate(
+        segment_type=Case(
+            When(order_count=0, then=Value('new')),
+            When(recent_orders=0, last_activity__lt=recent_threshold, then=Value('inactive')),
+            When(long_term_orders__gte=FREQUENT_BUYER_ORDERS_PER_MONTH * LONG_TERM_MONTHS, then=Value('frequent_buyer')),
+            When(average_order_value__gte=HIGH_SPENDER_ORDER_VALUE, then=Value('high_spender')),
+            default=Value('budget_conscious'),
+            output_field=CharField(),
+        )
+    ).values(
+        'id', 'order_count', 'long_term_orders', 'total_spent', 'average_order_value', 'first_order_at',
+        'last_activity', 'segment_type'
+    ).order_by('id')
+
+
+def update_segments(first_id, last_id, now, batch_size=5000):
+    """
+    Rebuild the order totals and segments of the active users whose id is in first_id..last_id from
+    their orders, batch_size users at a time.
+
+    Args:
+        first_id, last_id (int): The user id range, inclusive.
+        now (datetime): The time the recent and long-term windows end.
+        batch_size (int): Users per query and upsert.
+
+    Returns:
+        dict: segment_type -> number of users updated.
+    """
+    from orders.models import Order
+    counts = {}
+    after = first_id - 1
+    while True:
+        rows = list(segment_metrics(now).filter(id__gt=after, id__lte=last_id)[:batch_size])
+        if not rows:
+            return counts
+        recent_orders = {row['id']: [] for row in rows}
+        for user_id, placed in Order.objects.filter(
+            user_id__in=recent_orders, status__in=PAID_STATUSES, created_at__gte=now - timedelta(days=LONG_TERM_DAYS)
+        ).order_by('created_at').values_list('user_id', 'created_at'):
+            recent_orders[user_id].append(placed.timestamp())
+
+        with transaction.atomic():
+            UserOrderStats.objects.bulk_create(
+                [
+                    UserOrderStats(
+                        user_id=row['id'],
+                        order_count=row['order_count'],
+                        total_spent=row['total_spent'],
+                        first_order_at=row['first_order_at'],
+                        last_order_at=row['last_activity'],
+                        recent_orders=recent_orders[row['id']],
+                    )
+                    for row in rows
+                ],
+                update_conflicts=True, unique_fields=['user'], update_fields=STATS_FIELDS,
+            )
+            UserSegment.objects.bulk_create(
+                [
+                    UserSegment(
+                        user_id=row['id'],
+                        segment_type=row['segment_type'],
+                        purchase_frequency=row['long_term_orders'] / float(LONG_TERM_MONTHS),
+                        average_order_value=Decimal(row['average_order_value']).quantize(Decimal('0.01')),
+                        last_activity=row['last_activity'],
+                    )
+                    for row in rows
+                ],
+                update_conflicts=True, unique_fields=['user'], update_fields=SEGMENT_FIELDS,
+            )
+        for row in rows:
+            counts[row['segment_type']] = counts.get(row['segment_type'], 0) + 1
+        after = rows[-1]['id']
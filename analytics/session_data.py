@@ -0,0 +1,51 @@
+"""
+Compact per-session analytics state.
+
+Analytics keeps what it needs in the session under a single small dict, TRACKING_KEY, instead of
+top-level keys (visit, referral and activity state now lives in Redis, see analytics/visits.py).
+Values are written only when they change, so reading them never forces a session save.
+"""
+
+TRACKING_KEY = '_trk'
+
+# Field names inside TRACKING_KEY
+AB_GROUP = 'ab'  # Recommendation A/B test group
+
+# Top-level keys written by earlier versions of the analytics middleware and views
+LEGACY_KEYS = ('session_start', 'referral_source', 'last_checked', 'last_activity', 'recommendation_test_group')
+LEGACY_KEY_PREFIXES = ('visited_pages_',)
+
+
+def get_tracking_value(session, field, default=None):
+    return session.get(TRACKING_KEY, {}).get(field, default)
+
+
+def set_tracking_value(session, field, value):
+    """
+    Store a value in the session's tracking struct, marking the session modified only if it changed.
+    """
+    tracking = session.get(TRACKING_KEY, {})
+    if tracking.get(field) != value:
+        session[TRACKING_KEY] = {**tracking, field: value}
+
+
+def compact_session_data(data):
+    """
+    Rewrite decoded session data to the compact schema: the recommendation A/B group moves into the
+    tracking struct and the other legacy analytics keys, including every per-day visited_pages_ key,
+    are dropped.
+
+    Args:
+        data (dict): Decoded session data.
+
+    Returns:
+        tuple: (compacted data, whether anything changed)
+    """
+    compacted = {
+        key: value for key, value in data.items()
+        if key not in LEGACY_KEYS and not key.startswith(LEGACY_KEY_PREFIXES)
+    }
+    ab_group = data.get('recommendation_test_group')
+    if ab_group and AB_GROUP not in compacted.get(TRACKING_KEY, {}):
+        compacted[TRACKING_KEY] = {**compacted.get(TRACKING_KEY, {}), AB_GROUP: ab_group}
+    return compacted, compacted != data
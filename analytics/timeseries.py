@@ -0,0 +1,108 @@
+"""
+Daily analytics metrics as compact time series for the dashboard charts.
+
+A series is two parallel arrays, timestamps (Unix seconds at midnight UTC of each day) and values,
+instead of a list of row dicts repeating every field name. Long ranges are downsampled on the server
+with Largest-Triangle-Three-Buckets, which keeps the points that shape the line (peaks, troughs,
+turns) so a multi-year chart of a few hundred points looks like the full one.
+"""
+from datetime import datetime, time, timezone as dt_timezone
+
+from django.db.models import Sum
+
+from analytics.models import SalesAnalytics, CustomerAnalytics, MarketingAnalytics, WebsiteTraffic
+
+# metric -> (daily model, field); named like the counters in analytics/counters.py
+SERIES = {
+    'sales.total_revenue': (SalesAnalytics, 'total_revenue'),
+    'sales.total_orders': (SalesAnalytics, 'total_orders'),
+    'sales.average_order_value': (SalesAnalytics, 'average_order_value'),
+    'sales.discount_usage_count': (SalesAnalytics, 'discount_usage_count'),
+    'customers.new_customers': (CustomerAnalytics, 'new_customers'),
+    'customers.returning_customers': (CustomerAnalytics, 'returning_customers'),
+    'customers.retention_rate': (CustomerAnalytics, 'retention_rate'),
+    'customers.total_customers': (CustomerAnalytics, 'total_customers'),
+    'marketing.impressions': (MarketingAnalytics, 'impressions'),
+    'marketing.clicks': (MarketingAnalytics, 'clicks'),
+    'marketing.conversions': (MarketingAnalytics, 'conversions'),
+    'marketing.revenue_generated': (MarketingAnalytics, 'revenue_generated'),
+    'traffic.total_visits': (WebsiteTraffic, 'total_visits'),
+    'traffic.unique_visitors': (WebsiteTraffic, 'unique_visitors'),
+    'traffic.bounce_rate': (WebsiteTraffic, 'bounce_rate'),
+    'traffic.average_session_duration': (WebsiteTraffic, 'average_session_duration'),
+}
+
+# Metrics whose daily rows are not one per day (one row per campaign or discount code) and are summed per day
+SUMMED_PER_DAY = {MarketingAnalytics}
+
+
+def load_series(metric, start, end):
+    """
+    The daily values of a metric between start and end inclusive, oldest first.
+
+    Args:
+        metric (str): A key of SERIES.
+        start, end (date): The range.
+
+    Returns:
+        tuple: (timestamps, values) lists of equal length; days without a row are left out.
+    """
+    model, field = SERIES[metric]
+    rows = model.objects.filter(date__range=(start, end))
+    if model in SUMMED_PER_DAY:
+        rows = rows.values('date').annotate(value=Sum(field)).values_list('date', 'value')
+    else:
+        rows = rows.values_list('date', field)
+    timestamps, values = [], []
+    for date, value in rows.order_by('date'):
+        timestamps.append(int(datetime.combine(date, time.min, tzinfo=dt_timezone.utc).timestamp()))
+        values.append(float(value or 0))
+    return timestamps, values
+
+
+def lttb(timestamps, values, threshold):
+    """
+    Downsample a series to threshold points with Largest-Triangle-Three-Buckets.
+
+    The first and last points are always kept. The points between them are split into threshold - 2
+    buckets, and from each bucket the point forming the largest triangle with the point kept from the
+    previous bucket and the average of the next bucket is kept.
+
+    Args:
+        timestamps, values (list): The series, ordered by timestamp.
+        threshold (int): Number of points to keep; series no longer than this are returned unchanged.
+
+    Returns:
+        tuple: (timestamps, values) of the kept points.
+    """
+    length = len(timestamps)
+    if threshold >= length or threshold < 3:
+        return timestamps, values
+
+    sampled_t, sampled_v = [timestamps[0]], [values[0]]
+    every = (length - 2) / (threshold - 2)
+    kept = 0
+    for bucket in range(threshold - 2):
+        # Average of the next bucket (the last point for the final bucket)
+        next_start = int((bucket + 1) * every) + 1
+        next_end = min(int((bucket + 2) * every) + 1, length)
+        if next_start >= next_end:
+            next_start, next_end = length - 1, length
+        count = next_end - next_start
+        avg_t = sum(timestamps[next_start:next_end]) / count
+        avg_v = sum(values[next_start:next_end]) / count
+
+        # Point of this bucket forming the largest triangle with the kept point and that average
+        kept_t, kept_v = timestamps[kept], values[kept]
+        best, best_area = None, -1.0
+        for i in range(int(bucket * every) + 1, int((bucket + 1) * every) + 1):
+            area = abs((kept_t - avg_t) * (values[i] - kept_v) - (kept_t - timestamps[i]) * (avg_v - kept_v))
+            if area > best_area:
+                best, best_area = i, area
+        sampled_t.append(timestamps[best])
+        sampled_v.append(values[best])
+        kept = best
+
+    sampled_t.append(timestamps[-1])
+    sampled_v.append(values[-1])
+    return sampled_t, sampled_v
@@ -1,15 +1,74 @@
 from django.utils import timezone
-from analytics.signals import update_website_traffic
+from analytics.signals import update_website_traffic, get_traffic_redis
+import hashlib
 import logging
+import re
+import threading
+import time
 import urllib.parse
 from django.conf import settings
 
 # Precompute lowercase trusted domains at module load
 LOWER_TRUSTED_DOMAINS = {domain.lower() for domain in settings.TRUSTED_DOMAINS}
 
+# Cookie carrying the visitor id, so a visitor keeps one id for the whole visit whether or not they
+# have a session; its value is the fingerprint id of their first tracked request
+VISITOR_COOKIE = 'visitor_id'
+VISITOR_ID = re.compile(r'^anon-[0-9a-f]{32}$')
+
+# Crawlers, monitors and scripted clients are not tracked
+BOT_USER_AGENT = re.compile(r'bot|crawl|spider|slurp|facebookexternalhit|preview|monitor|headless|curl|wget|python-requests', re.IGNORECASE)
+
 # Configure logger for traffic middleware
 logger = logging.getLogger(__name__)
 
+
+class TrackingCircuitBreaker:
+    """
+    Stops traffic tracking for a while when Redis is failing or slow.
+
+    Each tracking round trip that raises or takes longer than the latency budget counts as a
+    failure; after failure_threshold of them in a row the breaker opens and tracking is skipped
+    for cooldown seconds, after which the next request tries again. Opening is logged once,
+    instead of one error per request while Redis is struggling. State is per process.
+    """
+
+    def __init__(self, latency_budget, failure_threshold, cooldown):
+        self.latency_budget = latency_budget
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.open_until = 0.0
+        self.lock = threading.Lock()
+
+    def allow(self):
+        return time.monotonic() >= self.open_until
+
+    def record_success(self, elapsed):
+        if elapsed > self.latency_budget:
+            self.record_failure(f"took {elapsed * 1000:.0f} ms")
+        elif self.failures:
+            with self.lock:
+                self.failures = 0
+
+    def record_failure(self, reason):
+        with self.lock:
+            self.failures += 1
+            if self.failures < self.failure_threshold:
+                logger.debug(f"Website traffic tracking failed ({reason})")
+                return
+            self.failures = 0
+            self.open_until = time.monotonic() + self.cooldown
+        logger.warning(f"Website traffic tracking paused for {self.cooldown}s after {self.failure_threshold} slow or failed Redis round trips (last: {reason})")
+
+
+tracking_breaker = TrackingCircuitBreaker(
+    latency_budget=settings.TRAFFIC_TRACKING_LATENCY_BUDGET,
+    failure_threshold=settings.TRAFFIC_TRACKING_FAILURE_THRESHOLD,
+    cooldown=settings.TRAFFIC_TRACKING_COOLDOWN,
+)
+
+
 class WebsiteTrafficMiddleware:
     STATIC_EXTENSIONS = {'.css', '.js', '.png', '.jpg', '.jpeg', '.gif', '.svg', '.ico', '.woff', '.woff2', '.ttf', '.eot', '.otf'}
 
@@ -22,43 +81,81 @@ class WebsiteTrafficMiddleware:
         path = request.path_info.lower()
         is_static = path.startswith('/static/') or any(path.endswith(ext) for ext in self.STATIC_EXTENSIONS)
         
-        if not is_static:
-            # Use session key as a unique identifier for tracking visitors (more accurate than IP)
-            # Access session to ensure it exists; this will create one if needed
-            if not request.session.session_key:
-                request.session.create()
-            visitor_id = request.session.session_key or 'unknown'
+        # The Redis commands are only queued on a pipeline here and sent in one round trip once the
+        # response has been produced
+        pipe = visitor_id = None
+        if not is_static and tracking_breaker.allow():
             try:
-                # Track session start time if not already set
-                if 'session_start' not in request.session:
-                    request.session['session_start'] = timezone.now().isoformat()
-                    request.session.modified = True
-                
-                # Track referral source for new visitors with validation
-                if 'referral_source' not in request.session:
-                    referral_source = request.META.get('HTTP_REFERER', '')
-                    if referral_source:
-                        try:
-                            # Validate URL format
-                            parsed = urllib.parse.urlparse(referral_source)
-                            if parsed.scheme and parsed.netloc:
-                                # Check for trusted domains using precomputed set
-                                if parsed.netloc.lower() in LOWER_TRUSTED_DOMAINS:
-                                    request.session['referral_source'] = referral_source[:255]  # Limit length to match model field
-                                else:
-                                    request.session['referral_source'] = f"untrusted:{referral_source[:247]}"  # Mark as untrusted, limit length
-                            else:
-                                request.session['referral_source'] = "untrusted:invalid_format"
-                            request.session.modified = True
-                        except Exception as e:
-                            logger.error(f"Error validating referral source: {str(e)}")
-                            request.session['referral_source'] = "untrusted:validation_error"
-                            request.session.modified = True
-                
-                update_website_traffic(visitor_id=visitor_id, request=request)
+                pipe, visitor_id = self.queue_tracking(request)
             except Exception as e:
-                logger.error(f"Error updating website traffic: {str(e)}", exc_info=True)
+                tracking_breaker.record_failure(str(e))
         
         # Continue processing the request
         response = self.get_response(request)
+        
+        if visitor_id and request.COOKIES.get(VISITOR_COOKIE) != visitor_id:
+            response.set_cookie(
+                VISITOR_COOKIE, visitor_id, max_age=settings.SESSION_COOKIE_AGE,
+                secure=settings.SESSION_COOKIE_SECURE, httponly=True, samesite='Lax'
+            )
+        if pipe is not None:
+            started = time.monotonic()
+            try:
+                pipe.execute()
+            except Exception as e:
+                tracking_breaker.record_failure(str(e))
+            else:
+                tracking_breaker.record_success(time.monotonic() - started)
         return response
+
+    def queue_tracking(self, request):
+        """
+        Queue this request's tracking commands without creating, reading or writing a session.
+
+        Returns:
+            tuple: The Redis pipeline holding the commands and the visitor id, or (None, None) for bots,
+            which are not tracked.
+        """
+        user_agent = request.META.get('HTTP_USER_AGENT', '')
+        if not user_agent or BOT_USER_AGENT.search(user_agent):
+            return None, None
+        
+        visitor_id = self.visitor_id(request, user_agent)
+        pipe = get_traffic_redis().pipeline(transaction=False)
+        update_website_traffic(visitor_id=visitor_id, request=request, pipe=pipe, referral_source=self.referral_source(request))
+        return pipe, visitor_id
+
+    def visitor_id(self, request, user_agent):
+        """
+        The id the visitor is tracked under: the one in their visitor cookie, or for a first request
+        (and clients that keep no cookies) a daily fingerprint of their address and browser. It does
+        not change when a session is created partway through the visit, e.g. on login.
+        """
+        visitor_id = request.COOKIES.get(VISITOR_COOKIE, '')
+        if VISITOR_ID.match(visitor_id):
+            return visitor_id
+        fingerprint = f"{request.META.get('REMOTE_ADDR', '')}|{user_agent}|{timezone.now().date()}"
+        return f"anon-{hashlib.blake2b(fingerprint.encode('utf-8'), digest_size=16).hexdigest()}"
+
+    def referral_source(self, request):
+        """
+        The referral source to count for this request: the validated Referer of a request arriving from
+        another site, or None for requests without one and for navigation within this site.
+        """
+        referral_source = request.META.get('HTTP_REFERER', '')
+        if not referral_source:
+            return None
+        try:
+            # Validate URL format
+            parsed = urllib.parse.urlparse(referral_source)
+            if not (parsed.scheme and parsed.netloc):
+                return "untrusted:invalid_format"
+            if parsed.netloc.lower() == request.get_host().lower():
+                return None
+            # Check for trusted domains using precomputed set
+            if parsed.netloc.lower() in LOWER_TRUSTED_DOMAINS:
+                return referral_source[:255]  # Limit length to match model field
+            return f"untrusted:{referral_source[:247]}"  # Mark as untrusted, limit length
+        except Exception as e:
+            logger.error(f"Error validating referral source: {str(e)}")
+            return "untrusted:validation_error"
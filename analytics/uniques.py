@@ -0,0 +1,80 @@
+"""
+Unique visitor counting with Redis HyperLogLogs.
+
+Each visitor id is PFADDed to one HyperLogLog for the day and one for the hour. A
+HyperLogLog takes about 12 KB however many visitors it has seen, with a standard error
+of 0.81%. Uniques over any span of days or hours are counted by passing several keys
+to PFCOUNT, or stored for later with PFMERGE. Both count the union, so a visitor who
+comes back on several days is counted once.
+"""
+from datetime import timedelta
+from django.conf import settings
+from django_redis import get_redis_connection
+
+DAILY_KEY = "website_traffic_uniques_hll_{date}"
+HOURLY_KEY = "website_traffic_uniques_hll_{date}_{hour:02d}"
+
+
+def daily_key(date):
+    return DAILY_KEY.format(date=date)
+
+
+def hourly_key(date, hour):
+    return HOURLY_KEY.format(date=date, hour=hour)
+
+
+def record_visitor(pipe, visitor_id, now):
+    """
+    Queue the commands that count visitor_id towards today's and this hour's uniques on a Redis pipeline.
+    """
+    day, hour = daily_key(now.date()), hourly_key(now.date(), now.hour)
+    pipe.pfadd(day, visitor_id)
+    pipe.expire(day, settings.TRAFFIC_UNIQUES_DAILY_TTL)
+    pipe.pfadd(hour, visitor_id)
+    pipe.expire(hour, settings.TRAFFIC_UNIQUES_HOURLY_TTL)
+
+
+def dates_between(start_date, end_date):
+    return [start_date + timedelta(days=offset) for offset in range((end_date - start_date).days + 1)]
+
+
+def count_unique_visitors(start_date, end_date=None, redis_conn=None):
+    """
+    Count distinct visitors between two dates inclusive, e.g. the last 7 or 30 days.
+    Days whose HyperLogLog has expired count as empty.
+    """
+    redis_conn = redis_conn or get_redis_connection("default")
+    keys = [daily_key(date) for date in dates_between(start_date, end_date or start_date)]
+    return redis_conn.pfcount(*keys)
+
+
+def count_hourly_unique_visitors(date, redis_conn=None):
+    """
+    Distinct visitors for each hour of a day.
+
+    Returns:
+        list: 24 counts, index 0 being midnight to 1am.
+    """
+    redis_conn = redis_conn or get_redis_connection("default")
+    pipe = redis_conn.pipeline(transaction=False)
+    for hour in range(24):
+        pipe.pfcount(hourly_key(date, hour))
+    return pipe.execute()
+
+
+def merge_unique_visitors(dest_key, start_date, end_date, ttl=None, redis_conn=None):
+    """
+    Store the union of the daily HyperLogLogs between two dates under dest_key, e.g. to keep
+    a week's or month's uniques after the daily keys expire.
+
+    Returns:
+        int: The distinct visitor count of the merged key.
+    """
+    redis_conn = redis_conn or get_redis_connection("default")
+    keys = [daily_key(date) for date in dates_between(start_date, end_date)]
+    pipe = redis_conn.pipeline()
+    pipe.pfmerge(dest_key, *keys)
+    if ttl:
+        pipe.expire(dest_key, ttl)
+    pipe.pfcount(dest_key)
+    return pipe.execute()[-1]
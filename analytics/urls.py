@@ -10,4 +10,5 @@ urlpatterns = [
     path('product-performance/', views.product_performance, name='product_performance'),
     path('marketing-analysis/', views.marketing_analysis, name='marketing_analysis'),
     path('website-traffic/', views.website_traffic, name='website_traffic'),
+    path('api/timeseries/<str:metric>/', views.timeseries, name='timeseries'),
 ]
@@ -1,16 +1,31 @@
 from django.shortcuts import render
 from django.contrib.auth.decorators import login_required, user_passes_test
-from django.db.models import Sum, Avg
+from django.db.models import F, Max, Sum
 from django.utils import timezone
 from datetime import timedelta
 from analytics.models import SalesAnalytics, CustomerAnalytics, ProductAnalytics, MarketingAnalytics, WebsiteTraffic
+from analytics.models import SalesRollup, ProductRollup, MarketingRollup, TrafficRollup
+from analytics.rollups import window_totals, period_start
+from analytics.counters import pending_totals, last_changed
+from analytics.uniques import count_unique_visitors
+from analytics.timeseries import SERIES, load_series, lttb
 from products.models import Product, ProductView
 from orders.models import Order, OrderItem
-from django.db.models.functions import TruncMonth
 from django.core.cache import cache
+from django.core.paginator import Paginator
 from functools import wraps
 from typing import Optional, Callable, Any
-from django.http import HttpRequest, HttpResponse
+from django.http import HttpRequest, HttpResponse, JsonResponse, Http404
+from django.template.loader import render_to_string
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from django.utils.dateparse import parse_date
+from datetime import datetime, timezone as dt_timezone
+import hashlib
+import logging
+import time
+
+logger = logging.getLogger(__name__)
 
 def generate_cache_key(base_key: str, request: HttpRequest = None, key_func: Optional[Callable] = None, *args, **kwargs) -> str:
     """
@@ -31,129 +46,249 @@ def generate_cache_key(base_key: str, request: HttpRequest = None, key_func: Opt
     return base_key
 
 
-def cache_view(base_key: str, timeout: int = 300, key_func: Optional[Callable] = None) -> Callable:
+# How long (seconds) a report's data version (latest updated_at of its tables) is reused before it is queried again
+LAST_MODIFIED_TTL = 15
+# How long (seconds) a rebuild may hold a report's lock, and how long other requests wait for it when there is no stale copy
+REBUILD_LOCK_TIMEOUT = 30
+REBUILD_WAIT = 5.0
+# Range of a time series request that names none, the most points one may ask for, and how long (seconds) a series is cached
+TIMESERIES_DEFAULT_DAYS = 90
+TIMESERIES_MAX_POINTS = 2000
+TIMESERIES_CACHE_TIMEOUT = 300
+
+
+def get_last_modified(base_key: str, models: tuple, changed: Optional[Callable] = None) -> datetime:
     """
-    A decorator that caches the data context of a view function for a specified duration.
-    The HttpResponse is rendered fresh on each request using the cached context to avoid serving stale or user-specific content.
-    
+    Latest updated_at across the analytics tables a report reads (and the time changed() returns, if
+    given), cached for LAST_MODIFIED_TTL seconds so that conditional requests cost at most one small
+    query per table every few seconds.
+    """
+    cache_key = f"{base_key}:last_modified"
+    last_modified = cache.get(cache_key)
+    if last_modified is None:
+        stamps = [model.objects.aggregate(latest=Max('updated_at'))['latest'] for model in models]
+        if changed:
+            stamps.append(changed())
+        last_modified = max([stamp for stamp in stamps if stamp], default=datetime(1970, 1, 1, tzinfo=dt_timezone.utc))
+        cache.set(cache_key, last_modified, LAST_MODIFIED_TTL)
+    return last_modified
+
+
+def cache_view(base_key: str, timeout: int = 300, key_func: Optional[Callable] = None, models: tuple = (),
+               template_name: str = 'analytics/dashboard.html', changed: Optional[Callable] = None) -> Callable:
+    """
+    A decorator that caches the rendered response of a report view, shared by every staff member.
+
+    The cache key is the report's base key plus key_func's result (for reports that take parameters),
+    not the user. The response carries an ETag and Last-Modified derived from the latest updated_at of
+    the report's tables, so a browser revalidating an unchanged report gets a 304 without anything
+    being rendered. When the cached body is stale, one request rebuilds it under a lock while the
+    others keep serving the stale copy (or wait briefly for the rebuild if there is none).
+
+    The cached page is the same for everyone, so the navigation bar's per-user cart count is left out.
+
     Args:
-        base_key (str): The base key used for caching the view data.
-        timeout (int, optional): The duration in seconds for which the cache persists. Defaults to 300.
+        base_key (str): The base key used for caching the report.
+        timeout (int, optional): The longest a cached body is served, in seconds, even if its tables have not changed. Defaults to 300.
         key_func (Callable, optional): A function to generate a dynamic part of the cache key based on request or arguments. Defaults to None.
-    
+        models (tuple, optional): The analytics models the report reads; their updated_at versions the cached body.
+        template_name (str, optional): The template the view's context is rendered with. Defaults to 'analytics/dashboard.html'.
+        changed (Callable, optional): Returns when data the report reads outside models last changed, e.g. counters.last_changed
+            for reports adding pending counter shards. Defaults to None.
+
     Returns:
-        Callable: The wrapped view function with caching applied to the data context.
+        Callable: The wrapped view function with caching applied to the rendered response.
     """
     def decorator(view_func: Callable) -> Callable:
         @wraps(view_func)
         def wrapper(request: HttpRequest, *args: Any, **kwargs: Any) -> HttpResponse:
             final_cache_key = generate_cache_key(base_key, request, key_func, *args, **kwargs)
-            cached_context = cache.get(final_cache_key)
-            if cached_context is None:
-                # Call the view function to get the context dictionary
-                result = view_func(request, *args, **kwargs)
-                if isinstance(result, dict):
-                    cached_context = result
-                    cache.set(final_cache_key, cached_context, timeout)
-                else:
-                    # If the view doesn't return a dict, return the response directly without caching
-                    return result
-            # Render a fresh response using the cached context
-            template_name = getattr(view_func, '__template_name__', 'analytics/dashboard.html')
-            return render(request, template_name, cached_context)
+            last_modified = get_last_modified(base_key, models, changed)
+            # The reports cover windows ending today, so the day is part of the version too
+            version = f"{final_cache_key}:{last_modified.isoformat()}:{timezone.now().date()}"
+            etag = f'"{hashlib.md5(version.encode("utf-8")).hexdigest()}"'
+
+            not_modified = get_conditional_response(request, etag=etag, last_modified=int(last_modified.timestamp()))
+            if not_modified is not None:
+                return _with_validators(not_modified, etag, last_modified)
+
+            entry = cache.get(final_cache_key)
+            if not _is_fresh(entry, etag):
+                lock_key = f"{final_cache_key}:lock"
+                if cache.add(lock_key, 1, REBUILD_LOCK_TIMEOUT):
+                    try:
+                        body = _render_report(view_func, template_name, request, *args, **kwargs)
+                        if isinstance(body, HttpResponse):
+                            # If the view doesn't return a dict, return the response directly without caching
+                            return body
+                        entry = {'etag': etag, 'last_modified': last_modified, 'body': body, 'expires': time.time() + timeout}
+                        # Kept past its expiry so that it can be served while the next rebuild runs
+                        cache.set(final_cache_key, entry, timeout * 2)
+                    finally:
+                        cache.delete(lock_key)
+                elif entry is None:
+                    entry = _wait_for_rebuild(final_cache_key)
+                    if entry is None:
+                        logger.warning(f"Timed out waiting for {final_cache_key} to be rebuilt; rendering it directly")
+                        body = _render_report(view_func, template_name, request, *args, **kwargs)
+                        if isinstance(body, HttpResponse):
+                            return body
+                        entry = {'etag': etag, 'last_modified': last_modified, 'body': body}
+
+            return _with_validators(HttpResponse(entry['body']), entry['etag'], entry['last_modified'])
         return wrapper
     return decorator
 
 
+def _render_report(view_func, template_name, request, *args, **kwargs):
+    # The rendered body, or the view's own response when it does not return a context dict
+    result = view_func(request, *args, **kwargs)
+    if not isinstance(result, dict):
+        return result
+    return render_to_string(template_name, {**result, 'cart_item_count': None}, request=request)
+
+
+def _is_fresh(entry, etag):
+    return entry is not None and entry['etag'] == etag and entry['expires'] > time.time()
+
+
+def _wait_for_rebuild(cache_key):
+    deadline = time.monotonic() + REBUILD_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(0.1)
+        entry = cache.get(cache_key)
+        if entry is not None:
+            return entry
+    return None
+
+
+def _with_validators(response, etag, last_modified):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified.timestamp())
+    # Staff-only pages: browsers may keep them but must revalidate, and shared caches must not store them
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
 def is_admin(user):
     return user.is_superuser or user.is_staff
 
 @login_required
 @user_passes_test(is_admin)
-@cache_view('analytics_overview_data', timeout=300, key_func=lambda request, *args, **kwargs: f"user_{request.user.id}")
+@cache_view('analytics_overview_data', timeout=300, models=(SalesAnalytics, CustomerAnalytics, ProductAnalytics, ProductRollup),
+            template_name='analytics/dashboard.html', changed=last_changed)
 def dashboard_overview(request):
-    # Sales Summary
-    last_30_days = timezone.now() - timedelta(days=30)
-    sales_data = SalesAnalytics.objects.filter(date__gte=last_30_days).order_by('date')
-    total_revenue_30_days = sales_data.aggregate(total=Sum('total_revenue'))['total'] or 0
-    total_orders_30_days = sales_data.aggregate(total=Sum('total_orders'))['total'] or 0
+    # Sales Summary (the charts load their daily points from the time series API)
+    today = timezone.now().date()
+    last_30_days = today - timedelta(days=30)
+    sales_totals = SalesAnalytics.objects.filter(date__gte=last_30_days).aggregate(
+        total_revenue=Sum('total_revenue'), total_orders=Sum('total_orders'))
+    total_revenue_30_days = sales_totals['total_revenue'] or 0
+    total_orders_30_days = sales_totals['total_orders'] or 0
     
     # Customer Summary
-    customer_data = CustomerAnalytics.objects.filter(date__gte=last_30_days).order_by('date')
-    new_customers_30_days = customer_data.aggregate(total=Sum('new_customers'))['total'] or 0
-    returning_customers_30_days = customer_data.aggregate(total=Sum('returning_customers'))['total'] or 0
+    customer_totals = CustomerAnalytics.objects.filter(date__gte=last_30_days).aggregate(
+        new_customers=Sum('new_customers'), returning_customers=Sum('returning_customers'))
+    new_customers_30_days = customer_totals['new_customers'] or 0
+    returning_customers_30_days = customer_totals['returning_customers'] or 0
+    
+    # Add increments still waiting in counter shards so the totals are not behind by a compaction interval
+    pending = pending_totals(
+        ['sales.total_revenue', 'sales.total_orders', 'customers.new_customers', 'customers.returning_customers'],
+        date_from=last_30_days
+    )
+    total_revenue_30_days += pending['sales.total_revenue']
+    total_orders_30_days += int(pending['sales.total_orders'])
+    new_customers_30_days += int(pending['customers.new_customers'])
+    returning_customers_30_days += int(pending['customers.returning_customers'])
     
-    # Product Summary
-    top_products = ProductAnalytics.objects.filter(date__gte=last_30_days)\
-            .values('product__name')\
-            .annotate(total_purchases=Sum('purchase_count'))\
-            .order_by('-total_purchases')[:5]
+    # Product Summary from the weekly rollups plus the days at either end of the window
+    top_products = sorted(
+        [
+            {'product__name': row['product__name'], 'total_purchases': row['purchase_count']}
+            for row in window_totals(ProductRollup, ProductAnalytics, last_30_days, today, ('product__name',), ('purchase_count',))
+        ],
+        key=lambda row: -row['total_purchases']
+    )[:5]
     
     context = {
         'total_revenue_30_days': total_revenue_30_days,
         'total_orders_30_days': total_orders_30_days,
         'new_customers_30_days': new_customers_30_days,
         'returning_customers_30_days': returning_customers_30_days,
-        'top_products': list(top_products),
-        'sales_data': list(sales_data.values('date', 'total_revenue', 'total_orders')),
-        'customer_data': list(customer_data.values('date', 'new_customers', 'returning_customers')),
+        'top_products': top_products,
+        'chart_start': last_30_days,
     }
     return context
-dashboard_overview.__template_name__ = 'analytics/dashboard.html'
+
+# Rows of the sales report's daily table per page
+SALES_REPORT_DAYS_PER_PAGE = 31
+
+def _page_number(request):
+    # Anything but a plain page number is page 1, so junk query strings do not each get a cache entry
+    page = request.GET.get('page', '')
+    return int(page) if page.isdigit() and 0 < int(page) < 1000 else 1
 
 @login_required
 @user_passes_test(is_admin)
-@cache_view('analytics_sales_report_data', timeout=300, key_func=lambda request, *args, **kwargs: f"user_{request.user.id}")
+@cache_view('analytics_sales_report_data', timeout=300, key_func=_page_number, models=(SalesAnalytics, SalesRollup),
+            template_name='analytics/sales_report.html')
 def sales_report(request):
     last_365_days = timezone.now() - timedelta(days=365)
-    sales_data_daily = SalesAnalytics.objects.filter(date__gte=last_365_days).order_by('date')
-    sales_data_monthly = SalesAnalytics.objects.filter(date__gte=last_365_days)\
-            .annotate(month=TruncMonth('date'))\
-            .values('month')\
-            .annotate(total=Sum('total_revenue'), count=Sum('total_orders'))\
-            .order_by('-month')[:12]
+    # The daily table is paginated, newest day first; the charts load their series from the timeseries API
+    sales_data_daily = SalesAnalytics.objects.filter(date__gte=last_365_days).order_by('-date')\
+            .values('date', 'total_revenue', 'total_orders', 'average_order_value', 'discount_usage_count')
+    # Twelve precomputed monthly rows instead of grouping a year of daily rows
+    sales_data_monthly = SalesRollup.objects.filter(period='month', period_start__gte=period_start('month', last_365_days.date()))\
+            .order_by('-period_start')\
+            .values(month=F('period_start'), total=F('total_revenue'), count=F('total_orders'))[:12]
     
     context = {
-        'sales_data_daily': list(sales_data_daily.values('date', 'total_revenue', 'total_orders', 'average_order_value', 'discount_usage_count')),
+        'sales_data_daily': Paginator(sales_data_daily, SALES_REPORT_DAYS_PER_PAGE).get_page(_page_number(request)),
         'sales_data_monthly': list(sales_data_monthly),
+        'chart_start': last_365_days.date(),
     }
     return context
-sales_report.__template_name__ = 'analytics/sales_report.html'
 
 @login_required
 @user_passes_test(is_admin)
 def customer_insights(request):
     last_365_days = timezone.now() - timedelta(days=365)
-    customer_data = CustomerAnalytics.objects.filter(date__gte=last_365_days).order_by('date')
+    customer_data = list(CustomerAnalytics.objects.filter(date__gte=last_365_days).order_by('date')
+                         .values('date', 'new_customers', 'returning_customers', 'retention_rate', 'total_customers'))
     
-    # Calculate aggregates for summary
-    total_new_customers = customer_data.aggregate(total=Sum('new_customers'))['total'] or 0
-    total_returning_customers = customer_data.aggregate(total=Sum('returning_customers'))['total'] or 0
-    avg_retention_rate = customer_data.aggregate(avg=Avg('retention_rate'))['avg'] or 0
+    # Calculate aggregates for summary from the rows already loaded for the charts
+    total_new_customers = sum(day['new_customers'] for day in customer_data)
+    total_returning_customers = sum(day['returning_customers'] for day in customer_data)
+    avg_retention_rate = sum(day['retention_rate'] for day in customer_data) / len(customer_data) if customer_data else 0
     
     context = {
-        'customer_data': list(customer_data.values('date', 'new_customers', 'returning_customers', 'retention_rate', 'total_customers')),
+        'customer_data': customer_data,
         'total_new_customers': total_new_customers,
         'total_returning_customers': total_returning_customers,
         'avg_retention_rate': avg_retention_rate,
+        'chart_start': last_365_days.date(),
     }
     return render(request, 'analytics/customer_insights.html', context)
 
 @login_required
 @user_passes_test(is_admin)
 def product_performance(request):
-    last_30_days = timezone.now() - timedelta(days=30)
-    product_data = ProductAnalytics.objects.filter(date__gte=last_30_days)\
-            .values('product__name', 'product__id')\
-            .annotate(total_views=Sum('views'), total_add_to_cart=Sum('add_to_cart_count'), total_purchases=Sum('purchase_count'))\
-            .order_by('-total_purchases')
+    today = timezone.now().date()
+    rows = window_totals(ProductRollup, ProductAnalytics, today - timedelta(days=30), today,
+                         ('product__name', 'product__id'), ('views', 'add_to_cart_count', 'purchase_count'))
+    product_data = sorted([
+        {'product__name': row['product__name'], 'product__id': row['product__id'], 'total_views': row['views'],
+         'total_add_to_cart': row['add_to_cart_count'], 'total_purchases': row['purchase_count']}
+        for row in rows
+    ], key=lambda row: -row['total_purchases'])
     
     # Inventory overview
     low_stock_products = Product.objects.filter(stock__lt=10).order_by('stock')
     out_of_stock_products = Product.objects.filter(stock=0).count()
     
     context = {
-        'product_data': list(product_data),
+        'product_data': product_data,
         'low_stock_products': list(low_stock_products),
         'out_of_stock_products': out_of_stock_products,
     }
@@ -161,22 +296,28 @@ def product_performance(request):
 
 @login_required
 @user_passes_test(is_admin)
-@cache_view('analytics_marketing_data', timeout=1800, key_func=lambda request, *args, **kwargs: f"user_{request.user.id}")
+@cache_view('analytics_marketing_data', timeout=1800, models=(MarketingAnalytics, MarketingRollup),
+            template_name='analytics/marketing_analysis.html')
 def marketing_analysis(request):
     """
     View to display marketing analysis data with caching to optimize database access.
-    The cache timeout is set to 1800 seconds (30 minutes) to reduce frequent database queries.
-    Two queries are used: one for detailed time series data and another for aggregated summaries.
-    Combining them isn't feasible due to their distinct purposes.
+    The rendered page is cached for up to 1800 seconds (30 minutes), or until the marketing tables change.
+    Two queries are used: one for detailed time series data and another for aggregated summaries,
+    which reads whole weeks from the weekly rollups and only the days at either end of the window
+    from the daily rows.
     """
-    last_90_days = timezone.now() - timedelta(days=90)
+    today = timezone.now().date()
+    last_90_days = today - timedelta(days=90)
     marketing_data = MarketingAnalytics.objects.filter(date__gte=last_90_days).order_by('date')
     
     # Combined summary for campaigns and discount codes to reduce database queries
-    marketing_summary = MarketingAnalytics.objects.filter(date__gte=last_90_days)\
-            .values('campaign__name', 'discount_code')\
-            .annotate(total_impressions=Sum('impressions'), total_clicks=Sum('clicks'), total_conversions=Sum('conversions'), total_revenue=Sum('revenue_generated'))\
-            .order_by('-total_revenue')
+    marketing_summary = sorted([
+        {'campaign__name': row['campaign__name'], 'discount_code': row['discount_code'],
+         'total_impressions': row['impressions'], 'total_clicks': row['clicks'],
+         'total_conversions': row['conversions'], 'total_revenue': row['revenue_generated']}
+        for row in window_totals(MarketingRollup, MarketingAnalytics, last_90_days, today,
+                                 ('campaign__name', 'discount_code'), ('impressions', 'clicks', 'conversions', 'revenue_generated'))
+    ], key=lambda row: -row['total_revenue'])
     
     # Split the combined results into separate summaries for campaigns and discount codes
     campaign_summary = [
@@ -192,7 +333,6 @@ def marketing_analysis(request):
         'discount_summary': list(discount_summary),
     }
     return context
-marketing_analysis.__template_name__ = 'analytics/marketing_analysis.html'
 
 @login_required
 @user_passes_test(is_admin)
@@ -200,7 +340,76 @@ def website_traffic(request):
     last_90_days = timezone.now() - timedelta(days=90)
     traffic_data = WebsiteTraffic.objects.filter(date__gte=last_90_days).order_by('date')
     
+    # Distinct visitors over whole weeks/months (not the sum of daily uniques) from the HyperLogLogs
+    today = timezone.now().date()
+    try:
+        unique_visitors_7_days = count_unique_visitors(today - timedelta(days=6), today)
+        unique_visitors_30_days = count_unique_visitors(today - timedelta(days=29), today)
+    except Exception as e:
+        logger.warning(f"Could not count unique visitors: {str(e)}")
+        unique_visitors_7_days = unique_visitors_30_days = None
+    
+    # Month-by-month totals for the last quarter, precomputed
+    traffic_monthly = TrafficRollup.objects.filter(period='month', period_start__gte=period_start('month', today - timedelta(days=90)))\
+            .order_by('-period_start')\
+            .values('period_start', 'total_visits', 'unique_visitors', 'bounce_rate', 'average_session_duration')
+    
     context = {
+        'traffic_monthly': list(traffic_monthly),
         'traffic_data': list(traffic_data.values('date', 'total_visits', 'unique_visitors', 'bounce_rate', 'average_session_duration', 'top_referral_source')),
+        'unique_visitors_7_days': unique_visitors_7_days,
+        'unique_visitors_30_days': unique_visitors_30_days,
+        'chart_start': last_90_days.date(),
     }
     return render(request, 'analytics/website_traffic.html', context)
+
+@login_required
+@user_passes_test(is_admin)
+def timeseries(request, metric):
+    """
+    JSON time series of one daily metric (a key of analytics.timeseries.SERIES) for the dashboard charts.
+
+    Query parameters:
+        start, end: ISO dates bounding the range, inclusive (default: the last TIMESERIES_DEFAULT_DAYS days).
+        points: Downsample the series to at most this many points with LTTB (default: every day).
+
+    The response holds columnar arrays, {"timestamps": [...], "values": [...]}, with timestamps in Unix
+    seconds, and carries the same ETag/Last-Modified validators as the report pages.
+    """
+    if metric not in SERIES:
+        raise Http404(f"Unknown metric {metric}")
+    today = timezone.now().date()
+    try:
+        end = parse_date(request.GET['end']) if request.GET.get('end') else today
+        start = parse_date(request.GET['start']) if request.GET.get('start') else end - timedelta(days=TIMESERIES_DEFAULT_DAYS - 1)
+        points = int(request.GET.get('points', TIMESERIES_MAX_POINTS))
+    except (TypeError, ValueError):
+        start = end = points = None
+    if start is None or end is None or start > end or points is None or points < 3:
+        return JsonResponse({'error': 'Expected start <= end as YYYY-MM-DD and points >= 3.'}, status=400)
+    points = min(points, TIMESERIES_MAX_POINTS)
+
+    model = SERIES[metric][0]
+    last_modified = get_last_modified(f"analytics_timeseries_{model._meta.model_name}", (model,))
+    cache_key = f"analytics_timeseries:{metric}:{start}:{end}:{points}"
+    version = f"{cache_key}:{last_modified.isoformat()}"
+    etag = f'"{hashlib.md5(version.encode("utf-8")).hexdigest()}"'
+
+    not_modified = get_conditional_response(request, etag=etag, last_modified=int(last_modified.timestamp()))
+    if not_modified is not None:
+        return _with_validators(not_modified, etag, last_modified)
+
+    entry = cache.get(cache_key)
+    if entry is None or entry['etag'] != etag:
+        timestamps, values = load_series(metric, start, end)
+        sampled_timestamps, sampled_values = lttb(timestamps, values, points)
+        entry = {'etag': etag, 'data': {
+            'metric': metric,
+            'start': start.isoformat(),
+            'end': end.isoformat(),
+            'total_points': len(timestamps),
+            'timestamps': sampled_timestamps,
+            'values': [round(value, 2) for value in sampled_values],
+        }}
+        cache.set(cache_key, entry, TIMESERIES_CACHE_TIMEOUT)
+    return _with_validators(JsonResponse(entry['data']), etag, last_modified)
@@ -0,0 +1,127 @@
+"""
+Visit tracking in Redis, for bounce counting and visit durations without touching the session table.
+
+Each request moves its visitor's score in the ACTIVITY_KEY sorted set to the current time and
+updates a small hash for the visit in progress (start, last seen, page views). A visit ends once
+its visitor has been inactive for TRAFFIC_VISIT_INACTIVITY_TIMEOUT seconds; jobs find those with
+ZRANGEBYSCORE over the sorted set instead of decoding every session. A visitor's score is also their
+last activity time while their visit is in progress.
+
+Ended visits are folded into a per-day hash of duration statistics (sum, count and a histogram),
+which flush_traffic_cache reads into WebsiteTraffic. Days that received bounces or durations are
+added to CLOSED_DATES_KEY so the flush revisits them even when their visit counter is already flushed.
+"""
+from django.conf import settings
+
+ACTIVITY_KEY = "website_traffic_activity"
+VISIT_KEY = "website_traffic_visit_{visitor_id}"
+DURATIONS_KEY = "website_traffic_durations_{date}"
+CLOSED_DATES_KEY = "website_traffic_closed_visit_dates"
+
+# Upper bounds (seconds) of the visit duration histogram buckets; longer visits go in the '+inf' bucket
+DURATION_BUCKETS = (10, 30, 60, 180, 600, 1800, 3600)
+
+# Atomically take up to ARGV[2] visits whose last activity is at or before ARGV[1]: each is removed
+# from the sorted set and its hash deleted, so a visitor who comes back starts a new visit and no visit
+# is claimed twice when several jobs run. Returns a flat list of visitor id, start, last seen, pages.
+CLAIM_INACTIVE = """
+local members = redis.call('zrangebyscore', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, tonumber(ARGV[2]))
+local claimed = {}
+for _, visitor_id in ipairs(members) do
+    redis.call('zrem', KEYS[1], visitor_id)
+    local key = ARGV[3] .. visitor_id
+    local visit = redis.call('hmget', key, 'start', 'last', 'pages')
+    redis.call('del', key)
+    if visit[1] then
+        table.insert(claimed, visitor_id)
+        table.insert(claimed, visit[1])
+        table.insert(claimed, visit[2] or visit[1])
+        table.insert(claimed, visit[3] or '1')
+    end
+end
+return claimed
+"""
+
+
+def visit_key(visitor_id):
+    return VISIT_KEY.format(visitor_id=visitor_id)
+
+
+def record_activity(pipe, visitor_id, now):
+    """
+    Queue the commands that record a page view of visitor_id's current visit on a Redis pipeline.
+    """
+    timestamp = now.timestamp()
+    key = visit_key(visitor_id)
+    pipe.zadd(ACTIVITY_KEY, {visitor_id: timestamp})
+    pipe.hsetnx(key, 'start', timestamp)
+    pipe.hset(key, 'last', timestamp)
+    pipe.hincrby(key, 'pages', 1)
+    # Outlives the inactivity window; visits no job claimed in time are simply dropped
+    pipe.expire(key, settings.TRAFFIC_VISIT_INACTIVITY_TIMEOUT * 4)
+
+
+def claim_inactive_visits(redis_conn, cutoff, batch_size):
+    """
+    Take up to batch_size visits whose visitor has not been seen since cutoff.
+
+    Args:
+        redis_conn: A Redis connection.
+        cutoff (datetime): Visits last active at or before this time have ended.
+        batch_size (int): Most visits to claim.
+
+    Returns:
+        list: (visitor_id, start timestamp, last seen timestamp, page views) tuples.
+    """
+    flat = redis_conn.eval(CLAIM_INACTIVE, 1, ACTIVITY_KEY, cutoff.timestamp(), batch_size, VISIT_KEY.format(visitor_id=''))
+    return [
+        (flat[i].decode('utf-8'), float(flat[i + 1]), float(flat[i + 2]), int(flat[i + 3]))
+        for i in range(0, len(flat), 4)
+    ]
+
+
+def durations_key(date):
+    return DURATIONS_KEY.format(date=date)
+
+
+def duration_bucket(seconds):
+    for bound in DURATION_BUCKETS:
+        if seconds <= bound:
+            return str(bound)
+    return '+inf'
+
+
+def record_durations(pipe, date, durations, ttl):
+    """
+    Queue the commands that add ended visits to a day's duration statistics on a Redis pipeline.
+
+    Args:
+        pipe: A Redis pipeline.
+        date: The day the visits started.
+        durations (list): Visit durations in seconds.
+        ttl (int): Lifetime of the day's statistics in seconds.
+    """
+    key = durations_key(date)
+    buckets = {}
+    for seconds in durations:
+        bucket = duration_bucket(seconds)
+        buckets[bucket] = buckets.get(bucket, 0) + 1
+    pipe.hincrbyfloat(key, 'sum', sum(durations))
+    pipe.hincrby(key, 'count', len(durations))
+    for bucket, count in buckets.items():
+        pipe.hincrby(key, f"le_{bucket}", count)
+    pipe.expire(key, ttl)
+
+
+def parse_durations(fields):
+    """
+    Turn the HGETALL reply of a day's duration statistics into usable values.
+
+    Returns:
+        tuple: (average duration in seconds, ended visit count, histogram dict of bucket upper bound -> visits)
+    """
+    fields = {key.decode('utf-8'): value for key, value in fields.items()}
+    count = int(fields.get('count', 0))
+    average = float(fields.get('sum', 0)) / count if count else 0.0
+    histogram = {bucket: int(fields.get(f"le_{bucket}", 0)) for bucket in [*map(str, DURATION_BUCKETS), '+inf']}
+    return average, count, histogram
@@ -0,0 +1,81 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from django.db import transaction
+from django.contrib.sessions.models import Session
+from cart.models import Cart, CartItem
+from datetime import timedelta
+import time
+
+class Command(BaseCommand):
+    help = 'Deletes abandoned anonymous carts and expired sessions in small, throttled batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30, help='Delete anonymous carts untouched for this many days (default: 30)')
+        parser.add_argument('--batch-size', type=int, default=500, help='Rows deleted per transaction (default: 500)')
+        parser.add_argument('--sleep', type=float, default=0.1, help='Seconds to pause between batches to limit lock pressure (default: 0.1)')
+        parser.add_argument('--skip-sessions', action='store_true', help='Only clean up carts, leave expired sessions alone')
+
+    def handle(self, *args, **options):
+        """
+        Delete anonymous carts whose cart and items have not been touched for --days, then
+        expired django_session rows. Each batch selects at most --batch-size primary keys through
+        an index (cart_anon_updated_at_idx / expire_date) and deletes them in its own short
+        transaction, so the command can run alongside live traffic.
+        """
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        batch_size = options['batch_size']
+        pause = options['sleep']
+
+        # CartItem changes do not bump Cart.updated_at, so carts with recently touched items are kept
+        abandoned_carts = Cart.objects.filter(user__isnull=True, updated_at__lt=cutoff)\
+                .exclude(items__updated_at__gte=cutoff)\
+                .order_by('updated_at')
+        self.stdout.write(f"Deleting anonymous carts not updated since {cutoff:%Y-%m-%d %H:%M}...")
+        carts_deleted, items_deleted, elapsed = self.delete_in_batches(abandoned_carts, 'pk', batch_size, pause, self.delete_carts)
+        self.report('carts', carts_deleted + items_deleted, elapsed, f"{carts_deleted} carts, {items_deleted} cart items")
+
+        if not options['skip_sessions']:
+            expired_sessions = Session.objects.filter(expire_date__lt=timezone.now()).order_by('expire_date')
+            self.stdout.write("Deleting expired sessions...")
+            sessions_deleted, _, elapsed = self.delete_in_batches(expired_sessions, 'session_key', batch_size, pause, self.delete_sessions)
+            self.report('sessions', sessions_deleted, elapsed, f"{sessions_deleted} sessions")
+
+    def delete_in_batches(self, queryset, key_field, batch_size, pause, delete_func):
+        """
+        Repeatedly take the first batch_size keys matching queryset and pass them to delete_func.
+        Deleted rows drop out of the queryset, so no offset or cursor state is needed.
+
+        Returns:
+            tuple: (primary rows deleted, dependent rows deleted, elapsed seconds)
+        """
+        deleted = dependent_deleted = 0
+        started = time.monotonic()
+        while True:
+            keys = list(queryset.values_list(key_field, flat=True)[:batch_size])
+            if not keys:
+                break
+            with transaction.atomic():
+                batch_deleted, batch_dependent = delete_func(keys)
+            deleted += batch_deleted
+            dependent_deleted += batch_dependent
+            if len(keys) < batch_size:
+                break
+            if pause:
+                time.sleep(pause)
+        return deleted, dependent_deleted, time.monotonic() - started
+
+    def delete_carts(self, cart_ids):
+        # Delete items first with a single filtered DELETE so the cart delete has nothing left to cascade
+        items_deleted, _ = CartItem.objects.filter(cart_id__in=cart_ids).delete()
+        carts_deleted, _ = Cart.objects.filter(pk__in=cart_ids).delete()
+        return carts_deleted, items_deleted
+
+    def delete_sessions(self, session_keys):
+        sessions_deleted, _ = Session.objects.filter(session_key__in=session_keys).delete()
+        return sessions_deleted, 0
+
+    def report(self, label, rows, elapsed, detail):
+        rate = rows / elapsed if elapsed > 0 else 0.0
+        self.stdout.write(self.style.SUCCESS(
+            f"Finished {label} cleanup: deleted {detail} in {elapsed:.1f}s ({rate:.0f} rows/sec)."
+        ))
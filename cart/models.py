@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils.functional import cached_property
 from django.contrib.auth.models import User
 from products.models import Product
 
@@ -8,6 +9,12 @@ class Cart(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # Lets cleanup_carts walk abandoned anonymous carts oldest-first without a table scan
+            models.Index(fields=['updated_at'], condition=models.Q(user__isnull=True), name='cart_anon_updated_at_idx'),
+        ]
+
     def __str__(self):
         return f"Cart for {self.user.username if self.user else 'Anonymous'}"
 
@@ -28,8 +35,19 @@ class CartItem(models.Model):
             return f"{self.quantity} x {self.variant} in cart"
         return f"{self.quantity} x {self.product.name} in cart"
 
+    @property
+    def regular_price(self):
+        return self.variant.total_price if self.variant else self.product.price
+
+    @cached_property
+    def unit_price(self):
+        """
+        The price charged per unit: the regular price after the running promotions and sales,
+        the same price the storefront shows (see promotions.engine.effective_price).
+        """
+        from promotions.engine import effective_price
+        return effective_price(self.product, self.variant)
+
     @property
     def total_price(self):
-        if self.variant:
-            return self.variant.total_price * self.quantity
-        return self.product.price * self.quantity
+        return self.unit_price * self.quantity
@@ -57,7 +57,6 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
-    'analytics.last_activity_middleware.LastActivityMiddleware',
     'django.middleware.common.CommonMiddleware',
     'analytics.traffic_middleware.WebsiteTrafficMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -156,9 +155,23 @@ CACHES = {
         'OPTIONS': {
             'CLIENT_CLASS': 'django_redis.client.DefaultClient',
         }
+    },
+    # Separate Redis database for sessions, so clearing or evicting the default cache does not log users out
+    'sessions': {
+        'BACKEND': 'django_redis.cache.RedisCache',
+        'LOCATION': f"redis://{os.getenv('REDIS_HOST', '127.0.0.1')}:{os.getenv('REDIS_PORT', '6379')}/{os.getenv('REDIS_SESSION_DB', '2')}",
+        'OPTIONS': {
+            'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+        }
     }
 }
 
+# Sessions are read from Redis and written through to the database (cached_db), so most requests
+# never query the session table; set SESSION_ENGINE=django.contrib.sessions.backends.cache in
+# production to keep them in Redis only. Run python manage.py compact_sessions after upgrading.
+SESSION_ENGINE = os.getenv('SESSION_ENGINE', 'django.contrib.sessions.backends.cached_db')
+SESSION_CACHE_ALIAS = 'sessions'
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -185,6 +198,43 @@ LOGIN_URL = '/accounts/login/'
 STRIPE_PUBLIC_KEY = os.getenv('STRIPE_PUBLIC_KEY', '')
 STRIPE_SECRET_KEY = os.getenv('STRIPE_SECRET_KEY', '')
 STRIPE_WEBHOOK_SECRET = os.getenv('STRIPE_WEBHOOK_SECRET', '')
+# Point at a local stub (python manage.py run_stripe_stub) for offline development and load tests,
+# e.g. STRIPE_API_BASE=http://127.0.0.1:12111 with any STRIPE_SECRET_KEY
+STRIPE_API_BASE = os.getenv('STRIPE_API_BASE', '')
+STRIPE_CONNECT_TIMEOUT = 3  # Seconds to establish a connection to Stripe
+STRIPE_READ_TIMEOUT = 10  # Seconds to wait for a Stripe response
+STRIPE_MAX_NETWORK_RETRIES = 2  # Retries on network errors and 409/429/5xx responses
+STRIPE_HTTP_POOL_SIZE = 20  # Keep-alive connections kept open to Stripe per process
+
+# Checkout results are kept this long (seconds) so resubmitting the same checkout form returns the original order
+CHECKOUT_IDEMPOTENCY_TTL = 60 * 60 * 24
+
+# Orders still unpaid this many seconds after checkout are cancelled by expire_pending_orders,
+# which puts their stock and discount code use back
+PENDING_ORDER_EXPIRY = 60 * 60 * 2
+
+# Bloom filter in Redis that rejects unknown discount codes without a database lookup
+# (rebuild with python manage.py rebuild_discount_code_bloom after changing these)
+DISCOUNT_CODE_BLOOM_CAPACITY = 10_000_000  # Codes the filter is sized for (about 18 MB at the default error rate)
+DISCOUNT_CODE_BLOOM_ERROR_RATE = 0.001  # Share of unknown codes that still fall through to the database
+
+# Shard rows per daily analytics counter (see analytics/counters.py); more shards, less lock contention
+ANALYTICS_COUNTER_SHARDS = 16
+
+# Lifetime (seconds) of the per-day and per-hour unique visitor HyperLogLogs (see analytics/uniques.py);
+# daily keys outlive a month so monthly uniques can still be counted or merged
+TRAFFIC_UNIQUES_DAILY_TTL = 60 * 60 * 24 * 40
+TRAFFIC_UNIQUES_HOURLY_TTL = 60 * 60 * 24 * 2
+
+# A visit ends after this many seconds without a request (see analytics/visits.py); check_inactive_sessions
+# counts visits that ended after a single page as bounces
+TRAFFIC_VISIT_INACTIVITY_TIMEOUT = 30 * 60
+
+# Circuit breaker for the per-request traffic tracking round trip (see analytics/traffic_middleware.py):
+# after this many consecutive failed or over-budget round trips, tracking is skipped for the cooldown
+TRAFFIC_TRACKING_LATENCY_BUDGET = 0.05  # Seconds
+TRAFFIC_TRACKING_FAILURE_THRESHOLD = 5
+TRAFFIC_TRACKING_COOLDOWN = 30  # Seconds
 
 # Trusted domains for referral source validation
 TRUSTED_DOMAINS = {'example.com', 'yourdomain.com'}
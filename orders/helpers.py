@@ -1,15 +1,43 @@
 from django.utils import timezone
+from django.db import transaction
+from django.db.models import Case, When, Value, F, PositiveIntegerField, Prefetch, prefetch_related_objects
+from django.db.models.functions import Greatest
 from promotions.models import DiscountCode
 
+
+class InsufficientStockError(Exception):
+    """
+    Raised inside the checkout transaction when a cart line can no longer be covered by stock.
+    The message names the affected products so it can be shown to the customer as-is.
+    """
+
+
+class DiscountUnavailableError(Exception):
+    """
+    Raised inside the checkout transaction when the discount code has no redemptions left
+    (or was deactivated) by the time the order is written.
+    """
+
+
 def apply_discount(cart, request):
     """
     Apply a discount to the cart based on the discount code stored in the session.
     Returns a tuple of (discount_amount, discounted_total).
     """
+    discount, discount_amount, discounted_total = resolve_discount(cart, request)
+    return discount_amount, discounted_total
+
+
+def resolve_discount(cart, request):
+    """
+    Look up the discount code stored in the session and work out what it takes off the cart.
+    Returns a tuple of (discount, discount_amount, discounted_total), where discount is the
+    applicable DiscountCode or None.
+    """
+    from decimal import Decimal
     discount_code = request.session.get('discount_code')
     if not discount_code:
-        from decimal import Decimal
-        return Decimal('0.00'), cart.total_price
+        return None, Decimal('0.00'), cart.total_price
     
     try:
         discount = DiscountCode.objects.get(code=discount_code, is_active=True)
@@ -21,8 +49,293 @@ def apply_discount(cart, request):
                 else:  # fixed_amount
                     discount_amount = min(discount.discount_value, cart.total_price)
                 discounted_total = cart.total_price - discount_amount
-                return discount_amount, discounted_total
+                return discount, discount_amount, discounted_total
     except DiscountCode.DoesNotExist:
         pass
     
-    return 0.0, cart.total_price
+    return None, Decimal('0.00'), cart.total_price
+
+
+def prefetch_cart_items(cart):
+    """
+    Load the cart's items together with their product and variant in two queries, so that
+    cart.total_price, templates and order creation all reuse the same rows instead of issuing
+    one query per line.
+    """
+    from cart.models import CartItem
+    prefetch_related_objects([cart], Prefetch('items', queryset=CartItem.objects.select_related('product', 'variant__product')))
+    return cart
+
+
+def create_order_from_cart(user, cart, shipping_address, total_price, discount_code=None, idempotency_key=None,
+                           subtotal=None, discount_amount=0, shipping_cost=0, discount=None):
+    """
+    Create an Order with all of its lines and take the ordered quantities out of stock
+    in a single transaction.
+
+    The number of queries is fixed regardless of cart size: one INSERT for the order, one bulk
+    INSERT for the lines and at most one conditional UPDATE each for Product and Variant stock.
+    A discount code redemption is reserved in the same transaction with one conditional UPDATE.
+
+    Args:
+        user: The customer placing the order.
+        cart: The Cart being checked out, ideally passed through prefetch_cart_items().
+        shipping_address (str): Formatted shipping address stored on the order.
+        total_price: Order total after discounts.
+        discount_code (str, optional): The discount code applied to the order.
+        idempotency_key (str, optional): Client-supplied key identifying this checkout attempt.
+        subtotal, discount_amount, shipping_cost (optional): Pricing breakdown stored on the order
+            so reporting never has to re-derive it. subtotal defaults to cart.total_price.
+        discount (DiscountCode, optional): The discount code record applied to the order.
+
+    Returns:
+        Order: The newly created order.
+
+    Raises:
+        InsufficientStockError: If any line exceeds the remaining stock. Nothing is written.
+        DiscountUnavailableError: If the discount code's usage limit has been reached. Nothing is written.
+    """
+    from .models import Order, OrderItem
+    cart_items = list(cart.items.all())
+
+    with transaction.atomic():
+        if discount is not None:
+            reserve_discount_redemption(discount)
+        order = Order.objects.create(
+            user=user,
+            total_price=total_price,
+            subtotal=cart.total_price if subtotal is None else subtotal,
+            discount_amount=discount_amount,
+            shipping_cost=shipping_cost,
+            discount=discount,
+            shipping_address=shipping_address,
+            status='pending',
+            discount_code=discount_code or None,
+            idempotency_key=idempotency_key or None
+        )
+        OrderItem.objects.bulk_create([
+            OrderItem(
+                order=order,
+                product=item.product,
+                variant=item.variant,
+                quantity=item.quantity,
+                price=item.unit_price
+            )
+            for item in cart_items
+        ])
+        product_quantities, variant_quantities = _stock_quantities(cart_items)
+        _decrement_stock(product_quantities, variant_quantities)
+
+    transaction.on_commit(lambda: _check_low_stock(product_quantities, variant_quantities))
+    return order
+
+
+def release_order_stock(order):
+    """
+    Put the quantities of an order that will not be fulfilled back into stock.
+    Issues at most one UPDATE each for Product and Variant stock, like create_order_from_cart().
+    """
+    from products.models import Product, Variant
+    product_quantities, variant_quantities = _stock_quantities(order.items.all())
+    with transaction.atomic():
+        for model, quantities in ((Product, product_quantities), (Variant, variant_quantities)):
+            if quantities:
+                model.objects.filter(pk__in=quantities).update(
+                    stock=F('stock') + _quantity_case(quantities),
+                    updated_at=timezone.now()
+                )
+
+
+def retake_order_stock(order):
+    """
+    Take the quantities of an order back out of stock after they were released, for an order that
+    failed or was cancelled and then got paid after all. The payment has been taken, so the order
+    is honoured even if that empties the stock; it is never driven below zero.
+    """
+    from products.models import Product, Variant
+    product_quantities, variant_quantities = _stock_quantities(order.items.all())
+    with transaction.atomic():
+        for model, quantities in ((Product, product_quantities), (Variant, variant_quantities)):
+            if quantities:
+                model.objects.filter(pk__in=quantities).update(
+                    stock=Greatest(F('stock') - _quantity_case(quantities), Value(0)),
+                    updated_at=timezone.now()
+                )
+    transaction.on_commit(lambda: _check_low_stock(product_quantities, variant_quantities))
+
+
+def cancel_order(order):
+    """
+    Mark an order that will never be paid as cancelled, put its quantities back into stock and
+    give back its discount code use. Call it with the order row locked and still pending (or
+    failed, whose stock and code use are already back).
+    """
+    if order.status == 'pending':
+        release_order_stock(order)
+        release_discount_redemption(order)
+    order.status = 'cancelled'
+    order.save(update_fields=['status', 'updated_at'])
+
+
+def reserve_discount_redemption(discount):
+    """
+    Take one use of a discount code with a single conditional UPDATE, so that concurrent
+    checkouts can never redeem it more than usage_limit times: the database re-checks
+    times_used < usage_limit against the row as it is when the update runs.
+
+    Raises:
+        DiscountUnavailableError: If no redemptions are left or the code is no longer active.
+    """
+    reserved = DiscountCode.objects.filter(
+        pk=discount.pk,
+        is_active=True,
+        times_used__lt=F('usage_limit')
+    ).update(times_used=F('times_used') + 1, updated_at=timezone.now())
+    if not reserved:
+        raise DiscountUnavailableError(f"Discount code {discount.code} has reached its usage limit.")
+
+
+def release_discount_redemption(order):
+    """
+    Give back the discount code use reserved by an order whose payment failed or that was cancelled.
+    """
+    if order.discount_id:
+        DiscountCode.objects.filter(pk=order.discount_id, times_used__gt=0).update(
+            times_used=F('times_used') - 1,
+            updated_at=timezone.now()
+        )
+
+
+def _stock_quantities(items):
+    """
+    Sum line quantities per stock-keeping row. Lines with a variant draw on the variant's
+    stock, plain lines on the product's stock, matching the checks in cart.views.add_to_cart.
+    """
+    product_quantities, variant_quantities = {}, {}
+    for item in items:
+        if item.variant_id:
+            variant_quantities[item.variant_id] = variant_quantities.get(item.variant_id, 0) + item.quantity
+        else:
+            product_quantities[item.product_id] = product_quantities.get(item.product_id, 0) + item.quantity
+    return product_quantities, variant_quantities
+
+
+def _quantity_case(quantities):
+    return Case(
+        *[When(pk=pk, then=Value(quantity)) for pk, quantity in quantities.items()],
+        output_field=PositiveIntegerField()
+    )
+
+
+def _decrement_stock(product_quantities, variant_quantities):
+    """
+    Decrement stock with one UPDATE per model that only matches rows still holding enough
+    stock. If fewer rows were updated than requested, some line is short and the surrounding
+    transaction is aborted with InsufficientStockError.
+    """
+    from products.models import Product, Variant
+    for model, quantities in ((Product, product_quantities), (Variant, variant_quantities)):
+        if not quantities:
+            continue
+        needed = _quantity_case(quantities)
+        updated = model.objects.filter(pk__in=quantities, stock__gte=needed).update(
+            stock=F('stock') - needed,
+            updated_at=timezone.now()
+        )
+        if updated != len(quantities):
+            short = [
+                str(row) for row in model.objects.filter(pk__in=quantities)
+                if row.stock < quantities[row.pk]
+            ]
+            raise InsufficientStockError(f"Not enough stock for: {', '.join(short) or 'some items in your cart'}.")
+
+
+def _check_low_stock(product_quantities, variant_quantities):
+    """
+    QuerySet.update() bypasses the post_save stock alert signals, so run the same check
+    for the rows touched by checkout once the order has been committed.
+    """
+    from products.models import Product, Variant
+    from products.signals import create_stock_alert_if_needed
+    if product_quantities:
+        for product in Product.objects.filter(pk__in=product_quantities, stock__lt=F('low_stock_threshold')):
+            create_stock_alert_if_needed('product', product, product.stock)
+    if variant_quantities:
+        for variant in Variant.objects.filter(pk__in=variant_quantities, stock__lt=F('low_stock_threshold')):
+            create_stock_alert_if_needed('variant', variant, variant.stock)
+
+
+def _idempotency_cache_key(user, idempotency_key):
+    return f"checkout:idempotency:{user.id}:{idempotency_key}"
+
+
+def get_checkout_result(user, idempotency_key):
+    """
+    Look up the outcome of an earlier checkout submitted with the same idempotency key.
+
+    The cached result is tried first so a replay costs a single cache read. If it has expired
+    or was evicted, the order is found through its stored key; only then is Stripe asked for
+    the client secret again, and the result is re-cached.
+
+    Returns:
+        dict: {'order_id', 'client_secret', 'status'}, or None if the key has not been used.
+    """
+    from django.core.cache import cache
+    result = cache.get(_idempotency_cache_key(user, idempotency_key))
+    if result is not None:
+        return result
+
+    from .models import Order
+    order = Order.objects.filter(user=user, idempotency_key=idempotency_key).first()
+    if order is None:
+        return None
+    client_secret = None
+    if order.payment_intent_id and order.status != 'failed':
+        from payments.stripe_client import get_stripe
+        stripe = get_stripe()
+        try:
+            client_secret = stripe.PaymentIntent.retrieve(order.payment_intent_id).client_secret
+        except stripe.error.StripeError:
+            pass
+    return store_checkout_result(user, idempotency_key, order, client_secret)
+
+
+def store_checkout_result(user, idempotency_key, order, client_secret):
+    """
+    Remember the outcome of a checkout for CHECKOUT_IDEMPOTENCY_TTL seconds so that repeated
+    submissions of the same form can be answered without touching the database or Stripe.
+    """
+    from django.core.cache import cache
+    from django.conf import settings
+    result = {'order_id': order.id, 'client_secret': client_secret, 'status': order.status}
+    cache.set(_idempotency_cache_key(user, idempotency_key), result, settings.CHECKOUT_IDEMPOTENCY_TTL)
+    return result
+
+
+def acquire_checkout_lock(user, idempotency_key, timeout=60):
+    """
+    Claim an idempotency key for the duration of one checkout. Returns False if another
+    request with the same key is already being processed.
+    """
+    from django.core.cache import cache
+    return cache.add(f"{_idempotency_cache_key(user, idempotency_key)}:lock", 1, timeout)
+
+
+def release_checkout_lock(user, idempotency_key):
+    from django.core.cache import cache
+    cache.delete(f"{_idempotency_cache_key(user, idempotency_key)}:lock")
+
+
+def wait_for_checkout_result(user, idempotency_key, timeout=5.0, interval=0.1):
+    """
+    Poll for the result of a concurrent checkout holding the same idempotency key, which is
+    what a double-clicked submit button produces. Gives up after timeout seconds.
+    """
+    import time
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        result = get_checkout_result(user, idempotency_key)
+        if result is not None:
+            return result
+        time.sleep(interval)
+    return None
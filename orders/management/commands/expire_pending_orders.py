@@ -0,0 +1,55 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from datetime import timedelta
+from orders.helpers import cancel_order
+from orders.models import Order
+from payments.stripe_client import get_stripe
+import logging
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Cancels orders left unpaid past PENDING_ORDER_EXPIRY and gives back their stock and discount code uses.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help='Orders examined per batch (default: 100)')
+
+    def handle(self, *args, **options):
+        """
+        Cancel pending orders older than PENDING_ORDER_EXPIRY seconds: abandoned checkouts, or
+        checkouts whose payment never completed. The order's PaymentIntent is canceled at Stripe
+        first so it can no longer be paid; if Stripe refuses (typically because the payment just
+        succeeded and its webhook is on the way) the order is left alone. Each order is handled
+        in its own short transaction with its row locked, so a webhook for the same order either
+        runs before (and the order is no longer pending) or after (and finds it cancelled).
+        """
+        stripe = get_stripe()
+        cutoff = timezone.now() - timedelta(seconds=settings.PENDING_ORDER_EXPIRY)
+        cancelled = skipped = 0
+        after = 0
+        while True:
+            order_ids = list(
+                Order.objects.filter(status='pending', created_at__lt=cutoff, id__gt=after)
+                .order_by('id').values_list('id', flat=True)[:options['batch_size']]
+            )
+            if not order_ids:
+                break
+            for order_id in order_ids:
+                with transaction.atomic():
+                    order = Order.objects.select_for_update(skip_locked=True).filter(id=order_id, status='pending').first()
+                    if order is None:
+                        continue
+                    if order.payment_intent_id:
+                        try:
+                            stripe.PaymentIntent.cancel(order.payment_intent_id)
+                        except stripe.error.StripeError as e:
+                            logger.warning(f"Could not cancel PaymentIntent {order.payment_intent_id} of order #{order.id}: {str(e)}")
+                            skipped += 1
+                            continue
+                    cancel_order(order)
+                    cancelled += 1
+            after = order_ids[-1]
+
+        self.stdout.write(self.style.SUCCESS(f"Cancelled {cancelled} expired pending orders, skipped {skipped}."))
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.3 on 2026-10-19 11:22
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0005_order_payment_intent_id'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        # Not part of checkout idempotency: Order.discount_code was already declared on the model
+        # (and written by checkout) without ever having been migrated, so the column is created here.
+        # Databases built from the earlier migrations lack it, and checkout fails on them without it.
+        migrations.AddField(
+            model_name='order',
+            name='discount_code',
+            field=models.CharField(blank=True, help_text='Stores the discount code applied to this order', max_length=50, null=True),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='idempotency_key',
+            field=models.CharField(blank=True, help_text='Client-generated key that makes repeated checkout submissions return this order', max_length=64, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='order',
+            constraint=models.UniqueConstraint(fields=('user', 'idempotency_key'), name='unique_order_idempotency_key'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.3 on 2026-10-19 11:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0006_order_idempotency_key'),
+        ('promotions', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='discount',
+            field=models.ForeignKey(blank=True, help_text='Discount code record applied at checkout', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='orders', to='promotions.discountcode'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='discount_amount',
+            field=models.DecimalField(decimal_places=2, default=0.0, help_text='Discount deducted from the subtotal at checkout', max_digits=10),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='shipping_cost',
+            field=models.DecimalField(decimal_places=2, default=0.0, max_digits=10),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='subtotal',
+            field=models.DecimalField(decimal_places=2, default=0.0, help_text='Sum of order lines before discounts and shipping', max_digits=10),
+        ),
+    ]
@@ -0,0 +1,45 @@
+from decimal import Decimal
+
+from django.db import migrations
+from django.db.models import DecimalField, ExpressionWrapper, F, Sum
+
+BATCH_SIZE = 1000
+
+
+def backfill_pricing_breakdown(apps, schema_editor):
+    """
+    Fill in the pricing breakdown of orders placed before it was stored: the subtotal is the sum
+    of the order lines, and the difference to the stored total is the discount (total below the
+    subtotal) or the shipping cost (total above it). The discount code record is linked by code.
+    """
+    Order = apps.get_model('orders', 'Order')
+    DiscountCode = apps.get_model('promotions', 'DiscountCode')
+    line_total = ExpressionWrapper(F('items__price') * F('items__quantity'), output_field=DecimalField(max_digits=12, decimal_places=2))
+    orders = Order.objects.filter(subtotal=0).annotate(lines_total=Sum(line_total)).filter(lines_total__gt=0).order_by('id')
+    after = 0
+    while True:
+        batch = list(orders.filter(id__gt=after)[:BATCH_SIZE])
+        if not batch:
+            break
+        codes = dict(DiscountCode.objects.filter(
+            code__in={order.discount_code for order in batch if order.discount_code}
+        ).values_list('code', 'id'))
+        for order in batch:
+            order.subtotal = order.lines_total
+            order.discount_amount = max(order.lines_total - order.total_price, Decimal('0'))
+            order.shipping_cost = max(order.total_price - order.lines_total, Decimal('0'))
+            if order.discount_id is None and order.discount_code:
+                order.discount_id = codes.get(order.discount_code)
+        Order.objects.bulk_update(batch, ['subtotal', 'discount_amount', 'shipping_cost', 'discount'])
+        after = batch[-1].id
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0007_order_pricing_breakdown'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_pricing_breakdown, migrations.RunPython.noop),
+    ]
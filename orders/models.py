@@ -13,13 +13,23 @@ class Order(models.Model):
     
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='orders')
     total_price = models.DecimalField(max_digits=10, decimal_places=2)
+    subtotal = models.DecimalField(max_digits=10, decimal_places=2, default=0.00, help_text="Sum of order lines before discounts and shipping")
+    discount_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0.00, help_text="Discount deducted from the subtotal at checkout")
+    shipping_cost = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     shipping_address = models.TextField()
     payment_intent_id = models.CharField(max_length=255, blank=True, null=True, help_text="Stores Stripe PaymentIntent ID for payment processing")
     discount_code = models.CharField(max_length=50, blank=True, null=True, help_text="Stores the discount code applied to this order")
+    discount = models.ForeignKey('promotions.DiscountCode', on_delete=models.SET_NULL, null=True, blank=True, related_name='orders', help_text="Discount code record applied at checkout")
+    idempotency_key = models.CharField(max_length=64, blank=True, null=True, help_text="Client-generated key that makes repeated checkout submissions return this order")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'idempotency_key'], name='unique_order_idempotency_key')
+        ]
+
     def __str__(self):
         return f"Order #{self.id} by {self.user.username} - {self.get_status_display()}"
 
@@ -1,21 +1,65 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
+from django.conf import settings
+from django.db import IntegrityError
 from .models import Order, OrderItem
 from cart.models import Cart, CartItem
 from cart.views import get_cart
-from .helpers import apply_discount
+from .helpers import apply_discount, resolve_discount, prefetch_cart_items, create_order_from_cart, release_order_stock, InsufficientStockError
+from .helpers import release_discount_redemption, DiscountUnavailableError
+from .helpers import get_checkout_result, store_checkout_result, acquire_checkout_lock, release_checkout_lock, wait_for_checkout_result
 from promotions.models import DiscountCode
+import uuid
 
 @login_required
 def checkout(request):
-    cart = get_cart(request)
+    idempotency_key = None
+    if request.method == 'POST':
+        # A resubmitted form (double click, proxy retry) carries the key of the original attempt
+        idempotency_key = request.POST.get('idempotency_key') or request.headers.get('Idempotency-Key')
+        if idempotency_key:
+            idempotency_key = idempotency_key[:64]
+            previous = get_checkout_result(request.user, idempotency_key)
+            if previous is None and not acquire_checkout_lock(request.user, idempotency_key):
+                previous = wait_for_checkout_result(request.user, idempotency_key)
+                if previous is None:
+                    messages.info(request, "Your order is still being processed. Please wait a moment.")
+                    return redirect('cart_detail')
+            if previous is not None:
+                return render_checkout_result(request, previous)
+    try:
+        return _checkout(request, idempotency_key)
+    finally:
+        if idempotency_key:
+            release_checkout_lock(request.user, idempotency_key)
+
+def render_checkout_result(request, result):
+    """
+    Answer a repeated checkout submission with the outcome of the original one,
+    without writing to the database or calling Stripe.
+    """
+    if result is None or result['status'] == 'failed':
+        messages.error(request, "Payment processing failed for this order. Please try again.")
+        return redirect('cart_detail')
+    if not result['client_secret']:
+        messages.info(request, "Your order is still being processed. Please wait a moment.")
+        return redirect('cart_detail')
+    return render(request, 'orders/checkout.html', {
+        'client_secret': result['client_secret'],
+        'order_id': result['order_id'],
+        'payment_processing': True,
+        'stripe_public_key': settings.STRIPE_PUBLIC_KEY
+    })
+
+def _checkout(request, idempotency_key=None):
+    cart = prefetch_cart_items(get_cart(request))
     if not cart.items.exists():
         messages.error(request, "Your cart is empty. Add items to your cart before checking out.")
         return redirect('cart_detail')
     
     discount_code = request.session.get('discount_code')
-    discount_amount, discounted_total = apply_discount(cart, request)
+    discount, discount_amount, discounted_total = resolve_discount(cart, request)
     
     if request.method == 'POST':
         full_name = request.POST.get('full_name')
@@ -27,28 +71,34 @@ def checkout(request):
         # Concatenate shipment information into a single string for shipping_address
         shipping_address = f"Full Name: {full_name}, Address: {address}, City: {city}, Postal Code: {postal_code}, Country: {country}"
         
-        order = Order.objects.create(
-            user=request.user,
-            total_price=discounted_total,
-            shipping_address=shipping_address,
-            status='pending',
-            discount_code=discount_code if discount_code else None
-        )
-        
-        for item in cart.items.all():
-            price = item.variant.total_price if item.variant else item.product.price
-            OrderItem.objects.create(
-                order=order,
-                product=item.product,
-                variant=item.variant,
-                quantity=item.quantity,
-                price=price
+        # Order, order lines and stock decrements are written in one transaction
+        try:
+            order = create_order_from_cart(
+                request.user,
+                cart,
+                shipping_address=shipping_address,
+                total_price=discounted_total,
+                discount_code=discount_code,
+                idempotency_key=idempotency_key,
+                subtotal=cart.total_price,
+                discount_amount=discount_amount,
+                discount=discount
             )
+        except InsufficientStockError as e:
+            messages.error(request, str(e))
+            return redirect('cart_detail')
+        except DiscountUnavailableError as e:
+            # Another checkout took the last use of the code; drop it so the customer can pay full price
+            request.session.pop('discount_code', None)
+            messages.error(request, str(e))
+            return redirect('cart_detail')
+        except IntegrityError:
+            # Another request with the same idempotency key created the order first
+            return render_checkout_result(request, get_checkout_result(request.user, idempotency_key))
         
-        # Initialize Stripe payment
-        import stripe
-        from django.conf import settings
-        stripe.api_key = settings.STRIPE_SECRET_KEY
+        # Initialize Stripe payment over the shared keep-alive connection pool
+        from payments.stripe_client import get_stripe
+        stripe = get_stripe()
         
         from decimal import Decimal, ROUND_HALF_UP
         try:
@@ -60,30 +110,27 @@ def checkout(request):
                 currency='usd',
                 metadata={'order_id': str(order.id)},
                 description=f"Order #{order.id} for {request.user.email}",
+                # Stripe returns the original PaymentIntent if this request is ever retried
+                idempotency_key=f"checkout-{request.user.id}-{idempotency_key or order.id}",
             )
             order.payment_intent_id = payment_intent.id
             order.save()
+            if idempotency_key:
+                store_checkout_result(request.user, idempotency_key, order, payment_intent.client_secret)
             
-            # Cart clearing and discount code handling is now done in payments/views.py webhook after payment confirmation
+            # Cart clearing is done by the payment webhook after payment confirmation; the discount
+            # code use was already reserved when the order was created
                     
-            # Handle saving card information if requested
+            # Handle saving card information if requested; the card details are fetched
+            # from Stripe later by the save_payment_methods command
             save_card = request.POST.get('save_card')
             if save_card and 'payment_method_id' in request.POST:
-                from payments.models import SavedPaymentMethod
-                payment_method_id = request.POST.get('payment_method_id')
-                try:
-                    payment_method = stripe.PaymentMethod.retrieve(payment_method_id)
-                    last_four_digits = payment_method.card.last4 if payment_method.type == 'card' else 'XXXX'
-                    SavedPaymentMethod.objects.create(
-                        user=request.user,
-                        payment_method_type='credit_card',
-                        last_four_digits=last_four_digits,
-                        token=payment_method_id,
-                        is_default=False
-                    )
-                    messages.success(request, "Your card has been saved for future purchases.")
-                except stripe.error.StripeError:
-                    messages.error(request, "Failed to save your card. Please try again.")
+                from payments.models import PaymentMethodSaveRequest
+                PaymentMethodSaveRequest.objects.get_or_create(
+                    payment_method_id=request.POST.get('payment_method_id'),
+                    defaults={'user': request.user}
+                )
+                messages.success(request, "Your card will be saved for future purchases.")
                     
             messages.success(request, f"Your order #{order.id} has been placed successfully! Payment processing initiated.")
             return render(request, 'orders/checkout.html', {
@@ -92,11 +139,16 @@ def checkout(request):
                 'discounted_total': discounted_total,
                 'client_secret': payment_intent.client_secret,
                 'order_id': order.id,
-                'payment_processing': True
+                'payment_processing': True,
+                'stripe_public_key': settings.STRIPE_PUBLIC_KEY
             })
         except stripe.error.StripeError as e:
             order.status = 'failed'
             order.save()
+            release_order_stock(order)
+            release_discount_redemption(order)
+            if idempotency_key:
+                store_checkout_result(request.user, idempotency_key, order, None)
             messages.error(request, f"Payment processing failed: {str(e)}. Please try again.")
             return redirect('cart_detail')
     
@@ -111,7 +163,9 @@ def checkout(request):
         'discount_amount': discount_amount,
         'discounted_total': discounted_total,
         'saved_payment_methods': saved_payment_methods,
-        'stripe_public_key': settings.STRIPE_PUBLIC_KEY
+        'stripe_public_key': settings.STRIPE_PUBLIC_KEY,
+        # Fresh key per rendered form; resubmitting this form reuses it
+        'idempotency_key': uuid.uuid4().hex
     })
 
 @login_required
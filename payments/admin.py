@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Payment
+from .models import Payment, WebhookEvent
 
 @admin.register(Payment)
 class PaymentAdmin(admin.ModelAdmin):
@@ -7,3 +7,18 @@ class PaymentAdmin(admin.ModelAdmin):
     list_filter = ('status', 'payment_method', 'created_at')
     search_fields = ('transaction_id', 'order__user__username')
     ordering = ('-created_at',)
+
+    # Ledger entries are written by the webhook pipeline and never edited
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+@admin.register(WebhookEvent)
+class WebhookEventAdmin(admin.ModelAdmin):
+    list_display = ('event_id', 'event_type', 'status', 'attempts', 'received_at', 'processed_at')
+    list_filter = ('status', 'event_type', 'received_at')
+    search_fields = ('event_id',)
+    readonly_fields = ('event_id', 'event_type', 'payload', 'received_at', 'processed_at')
+    ordering = ('-received_at',)
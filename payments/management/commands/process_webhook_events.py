@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from payments.models import WebhookEvent
+from payments.webhooks import process_event
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Applies stored Stripe webhook events to orders, carts and discount codes in batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help='Events claimed per batch (default: 100)')
+        parser.add_argument('--max-attempts', type=int, default=5, help='Mark an event failed after this many errors (default: 5)')
+        parser.add_argument('--loop', action='store_true', help='Keep polling for new events instead of exiting when the inbox is empty')
+        parser.add_argument('--interval', type=float, default=1.0, help='Seconds between polls in --loop mode (default: 1)')
+
+    def handle(self, *args, **options):
+        """
+        Claim pending events oldest-first with SELECT ... FOR UPDATE SKIP LOCKED, so any number
+        of workers can drain the inbox without handling the same event twice. Each event runs in
+        its own savepoint; a failing event is retried on a later pass until --max-attempts.
+        """
+        processed = failed = 0
+        while True:
+            with transaction.atomic():
+                batch = list(
+                    WebhookEvent.objects.select_for_update(skip_locked=True)
+                    .filter(status='pending')
+                    .order_by('id')[:options['batch_size']]
+                )
+                for event in batch:
+                    event.attempts += 1
+                    try:
+                        process_event(event)
+                        event.status = 'processed'
+                        event.processed_at = timezone.now()
+                        event.last_error = ''
+                        processed += 1
+                    except Exception as e:
+                        logger.error(f"Error processing webhook event {event.event_id}: {str(e)}", exc_info=True)
+                        event.last_error = str(e)
+                        if event.attempts >= options['max_attempts']:
+                            event.status = 'failed'
+                        failed += 1
+                WebhookEvent.objects.bulk_update(batch, ['status', 'attempts', 'last_error', 'processed_at'])
+
+            if len(batch) < options['batch_size']:
+                if not options['loop']:
+                    break
+                time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS(f"Processed {processed} webhook events, {failed} errors."))
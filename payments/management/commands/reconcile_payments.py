@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from datetime import timedelta
+from payments.reconciliation import reconcile, parse_day
+from payments.stripe_client import get_stripe
+import time
+
+class Command(BaseCommand):
+    help = 'Reconciles succeeded Stripe payments against the payment ledger and order statuses.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help='First day to reconcile, YYYY-MM-DD (default: 30 days ago)')
+        parser.add_argument('--end', help='Day after the last day to reconcile, YYYY-MM-DD (default: today)')
+        parser.add_argument('--window-hours', type=int, default=24, help='Size of each reconciliation window in hours (default: 24)')
+        parser.add_argument('--max-lines', type=int, default=100, help='Maximum number of discrepancies printed (default: 100)')
+
+    def handle(self, *args, **options):
+        today = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        try:
+            start = parse_day(options['start']) if options['start'] else today - timedelta(days=30)
+            end = parse_day(options['end']) if options['end'] else today
+        except ValueError:
+            raise CommandError("Dates must be in YYYY-MM-DD format.")
+        if start >= end:
+            raise CommandError("--start must be before --end.")
+
+        self.stdout.write(f"Reconciling payments from {start:%Y-%m-%d} to {end:%Y-%m-%d}...")
+        started = time.monotonic()
+        counts = {}
+        printed = 0
+        for kind, payment_id, processor_entry, ledger_entry in reconcile(get_stripe(), start, end, timedelta(hours=options['window_hours'])):
+            counts[kind] = counts.get(kind, 0) + 1
+            if printed < options['max_lines']:
+                processor_amount = processor_entry[1] if processor_entry else '-'
+                ledger_amount = ledger_entry[1] if ledger_entry else '-'
+                self.stdout.write(f"{kind}: {payment_id} (stripe: {processor_amount}, ledger: {ledger_amount})")
+                printed += 1
+
+        elapsed = time.monotonic() - started
+        if counts:
+            summary = ', '.join(f"{count} {kind}" for kind, count in sorted(counts.items()))
+            self.stdout.write(self.style.WARNING(f"Reconciliation finished in {elapsed:.1f}s with discrepancies: {summary}."))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Reconciliation finished in {elapsed:.1f}s. Stripe and the ledger agree."))
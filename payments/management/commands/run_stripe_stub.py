@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from payments.stripe_stub import make_server
+
+class Command(BaseCommand):
+    help = 'Runs a local Stripe API stub for offline development and load testing.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1', help='Interface to listen on (default: 127.0.0.1)')
+        parser.add_argument('--port', type=int, default=12111, help='Port to listen on (default: 12111)')
+
+    def handle(self, *args, **options):
+        server = make_server(options['host'], options['port'])
+        host, port = server.server_address[:2]
+        self.stdout.write(self.style.SUCCESS(
+            f"Stripe stub listening on http://{host}:{port} - set STRIPE_API_BASE to this URL. Press Ctrl+C to stop."
+        ))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
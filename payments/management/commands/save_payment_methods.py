@@ -0,0 +1,74 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from payments.models import PaymentMethodSaveRequest, SavedPaymentMethod
+from payments.stripe_client import get_stripe
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Saves cards customers chose to keep at checkout by fetching their details from Stripe.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help='Requests claimed per batch (default: 100)')
+        parser.add_argument('--max-attempts', type=int, default=5, help='Give up on a request after this many failures (default: 5)')
+        parser.add_argument('--loop', action='store_true', help='Keep polling for new requests instead of exiting when the queue is empty')
+        parser.add_argument('--interval', type=float, default=5.0, help='Seconds between polls in --loop mode (default: 5)')
+
+    def handle(self, *args, **options):
+        """
+        Claim pending PaymentMethodSaveRequest rows with SELECT ... FOR UPDATE SKIP LOCKED so
+        several workers can run side by side, retrieve each PaymentMethod from Stripe and store
+        it as a SavedPaymentMethod.
+        """
+        stripe = get_stripe()
+        saved = failed = 0
+        while True:
+            with transaction.atomic():
+                batch = list(
+                    PaymentMethodSaveRequest.objects.select_for_update(skip_locked=True)
+                    .filter(status='pending', attempts__lt=options['max_attempts'])
+                    .order_by('id')[:options['batch_size']]
+                )
+                for save_request in batch:
+                    if self.save_payment_method(stripe, save_request, options['max_attempts']):
+                        saved += 1
+                    else:
+                        failed += 1
+            if not batch:
+                if not options['loop']:
+                    break
+                time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS(f"Saved {saved} payment methods, {failed} failed attempts."))
+
+    def save_payment_method(self, stripe, save_request, max_attempts):
+        try:
+            payment_method = stripe.PaymentMethod.retrieve(save_request.payment_method_id)
+        except stripe.error.StripeError as e:
+            logger.warning(f"Could not retrieve payment method {save_request.payment_method_id}: {str(e)}")
+            PaymentMethodSaveRequest.objects.filter(pk=save_request.pk).update(
+                attempts=F('attempts') + 1,
+                last_error=str(e),
+                status='failed' if save_request.attempts + 1 >= max_attempts else 'pending',
+                updated_at=timezone.now()
+            )
+            return False
+
+        last_four_digits = payment_method.card.last4 if payment_method.type == 'card' else 'XXXX'
+        SavedPaymentMethod.objects.get_or_create(
+            token=save_request.payment_method_id,
+            defaults={
+                'user_id': save_request.user_id,
+                'payment_method_type': 'credit_card',
+                'last_four_digits': last_four_digits,
+                'is_default': False,
+            }
+        )
+        PaymentMethodSaveRequest.objects.filter(pk=save_request.pk).update(
+            status='saved', attempts=F('attempts') + 1, last_error='', updated_at=timezone.now()
+        )
+        return True
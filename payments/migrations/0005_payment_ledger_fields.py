@@ -0,0 +1,33 @@
+# Generated by Django 5.2.3 on 2026-10-19 11:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0004_webhookevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='payment',
+            name='currency',
+            field=models.CharField(default='usd', max_length=3),
+        ),
+        migrations.AddField(
+            model_name='payment',
+            name='event_id',
+            field=models.CharField(blank=True, help_text='Stripe event this entry was recorded from', max_length=255, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name='payment',
+            name='processor_created_at',
+            field=models.DateTimeField(blank=True, db_index=True, help_text='Creation time of the PaymentIntent at Stripe, used to window reconciliation', null=True),
+        ),
+        migrations.AlterField(
+            model_name='payment',
+            name='transaction_id',
+            field=models.CharField(blank=True, db_index=True, help_text='Stripe PaymentIntent ID', max_length=100),
+        ),
+    ]
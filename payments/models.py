@@ -10,15 +10,24 @@ class Payment(models.Model):
     
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='payments')
     amount = models.DecimalField(max_digits=10, decimal_places=2)
+    currency = models.CharField(max_length=3, default='usd')
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
-    transaction_id = models.CharField(max_length=100, blank=True)
+    transaction_id = models.CharField(max_length=100, blank=True, db_index=True, help_text="Stripe PaymentIntent ID")
     payment_method = models.CharField(max_length=50, default='stripe')
+    event_id = models.CharField(max_length=255, unique=True, null=True, blank=True, help_text="Stripe event this entry was recorded from")
+    processor_created_at = models.DateTimeField(null=True, blank=True, db_index=True, help_text="Creation time of the PaymentIntent at Stripe, used to window reconciliation")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"Payment for Order #{self.order.id} - {self.get_status_display()}"
 
+    def save(self, *args, **kwargs):
+        # The ledger is append-only: a change in payment state is recorded as a new entry
+        if not self._state.adding:
+            raise ValueError("Payment ledger entries cannot be modified once recorded.")
+        super().save(*args, **kwargs)
+
 class SavedPaymentMethod(models.Model):
     user = models.ForeignKey('auth.User', on_delete=models.CASCADE, related_name='saved_payment_methods')
     payment_method_type = models.CharField(max_length=50, default='credit_card')
@@ -29,3 +38,42 @@ class SavedPaymentMethod(models.Model):
 
     def __str__(self):
         return f"{self.payment_method_type} ending in {self.last_four_digits}"
+
+class PaymentMethodSaveRequest(models.Model):
+    # Cards customers asked to keep at checkout; save_payment_methods fetches the card details from Stripe later
+    STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        ('saved', 'Saved'),
+        ('failed', 'Failed'),
+    )
+
+    user = models.ForeignKey('auth.User', on_delete=models.CASCADE, related_name='payment_method_save_requests')
+    payment_method_id = models.CharField(max_length=100, unique=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending', db_index=True)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Save {self.payment_method_id} for {self.user.username} - {self.get_status_display()}"
+
+class WebhookEvent(models.Model):
+    # Inbox of Stripe webhook deliveries; the handler only stores them and process_webhook_events applies them
+    STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        ('processed', 'Processed'),
+        ('failed', 'Failed'),
+    )
+
+    event_id = models.CharField(max_length=255, unique=True, help_text="Stripe event ID; redeliveries of the same event are ignored")
+    event_type = models.CharField(max_length=100)
+    payload = models.JSONField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending', db_index=True)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.event_type} ({self.event_id}) - {self.get_status_display()}"
@@ -0,0 +1,112 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from itertools import groupby
+from operator import itemgetter
+
+
+def processor_payments(stripe, start, end):
+    """
+    Yield (payment_intent_id, amount, order_id) for every PaymentIntent that succeeded at
+    Stripe and was created in [start, end). Pages are fetched lazily, 100 at a time.
+    """
+    params = {
+        'created': {'gte': int(start.timestamp()), 'lt': int(end.timestamp())},
+        'limit': 100,
+    }
+    for intent in stripe.PaymentIntent.list(**params).auto_paging_iter():
+        if intent['status'] != 'succeeded':
+            continue
+        amount_cents = intent.get('amount_received') or intent['amount']
+        yield intent['id'], Decimal(amount_cents) / 100, (intent.get('metadata') or {}).get('order_id')
+
+
+def ledger_payments(start, end):
+    """
+    Yield (payment_intent_id, amount, order_id) for completed ledger entries whose PaymentIntent
+    was created in [start, end), streamed from the database without caching the queryset.
+    """
+    from payments.models import Payment
+    entries = Payment.objects.filter(
+        status='completed',
+        processor_created_at__gte=start,
+        processor_created_at__lt=end
+    ).values_list('transaction_id', 'amount', 'order_id')
+    for transaction_id, amount, order_id in entries.iterator(chunk_size=2000):
+        yield transaction_id, amount, str(order_id)
+
+
+def merge_totals(entries):
+    """
+    Collapse a stream sorted by id into one (id, total amount, order_id) per id, so that a
+    payment recorded twice shows up as an amount mismatch rather than a phantom extra id.
+    """
+    for payment_id, group in groupby(entries, key=itemgetter(0)):
+        group = list(group)
+        yield payment_id, sum((amount for _, amount, _ in group), Decimal('0')), group[0][2]
+
+
+def diff_sorted(processor, ledger):
+    """
+    Walk two id-sorted streams in step (a merge join) and yield every difference:
+
+        ('missing_in_ledger', id, processor_entry, None)
+        ('missing_at_processor', id, None, ledger_entry)
+        ('amount_mismatch', id, processor_entry, ledger_entry)
+
+    Only the current element of each stream is held in memory.
+    """
+    processor, ledger = merge_totals(processor), merge_totals(ledger)
+    p_entry, l_entry = next(processor, None), next(ledger, None)
+    while p_entry is not None or l_entry is not None:
+        if l_entry is None or (p_entry is not None and p_entry[0] < l_entry[0]):
+            yield 'missing_in_ledger', p_entry[0], p_entry, None
+            p_entry = next(processor, None)
+        elif p_entry is None or l_entry[0] < p_entry[0]:
+            yield 'missing_at_processor', l_entry[0], None, l_entry
+            l_entry = next(ledger, None)
+        else:
+            if p_entry[1] != l_entry[1]:
+                yield 'amount_mismatch', p_entry[0], p_entry, l_entry
+            p_entry, l_entry = next(processor, None), next(ledger, None)
+
+
+def windows(start, end, size):
+    """
+    Split [start, end) into consecutive windows of at most size.
+    """
+    while start < end:
+        window_end = min(start + size, end)
+        yield start, window_end
+        start = window_end
+
+
+def reconcile(stripe, start, end, window=timedelta(days=1)):
+    """
+    Compare succeeded PaymentIntents at Stripe with the completed entries in the payment ledger
+    for [start, end), one window at a time. Each window's two streams are sorted by id and
+    diffed with diff_sorted(), so memory is bounded by the busiest window, not the whole range.
+
+    Succeeded PaymentIntents whose order is not marked completed are reported as
+    ('order_not_completed', id, processor_entry, None), checked with one query per window.
+
+    Yields:
+        tuple: (kind, payment_intent_id, processor_entry, ledger_entry) as from diff_sorted().
+    """
+    from orders.models import Order
+    for window_start, window_end in windows(start, end, window):
+        processor = sorted(processor_payments(stripe, window_start, window_end), key=itemgetter(0))
+        ledger = sorted(ledger_payments(window_start, window_end), key=itemgetter(0))
+        yield from diff_sorted(iter(processor), iter(ledger))
+
+        order_ids = {entry[2] for entry in processor if entry[2] and entry[2].isdigit()}
+        completed = set(
+            str(order_id) for order_id in
+            Order.objects.filter(id__in=order_ids, status='completed').values_list('id', flat=True)
+        )
+        for entry in processor:
+            if entry[2] not in completed:
+                yield 'order_not_completed', entry[0], entry, None
+
+
+def parse_day(value):
+    return datetime.strptime(value, '%Y-%m-%d').replace(tzinfo=dt_timezone.utc)
@@ -0,0 +1,45 @@
+import threading
+import stripe
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+
+# Configuring the stripe module swaps its global HTTP client, so do it once per process
+_configure_lock = threading.Lock()
+_configured = False
+
+
+def get_stripe():
+    """
+    Return the stripe module configured for use from request handlers.
+
+    All API calls share one requests.Session whose connection pool keeps TLS connections to
+    Stripe alive between calls, with connect/read timeouts and automatic network retries
+    (Stripe adds idempotency keys to retried POSTs, so retries never double-charge).
+    When STRIPE_API_BASE is set, calls go to that URL instead, e.g. the local stub started by
+    the run_stripe_stub management command.
+
+    Returns:
+        module: The configured stripe module.
+    """
+    global _configured
+    if not _configured:
+        with _configure_lock:
+            if not _configured:
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=1,
+                    pool_maxsize=settings.STRIPE_HTTP_POOL_SIZE,
+                )
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                stripe.default_http_client = stripe.RequestsClient(
+                    session=session,
+                    timeout=(settings.STRIPE_CONNECT_TIMEOUT, settings.STRIPE_READ_TIMEOUT),
+                )
+                stripe.max_network_retries = settings.STRIPE_MAX_NETWORK_RETRIES
+                stripe.api_key = settings.STRIPE_SECRET_KEY
+                if settings.STRIPE_API_BASE:
+                    stripe.api_base = settings.STRIPE_API_BASE
+                _configured = True
+    return stripe
@@ -0,0 +1,183 @@
+"""
+A minimal in-memory stand-in for the parts of the Stripe API the store uses, so checkout and
+the payment jobs can be exercised and load-tested without network access or a Stripe account.
+
+Point the app at it with STRIPE_API_BASE (see estore/settings.py) and start it with
+``python manage.py run_stripe_stub`` or, from tests and scripts, with start_stub_server().
+"""
+import json
+import re
+import secrets
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+
+def decode_form(body):
+    """
+    Decode Stripe's form encoding (``metadata[order_id]=5``) into nested dictionaries.
+    """
+    result = {}
+    for key, value in parse_qsl(body, keep_blank_values=True):
+        parts = re.findall(r'[^\[\]]+', key)
+        target = result
+        for part in parts[:-1]:
+            target = target.setdefault(part, {})
+        if parts:
+            target[parts[-1]] = value
+    return result
+
+
+class StripeStubState:
+    """
+    Objects created through the stub, plus the responses cached per Idempotency-Key.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.payment_intents = {}
+        self.idempotent_responses = {}
+
+    def new_id(self, prefix):
+        return f"{prefix}_stub{secrets.token_hex(12)}"
+
+    def create_payment_intent(self, params):
+        intent_id = self.new_id('pi')
+        intent = {
+            'id': intent_id,
+            'object': 'payment_intent',
+            'amount': int(params.get('amount', 0)),
+            'currency': params.get('currency', 'usd'),
+            'description': params.get('description'),
+            'metadata': params.get('metadata', {}),
+            'client_secret': f"{intent_id}_secret_{secrets.token_hex(12)}",
+            'status': 'requires_payment_method',
+            'created': int(time.time()),
+            'livemode': False,
+        }
+        self.payment_intents[intent_id] = intent
+        return intent
+
+    def list_objects(self, url, objects, params):
+        """
+        Page through objects newest first, honouring created[gte|gt|lte|lt], limit and
+        starting_after the way Stripe list endpoints do.
+        """
+        created = params.get('created', {})
+        bounds = {
+            'gte': lambda value, bound: value >= bound,
+            'gt': lambda value, bound: value > bound,
+            'lte': lambda value, bound: value <= bound,
+            'lt': lambda value, bound: value < bound,
+        }
+        selected = [
+            obj for obj in objects
+            if all(check(obj['created'], int(created[op])) for op, check in bounds.items() if op in created)
+        ]
+        selected.sort(key=lambda obj: (obj['created'], obj['id']), reverse=True)
+        starting_after = params.get('starting_after')
+        if starting_after:
+            ids = [obj['id'] for obj in selected]
+            selected = selected[ids.index(starting_after) + 1:] if starting_after in ids else []
+        limit = min(int(params.get('limit', 10)), 100)
+        return {'object': 'list', 'url': url, 'data': selected[:limit], 'has_more': len(selected) > limit}
+
+    def payment_method(self, payment_method_id):
+        return {
+            'id': payment_method_id,
+            'object': 'payment_method',
+            'type': 'card',
+            'card': {'brand': 'visa', 'last4': '4242', 'exp_month': 12, 'exp_year': 2030},
+            'customer': None,
+            'livemode': False,
+        }
+
+
+class StripeStubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # Keep-alive, like the real API
+    state = None  # Set on the per-server subclass created by make_server()
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.dispatch('GET')
+
+    def do_POST(self):
+        self.dispatch('POST')
+
+    def dispatch(self, method):
+        url = urlsplit(self.path)
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length).decode() if length else ''
+        params = decode_form(body if method == 'POST' else url.query)
+
+        idempotency_key = self.headers.get('Idempotency-Key') if method == 'POST' else None
+        with self.state.lock:
+            if idempotency_key and idempotency_key in self.state.idempotent_responses:
+                status, payload = self.state.idempotent_responses[idempotency_key]
+            else:
+                status, payload = self.route(method, url.path, params)
+                if idempotency_key:
+                    self.state.idempotent_responses[idempotency_key] = (status, payload)
+        self.respond(status, payload)
+
+    def route(self, method, path, params):
+        state = self.state
+        if method == 'POST' and path == '/v1/payment_intents':
+            return 200, state.create_payment_intent(params)
+
+        if method == 'GET' and path == '/v1/payment_intents':
+            return 200, state.list_objects('/v1/payment_intents', state.payment_intents.values(), params)
+
+        match = re.fullmatch(r'/v1/payment_intents/([^/]+)(/confirm|/cancel)?', path)
+        if match:
+            intent = state.payment_intents.get(match.group(1))
+            if intent is None:
+                return self.not_found('payment_intent', match.group(1))
+            if method == 'POST' and match.group(2) == '/confirm':
+                intent['status'] = 'succeeded'
+                intent['amount_received'] = intent['amount']
+            elif method == 'POST' and match.group(2) == '/cancel':
+                intent['status'] = 'canceled'
+            return 200, intent
+
+        match = re.fullmatch(r'/v1/payment_methods/([^/]+)(/detach)?', path)
+        if match:
+            return 200, state.payment_method(match.group(1))
+
+        return 404, {'error': {'type': 'invalid_request_error', 'message': f"Unrecognized request URL ({method}: {path})."}}
+
+    def not_found(self, object_name, object_id):
+        return 404, {'error': {'type': 'invalid_request_error', 'code': 'resource_missing', 'message': f"No such {object_name}: '{object_id}'"}}
+
+    def respond(self, status, payload):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.send_header('Request-Id', f"req_stub{secrets.token_hex(8)}")
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def make_server(host='127.0.0.1', port=12111):
+    """
+    Build a threaded stub server with its own empty state.
+    """
+    handler = type('BoundStripeStubHandler', (StripeStubHandler,), {'state': StripeStubState()})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def start_stub_server(host='127.0.0.1', port=0):
+    """
+    Run a stub server on a background thread, e.g. for tests or load-test fixtures.
+    Pass port=0 to pick a free port.
+
+    Returns:
+        tuple: (server, api_base) where api_base is the value to use for STRIPE_API_BASE.
+    """
+    server = make_server(host, port)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"http://{server.server_address[0]}:{server.server_address[1]}"
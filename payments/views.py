@@ -4,12 +4,12 @@ from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.http import HttpResponse
 from django.conf import settings
-import stripe
 import json
-from .models import SavedPaymentMethod
+from .models import SavedPaymentMethod, WebhookEvent
+from .stripe_client import get_stripe
 from orders.models import Order
 
-stripe.api_key = settings.STRIPE_SECRET_KEY
+stripe = get_stripe()
 
 @login_required
 def saved_payment_methods(request):
@@ -44,40 +44,10 @@ def stripe_webhook(request):
         # Invalid signature
         return HttpResponse(status=400)
 
-    # Handle the event
-    if event['type'] == 'payment_intent.succeeded':
-        payment_intent = event['data']['object']
-        order_id = payment_intent['metadata'].get('order_id')
-        try:
-            order = Order.objects.get(id=order_id)
-            order.status = 'completed'
-            order.save()
-            # Clear the cart and discount code after successful payment confirmation
-            from cart.views import get_cart
-            from promotions.models import DiscountCode
-            cart = get_cart(order.user)
-            cart.items.all().delete()
-            if order.discount_code:
-                try:
-                    discount = DiscountCode.objects.get(code=order.discount_code, is_active=True)
-                    from django.db.models import F
-                    from django.db import transaction
-                    with transaction.atomic():
-                        discount.times_used = F('times_used') + 1
-                        discount.save(update_fields=['times_used'])
-                        discount.refresh_from_db(fields=['times_used'])
-                except DiscountCode.DoesNotExist:
-                    pass
-        except Order.DoesNotExist:
-            pass
-    elif event['type'] == 'payment_intent.payment_failed':
-        payment_intent = event['data']['object']
-        order_id = payment_intent['metadata'].get('order_id')
-        try:
-            order = Order.objects.get(id=order_id)
-            order.status = 'failed'
-            order.save()
-        except Order.DoesNotExist:
-            pass
+    # Store the event and acknowledge immediately; process_webhook_events applies it.
+    # Redelivered events hit the unique event_id and are ignored.
+    WebhookEvent.objects.bulk_create([
+        WebhookEvent(event_id=event['id'], event_type=event['type'], payload=json.loads(payload))
+    ], ignore_conflicts=True)
 
     return HttpResponse(status=200)
@@ -0,0 +1,129 @@
+from django.db import transaction
+from django.db.models import F
+from orders.models import Order
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def handle_payment_intent_succeeded(event):
+    """
+    Mark the order as completed and clear the customer's cart. The discount code use and the
+    stock were reserved at checkout; they are only taken again if an earlier failure event
+    released them. Safe to run more than once for the same order.
+    """
+    from cart.models import CartItem
+    from orders.helpers import retake_order_stock
+    from promotions.models import DiscountCode
+    from analytics.segments import record_paid_order
+    order = _locked_order(event)
+    if order is None:
+        return
+    record_payment(order, event, 'completed')
+    if order.status == 'completed':
+        return
+    if order.status in ('failed', 'cancelled') and order.discount_id:
+        # The customer paid after a failure or cancellation; honour the code even if that goes past its limit
+        DiscountCode.objects.filter(pk=order.discount_id).update(times_used=F('times_used') + 1)
+    if order.status in ('failed', 'cancelled'):
+        retake_order_stock(order)
+    order.status = 'completed'
+    order.save(update_fields=['status', 'updated_at'])
+    # Paid orders move the customer's segment right away instead of at the next update_user_segments run
+    record_paid_order(order)
+    # Clear the cart after successful payment confirmation
+    CartItem.objects.filter(cart__user_id=order.user_id).delete()
+
+
+def handle_payment_intent_failed(event):
+    """
+    Mark the order as failed and give back its stock and discount code use. The customer may
+    still retry with the same PaymentIntent; handle_payment_intent_succeeded takes them again.
+    """
+    from orders.helpers import release_discount_redemption, release_order_stock
+    order = _locked_order(event)
+    if order is None:
+        return
+    record_payment(order, event, 'failed')
+    if order.status in ('completed', 'failed', 'cancelled'):
+        return
+    order.status = 'failed'
+    order.save(update_fields=['status', 'updated_at'])
+    release_order_stock(order)
+    release_discount_redemption(order)
+
+
+def handle_payment_intent_canceled(event):
+    """
+    Cancel the order of a PaymentIntent that was canceled at Stripe (it can no longer be paid)
+    and give back its stock and discount code use. No ledger entry is written, as no money moved.
+    """
+    from orders.helpers import cancel_order
+    order = _locked_order(event)
+    if order is None or order.status not in ('pending', 'failed'):
+        return
+    cancel_order(order)
+
+
+def record_payment(order, event, status):
+    """
+    Append a ledger entry for a PaymentIntent event. The entry is keyed by the Stripe event id,
+    so recording the same event twice leaves a single row.
+    """
+    from payments.models import Payment
+    payment_intent = event['data']['object']
+    amount_cents = payment_intent.get('amount_received') or payment_intent.get('amount') or 0
+    created = payment_intent.get('created')
+    Payment.objects.get_or_create(
+        event_id=event['id'],
+        defaults={
+            'order': order,
+            'amount': Decimal(amount_cents) / 100,
+            'currency': payment_intent.get('currency', 'usd'),
+            'status': status,
+            'transaction_id': payment_intent['id'],
+            'processor_created_at': datetime.fromtimestamp(created, tz=dt_timezone.utc) if created else None,
+        }
+    )
+
+
+EVENT_HANDLERS = {
+    'payment_intent.succeeded': handle_payment_intent_succeeded,
+    'payment_intent.payment_failed': handle_payment_intent_failed,
+    'payment_intent.canceled': handle_payment_intent_canceled,
+}
+
+
+def process_event(event):
+    """
+    Apply a stored webhook event. Event types without a handler are accepted and ignored.
+
+    Args:
+        event (WebhookEvent): The inbox row to process.
+
+    Returns:
+        bool: True if a handler ran for the event type.
+    """
+    handler = EVENT_HANDLERS.get(event.event_type)
+    if handler is None:
+        return False
+    with transaction.atomic():
+        handler(event.payload)
+    return True
+
+
+def _locked_order(event):
+    """
+    Fetch the order referenced by a PaymentIntent event, locking its row so that events for
+    the same order handled by concurrent workers are applied one at a time.
+    """
+    payment_intent = event['data']['object']
+    order_id = payment_intent.get('metadata', {}).get('order_id')
+    if not order_id:
+        return None
+    order = Order.objects.select_for_update().filter(id=order_id).first()
+    if order is None:
+        logger.warning(f"Webhook {event.get('id')} references unknown order {order_id}")
+    return order
@@ -0,0 +1,96 @@
+# Generated by Django 5.2.3 on 2026-10-19 11:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0004_variant'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Supplier',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200)),
+                ('contact_email', models.EmailField(blank=True, max_length=254)),
+                ('phone_number', models.CharField(blank=True, max_length=20)),
+                ('api_endpoint', models.URLField(blank=True, help_text='API endpoint for automated ordering, if available')),
+                ('api_key', models.CharField(blank=True, help_text='API key for supplier integration, if applicable', max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Suppliers',
+            },
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='auto_reorder_enabled',
+            field=models.BooleanField(default=False, help_text='Enable automatic reordering with supplier'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='low_stock_threshold',
+            field=models.PositiveIntegerField(default=5, help_text='Stock level at which a low stock alert is triggered'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='reorder_quantity',
+            field=models.PositiveIntegerField(default=10, help_text='Default quantity to reorder when stock is low'),
+        ),
+        migrations.AddField(
+            model_name='productview',
+            name='duration',
+            field=models.PositiveIntegerField(default=0, help_text='Duration of interaction in seconds, if applicable'),
+        ),
+        migrations.AddField(
+            model_name='productview',
+            name='interaction_type',
+            field=models.CharField(choices=[('view', 'View'), ('click', 'Click'), ('hover', 'Hover'), ('add_to_cart', 'Add to Cart')], default='view', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='variant',
+            name='low_stock_threshold',
+            field=models.PositiveIntegerField(default=5, help_text='Stock level at which a low stock alert is triggered'),
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='price',
+            field=models.DecimalField(db_index=True, decimal_places=2, max_digits=10),
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='stock',
+            field=models.PositiveIntegerField(db_index=True, default=0),
+        ),
+        migrations.AlterField(
+            model_name='variant',
+            name='stock',
+            field=models.PositiveIntegerField(db_index=True, default=0),
+        ),
+        migrations.CreateModel(
+            name='StockAlert',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('alert_type', models.CharField(choices=[('product', 'Product'), ('variant', 'Variant')], max_length=20)),
+                ('stock_level', models.PositiveIntegerField(help_text='Stock level at the time of alert')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('resolved', 'Resolved')], default='pending', max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('product', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='stock_alerts', to='products.product')),
+                ('variant', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='stock_alerts', to='products.variant')),
+            ],
+            options={
+                'verbose_name_plural': 'Stock Alerts',
+            },
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='supplier',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='products', to='products.supplier'),
+        ),
+    ]
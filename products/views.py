@@ -5,6 +5,7 @@ from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from django.shortcuts import redirect
 from django.http import JsonResponse
 from products.recommendations import get_personalized_recommendations, get_popular_products # type: ignore
+from promotions.engine import effective_price, effective_prices
 
 REVIEW_DISPLAY_LIMIT = 10  # Number of reviews to display per product
 
@@ -64,8 +65,16 @@ def product_list(request):
         # If page is out of range, deliver last page of results
         products = paginator.page(paginator.num_pages)
     
+    # Attach promotion/sale prices to the products on this page
+    prices = effective_prices(products)
+    for product in products:
+        product.effective_price = prices[product.id]
+    
     # Get popular products for display on the list page
-    popular_products = get_popular_products(limit=5)
+    popular_products = list(get_popular_products(limit=5))
+    popular_prices = effective_prices(popular_products)
+    for product in popular_products:
+        product.effective_price = popular_prices[product.id]
     
     context = {
         'products': products,
@@ -95,6 +104,7 @@ def product_detail(request, pk):
     """
     from accounts.models import Wishlist, WishlistItem
     product = get_object_or_404(Product.objects.select_related('category', 'supplier').prefetch_related('reviews', 'variants'), pk=pk)
+    product.effective_price = effective_price(product)
 
     # Record product view using helper
     record_product_view(product, request.user)
@@ -102,12 +112,15 @@ def product_detail(request, pk):
     # Get personalized recommendations for the user with A/B testing
     from products.recommendations import get_ml_recommendations, get_session_recommendations, get_personalized_recommendations
     from analytics.models import RecommendationInteraction
+    from analytics.session_data import get_tracking_value, set_tracking_value, AB_GROUP
     import random
 
-    # A/B Testing logic: Alternate between strategies for comparison
-    test_group = random.choice(['ml', 'session', 'personalized'])
-    request.session['recommendation_test_group'] = test_group
-    request.session.modified = True
+    # A/B Testing logic: each session is assigned a strategy once and keeps it, so product views
+    # after the first do not rewrite the session
+    test_group = get_tracking_value(request.session, AB_GROUP)
+    if test_group not in ('ml', 'session', 'personalized'):
+        test_group = random.choice(['ml', 'session', 'personalized'])
+        set_tracking_value(request.session, AB_GROUP, test_group)
 
     if test_group == 'ml':
         recommendations = get_ml_recommendations(request.user, limit=5)
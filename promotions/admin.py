@@ -3,8 +3,8 @@ from .models import Promotion, DiscountCode, SaleEvent
 
 @admin.register(Promotion)
 class PromotionAdmin(admin.ModelAdmin):
-    list_display = ('name', 'promotion_type', 'value', 'start_date', 'end_date', 'is_active')
-    list_filter = ('promotion_type', 'is_active', 'start_date', 'end_date')
+    list_display = ('name', 'promotion_type', 'value', 'start_date', 'end_date', 'is_active', 'auto_schedule')
+    list_filter = ('promotion_type', 'is_active', 'auto_schedule', 'start_date', 'end_date')
     search_fields = ('name', 'description')
     date_hierarchy = 'start_date'
 
@@ -17,7 +17,7 @@ class DiscountCodeAdmin(admin.ModelAdmin):
 
 @admin.register(SaleEvent)
 class SaleEventAdmin(admin.ModelAdmin):
-    list_display = ('name', 'discount_percentage', 'start_date', 'end_date', 'is_active')
-    list_filter = ('is_active', 'start_date', 'end_date')
+    list_display = ('name', 'discount_percentage', 'start_date', 'end_date', 'is_active', 'auto_schedule')
+    list_filter = ('is_active', 'auto_schedule', 'start_date', 'end_date')
     search_fields = ('name', 'description')
     date_hierarchy = 'start_date'
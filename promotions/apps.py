@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class PromotionsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'promotions'
+    
+    def ready(self):
+        import promotions.signals  # Invalidate compiled promotion prices when promotions change
@@ -0,0 +1,147 @@
+"""
+Bloom filters for discount codes.
+
+BloomFilter is a plain in-memory filter, used by generate_discount_codes to avoid
+duplicate codes. The Redis copy, stored under redis_key(), sits in front of
+apply_discount_code: a code the filter has never seen cannot exist, so a guessed code
+is rejected without a database query.
+
+Bits are numbered most-significant-bit first within each byte. This is the same order
+as Redis SETBIT/GETBIT offsets, so an in-memory filter can be uploaded to Redis as a
+single string.
+
+Lookups fail open. If the Redis key does not exist yet, or Redis is unreachable,
+every code is reported as possibly present and the database decides.
+"""
+from hashlib import blake2b
+import logging
+import math
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+def filter_parameters(capacity, error_rate):
+    """
+    Size a filter for capacity items at the given false positive rate.
+
+    Returns:
+        tuple: (number of bits, number of hash functions)
+    """
+    size = max(8, int(math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2))))
+    hashes = max(1, int(round(size / capacity * math.log(2))))
+    return size, hashes
+
+
+def bit_positions(value, size, hashes):
+    """
+    The bit positions for value, using double hashing over one 128-bit BLAKE2b digest.
+    """
+    digest = blake2b(value.encode(), digest_size=16).digest()
+    h1 = int.from_bytes(digest[:8], 'big')
+    h2 = int.from_bytes(digest[8:], 'big') | 1
+    return [(h1 + i * h2) % size for i in range(hashes)]
+
+
+class BloomFilter:
+    def __init__(self, size, hashes):
+        self.size = size
+        self.hashes = hashes
+        self.bits = bytearray((size + 7) // 8)
+
+    @classmethod
+    def for_capacity(cls, capacity, error_rate=0.001):
+        return cls(*filter_parameters(capacity, error_rate))
+
+    def add(self, value):
+        for position in bit_positions(value, self.size, self.hashes):
+            self.bits[position >> 3] |= 0x80 >> (position & 7)
+
+    def __contains__(self, value):
+        return all(
+            self.bits[position >> 3] & (0x80 >> (position & 7))
+            for position in bit_positions(value, self.size, self.hashes)
+        )
+
+
+def redis_parameters():
+    return filter_parameters(settings.DISCOUNT_CODE_BLOOM_CAPACITY, settings.DISCOUNT_CODE_BLOOM_ERROR_RATE)
+
+
+def redis_key():
+    # The parameters are part of the key so processes with different settings never read each other's bits
+    size, hashes = redis_parameters()
+    return f"promotions:discount_code_bloom:{size}:{hashes}"
+
+
+def _redis():
+    from django_redis import get_redis_connection
+    return get_redis_connection("default")
+
+
+def code_may_exist(code):
+    """
+    Check a discount code against the Redis filter.
+
+    Returns:
+        bool: False only if the code is definitely not a discount code.
+    """
+    size, hashes = redis_parameters()
+    key = redis_key()
+    try:
+        pipe = _redis().pipeline(transaction=False)
+        pipe.exists(key)
+        for position in bit_positions(code, size, hashes):
+            pipe.getbit(key, position)
+        exists, *bits = pipe.execute()
+    except Exception as e:
+        logger.warning(f"Discount code bloom filter unavailable, falling back to the database: {str(e)}")
+        return True
+    return not exists or all(bits)
+
+
+def add_codes(codes):
+    """
+    Add codes to the Redis filter if it has been built. Returns False if there is no filter to add to.
+    """
+    size, hashes = redis_parameters()
+    key = redis_key()
+    try:
+        conn = _redis()
+        if not conn.exists(key):
+            return False
+        pipe = conn.pipeline(transaction=False)
+        for code in codes:
+            for position in bit_positions(code, size, hashes):
+                pipe.setbit(key, position, 1)
+        pipe.execute()
+        return True
+    except Exception as e:
+        logger.warning(f"Could not add discount codes to the bloom filter: {str(e)}")
+        return False
+
+
+def rebuild():
+    """
+    Build the Redis filter from every discount code in the database and swap it in atomically.
+    Codes created while the table is being read are added again once the new filter is live,
+    so none of them can be missing from it.
+
+    Returns:
+        int: The number of codes added.
+    """
+    from django.utils import timezone
+    from promotions.models import DiscountCode
+    started = timezone.now()
+    local = BloomFilter(*redis_parameters())
+    count = 0
+    for code in DiscountCode.objects.values_list('code', flat=True).iterator(chunk_size=10000):
+        local.add(code)
+        count += 1
+    conn = _redis()
+    key = redis_key()
+    conn.set(f"{key}:building", bytes(local.bits))
+    conn.rename(f"{key}:building", key)
+    add_codes(DiscountCode.objects.filter(created_at__gte=started).values_list('code', flat=True))
+    return count
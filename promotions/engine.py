@@ -0,0 +1,234 @@
+"""
+Effective prices from the currently running promotions and sale events.
+
+Rather than querying each product's promotions on every request, all running
+percentage/fixed-amount Promotions and SaleEvents are compiled into two dictionaries,
+keyed by product id and by category id. A price lookup is then a couple of dictionary
+reads per product.
+
+Each process keeps its compiled snapshot until one of these happens:
+  * the shared version number in the cache changes. promotions.signals bumps it
+    whenever a promotion, a sale event or one of their product/category links changes.
+    Each process reads it at most once every VERSION_CHECK_INTERVAL seconds, so pricing
+    a cart line by line costs no cache round trip per line.
+  * the next start_date/end_date boundary passes, so that promotions switch on and off
+    on time without anyone editing them.
+"""
+from collections import defaultdict
+from decimal import Decimal, ROUND_HALF_UP
+import threading
+import time
+
+from django.core.cache import cache
+from django.utils import timezone
+
+VERSION_CACHE_KEY = 'promotions:engine:version'
+ACTIVE_SET_CACHE_KEY = 'promotions:active_set:{version}'
+ACTIVE_SET_MAX_TIMEOUT = 60 * 60 * 24
+# Seconds a process reuses the version it last read from the cache; another process's change to the
+# promotions reaches this one's prices at most this much later
+VERSION_CHECK_INTERVAL = 1.0
+
+# Promotion types that change a product's unit price. BOGO and free shipping apply at cart level.
+PRICED_PROMOTION_TYPES = ('percentage', 'fixed_amount')
+
+_lock = threading.Lock()
+_engine = None
+# (version, time.monotonic() it was read at) of the last cache read
+_checked_version = None
+
+
+class CompiledPromotions:
+    """
+    Immutable lookup structure built by compile_promotions().
+
+    Attributes:
+        by_product (dict): product_id -> tuple of (kind, value) rules.
+        by_category (dict): category_id -> tuple of (kind, value) rules.
+        valid_until (datetime or None): The next start/end boundary, after which the snapshot is stale.
+        version (int): The cache version the snapshot was compiled against.
+    """
+    def __init__(self, by_product, by_category, valid_until, version):
+        self.by_product = by_product
+        self.by_category = by_category
+        self.valid_until = valid_until
+        self.version = version
+
+    def is_current(self, now, version):
+        return version == self.version and (self.valid_until is None or now < self.valid_until)
+
+    def rules_for(self, product_id, category_id):
+        return self.by_product.get(product_id, ()) + self.by_category.get(category_id, ())
+
+    def price(self, base_price, product_id, category_id):
+        """
+        Apply the best single rule for the product to base_price. Rules do not stack; the
+        customer gets whichever promotion or sale gives the lowest price.
+        """
+        base_price = Decimal(base_price)
+        best = base_price
+        for kind, value in self.rules_for(product_id, category_id):
+            if kind == 'percentage':
+                candidate = base_price * (Decimal('100') - value) / Decimal('100')
+            else:  # fixed_amount
+                candidate = base_price - value
+            if candidate < best:
+                best = candidate
+        best = max(best, Decimal('0.00'))
+        return best.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+
+
+def current_version():
+    global _checked_version
+    checked = _checked_version
+    now = time.monotonic()
+    if checked is not None and now - checked[1] < VERSION_CHECK_INTERVAL:
+        return checked[0]
+    version = cache.get(VERSION_CACHE_KEY, 0)
+    _checked_version = (version, now)
+    return version
+
+
+def bump_version():
+    """
+    Invalidate every process's compiled snapshot.
+    """
+    global _checked_version
+    if not cache.add(VERSION_CACHE_KEY, 1, timeout=None):
+        try:
+            cache.incr(VERSION_CACHE_KEY)
+        except ValueError:
+            # The key expired between add() and incr()
+            cache.set(VERSION_CACHE_KEY, 1, timeout=None)
+    # This process sees the new version at once rather than after VERSION_CHECK_INTERVAL
+    _checked_version = None
+
+
+def active_promotions():
+    """
+    The running Promotions and SaleEvents, for display. The set is computed once and shared through
+    the cache until the next start/end boundary, or until the version changes because a promotion
+    was edited or sync_promotion_schedule switched one on or off.
+
+    Returns:
+        tuple: (list of Promotion, list of SaleEvent)
+    """
+    from promotions.models import Promotion, SaleEvent
+    key = ACTIVE_SET_CACHE_KEY.format(version=current_version())
+    active = cache.get(key)
+    if active is not None:
+        return active
+
+    now = timezone.now()
+    active, boundaries = [], []
+    for model in (Promotion, SaleEvent):
+        running = []
+        for obj in model.objects.filter(end_date__gte=now):
+            if obj.start_date > now:
+                boundaries.append(obj.start_date)
+                continue
+            boundaries.append(obj.end_date)
+            if obj.is_active:
+                running.append(obj)
+        active.append(running)
+    active = tuple(active)
+
+    timeout = ACTIVE_SET_MAX_TIMEOUT
+    if boundaries:
+        timeout = min(timeout, max(1, int((min(boundaries) - now).total_seconds())))
+    cache.set(key, active, timeout)
+    return active
+
+
+def compile_promotions(now=None, version=0):
+    """
+    Load the running price-changing promotions and sale events with their product and category
+    links (six queries regardless of how many there are) and build a CompiledPromotions.
+    """
+    from promotions.models import Promotion, SaleEvent
+    now = now or timezone.now()
+    by_product = defaultdict(list)
+    by_category = defaultdict(list)
+    boundaries = []
+
+    sources = (
+        (
+            Promotion.objects.filter(is_active=True, promotion_type__in=PRICED_PROMOTION_TYPES, minimum_purchase__lte=0, end_date__gte=now)
+            .only('id', 'start_date', 'end_date', 'promotion_type', 'value'),
+            'promotion_id',
+            lambda promotion: (promotion.promotion_type, promotion.value),
+        ),
+        (
+            SaleEvent.objects.filter(is_active=True, end_date__gte=now)
+            .only('id', 'start_date', 'end_date', 'discount_percentage'),
+            'saleevent_id',
+            lambda sale: ('percentage', sale.discount_percentage),
+        ),
+    )
+    for queryset, source_column, to_rule in sources:
+        running = {}
+        for obj in queryset:
+            if obj.start_date > now:
+                boundaries.append(obj.start_date)
+                continue
+            boundaries.append(obj.end_date)
+            running[obj.id] = to_rule(obj)
+        if not running:
+            continue
+        model = queryset.model
+        for target, through, target_column in (
+            (by_product, model.products.through, 'product_id'),
+            (by_category, model.categories.through, 'category_id'),
+        ):
+            links = through.objects.filter(**{f"{source_column}__in": running}).values_list(source_column, target_column)
+            for source_id, target_id in links:
+                target[target_id].append(running[source_id])
+
+    return CompiledPromotions(
+        {key: tuple(rules) for key, rules in by_product.items()},
+        {key: tuple(rules) for key, rules in by_category.items()},
+        min(boundaries) if boundaries else None,
+        version,
+    )
+
+
+def get_engine():
+    """
+    Return this process's compiled promotions, recompiling if they are stale.
+    """
+    global _engine
+    now = timezone.now()
+    version = current_version()
+    engine = _engine
+    if engine is not None and engine.is_current(now, version):
+        return engine
+    with _lock:
+        if _engine is None or not _engine.is_current(now, version):
+            _engine = compile_promotions(now, version)
+        return _engine
+
+
+def effective_price(product, variant=None):
+    """
+    The price a customer sees for a product, or for one of its variants, after promotions and sales.
+
+    Args:
+        product (Product): The product.
+        variant (Variant, optional): A variant of the product. Its price adjustment is applied first.
+
+    Returns:
+        Decimal: The discounted unit price, or the regular price when nothing applies.
+    """
+    base_price = variant.total_price if variant is not None else product.price
+    return get_engine().price(base_price, product.id, product.category_id)
+
+
+def effective_prices(products):
+    """
+    Bulk version of effective_price() for list pages: one staleness check for the whole batch.
+
+    Returns:
+        dict: product_id -> discounted unit price.
+    """
+    engine = get_engine()
+    return {product.id: engine.price(product.price, product.id, product.category_id) for product in products}
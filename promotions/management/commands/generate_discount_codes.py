@@ -0,0 +1,128 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from datetime import datetime, timedelta
+from decimal import Decimal
+from promotions.models import DiscountCode
+from promotions import bloom
+import logging
+import random
+import time
+
+logger = logging.getLogger(__name__)
+
+# No 0/O, 1/I/L: codes are read off emails and receipts and typed in by hand
+DEFAULT_ALPHABET = 'ABCDEFGHJKMNPQRSTUVWXYZ23456789'
+
+class Command(BaseCommand):
+    help = 'Generates large numbers of unique single-use discount codes for a campaign.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('count', type=int, help='Number of codes to create')
+        parser.add_argument('--discount-type', choices=['percentage', 'fixed_amount'], required=True)
+        parser.add_argument('--discount-value', type=Decimal, required=True)
+        parser.add_argument('--length', type=int, default=10, help='Random characters per code, excluding the prefix (default: 10)')
+        parser.add_argument('--alphabet', default=DEFAULT_ALPHABET, help=f'Characters codes are drawn from (default: {DEFAULT_ALPHABET})')
+        parser.add_argument('--prefix', default='', help='Fixed prefix for every code, e.g. a campaign tag')
+        parser.add_argument('--start', help='First valid day, YYYY-MM-DD (default: now)')
+        parser.add_argument('--end', help='Last valid day, YYYY-MM-DD (default: 30 days from the start)')
+        parser.add_argument('--usage-limit', type=int, default=1, help='Uses allowed per code (default: 1)')
+        parser.add_argument('--minimum-purchase', type=Decimal, default=Decimal('0.00'))
+        parser.add_argument('--description', default='')
+        parser.add_argument('--inactive', action='store_true', help='Create the codes deactivated')
+        parser.add_argument('--batch-size', type=int, default=10000, help='Codes inserted per transaction (default: 10000)')
+        parser.add_argument('--output', help='Write the created codes to this file, one per line')
+
+    def handle(self, *args, **options):
+        """
+        Draw random codes from a CSPRNG and drop candidates already seen, using an in-memory Bloom
+        filter that is pre-loaded with every existing code. Each batch is checked against the
+        database once more and written with bulk_create(ignore_conflicts=True), so codes created
+        concurrently elsewhere can never be duplicated. The Redis Bloom filter used by the apply
+        discount view is updated batch by batch. Codes dropped as conflicts are not counted and are
+        replaced by the next batch.
+        """
+        count, alphabet, length, prefix = options['count'], options['alphabet'], options['length'], options['prefix']
+        if count < 1:
+            raise CommandError('count must be at least 1.')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1.')
+        if len(set(alphabet)) != len(alphabet) or len(alphabet) < 2:
+            raise CommandError('--alphabet must contain at least two distinct characters.')
+        max_length = DiscountCode._meta.get_field('code').max_length
+        if len(prefix) + length > max_length:
+            raise CommandError(f"Codes would be longer than {max_length} characters.")
+        # Keep the keyspace sparse so codes cannot be guessed and random draws rarely collide
+        if len(alphabet) ** length < count * 1000:
+            raise CommandError('The alphabet and length allow too few codes for this count; increase --length.')
+
+        start_date = self.parse_date(options['start']) if options['start'] else timezone.now()
+        end_date = self.parse_date(options['end']) + timedelta(days=1) - timedelta(microseconds=1) if options['end'] else start_date + timedelta(days=30)
+
+        existing = DiscountCode.objects.count()
+        seen = bloom.BloomFilter.for_capacity(existing + count)
+        for code in DiscountCode.objects.values_list('code', flat=True).iterator(chunk_size=10000):
+            seen.add(code)
+
+        rng = random.SystemRandom()
+        output = open(options['output'], 'w') if options['output'] else None
+        created = 0
+        bloom_updated = True
+        started = time.monotonic()
+        try:
+            while created < count:
+                batch = []
+                while len(batch) < min(options['batch_size'], count - created):
+                    code = prefix + ''.join(rng.choices(alphabet, k=length))
+                    if code in seen:
+                        continue
+                    seen.add(code)
+                    batch.append(code)
+
+                with transaction.atomic():
+                    taken = set(DiscountCode.objects.filter(code__in=batch).values_list('code', flat=True))
+                    batch = [code for code in batch if code not in taken]
+                    batch_started = timezone.now()
+                    DiscountCode.objects.bulk_create([
+                        DiscountCode(
+                            code=code,
+                            description=options['description'],
+                            discount_type=options['discount_type'],
+                            discount_value=options['discount_value'],
+                            start_date=start_date,
+                            end_date=end_date,
+                            is_active=not options['inactive'],
+                            usage_limit=options['usage_limit'],
+                            minimum_purchase=options['minimum_purchase'],
+                        )
+                        for code in batch
+                    ], ignore_conflicts=True)
+                    # ignore_conflicts drops codes inserted concurrently since the check above without
+                    # saying which; only the rows this batch created count
+                    inserted = set(DiscountCode.objects.filter(
+                        code__in=batch, created_at__gte=batch_started
+                    ).values_list('code', flat=True))
+                    batch = [code for code in batch if code in inserted]
+
+                bloom_updated = bloom.add_codes(batch) and bloom_updated
+                if output:
+                    output.writelines(f"{code}\n" for code in batch)
+                created += len(batch)
+                self.stdout.write(f"Created {created}/{count} codes...")
+        finally:
+            if output:
+                output.close()
+
+        elapsed = time.monotonic() - started
+        rate = f" ({created / elapsed:.0f} codes/sec)" if elapsed > 0 else ''
+        self.stdout.write(self.style.SUCCESS(f"Created {created} discount codes in {elapsed:.1f}s{rate}."))
+        if not bloom_updated:
+            self.stdout.write(self.style.WARNING(
+                "The discount code Bloom filter was not updated; run python manage.py rebuild_discount_code_bloom."
+            ))
+
+    def parse_date(self, value):
+        try:
+            return timezone.make_aware(datetime.strptime(value, '%Y-%m-%d'))
+        except ValueError:
+            raise CommandError(f"Invalid date '{value}', expected YYYY-MM-DD.")
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from promotions import bloom
+import time
+
+class Command(BaseCommand):
+    help = 'Rebuilds the Redis Bloom filter that rejects unknown discount codes without a database lookup.'
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        count = bloom.rebuild()
+        size, hashes = bloom.redis_parameters()
+        self.stdout.write(self.style.SUCCESS(
+            f"Loaded {count} discount codes into {bloom.redis_key()} "
+            f"({size // 8 // 1024} KB, {hashes} hashes) in {time.monotonic() - started:.1f}s."
+        ))
@@ -0,0 +1,59 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+from datetime import timedelta
+from promotions.models import Promotion, SaleEvent
+from promotions.engine import bump_version
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Switches scheduled promotions and sale events on at their start date and off after their end date.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep running, waking up at each start/end boundary')
+        parser.add_argument('--max-sleep', type=float, default=60.0, help='Longest wait between checks in --loop mode, so edits are picked up (default: 60)')
+
+    def handle(self, *args, **options):
+        """
+        Bring is_active in line with the schedule for every row with auto_schedule set, then publish
+        a promotions version bump if anything changed so the compiled prices and the cached active
+        set are rebuilt everywhere. In --loop mode the command sleeps until the next boundary.
+        """
+        while True:
+            now = timezone.now()
+            changed = self.sync(now)
+            if changed:
+                bump_version()
+                self.stdout.write(self.style.SUCCESS(f"{now:%Y-%m-%d %H:%M:%S}: switched {changed} promotions/sale events."))
+            if not options['loop']:
+                if not changed:
+                    self.stdout.write('Promotion schedule is up to date.')
+                break
+            time.sleep(self.seconds_until_next_boundary(now, options['max_sleep']))
+
+    def sync(self, now):
+        changed = 0
+        for model in (Promotion, SaleEvent):
+            scheduled = model.objects.filter(auto_schedule=True)
+            # end_date is inclusive, matching the date filters used by the views
+            changed += scheduled.filter(is_active=False, start_date__lte=now, end_date__gte=now).update(is_active=True, updated_at=now)
+            changed += scheduled.filter(Q(start_date__gt=now) | Q(end_date__lt=now), is_active=True).update(is_active=False, updated_at=now)
+        return changed
+
+    def seconds_until_next_boundary(self, now, max_sleep):
+        boundaries = []
+        for model in (Promotion, SaleEvent):
+            scheduled = model.objects.filter(auto_schedule=True)
+            next_start = scheduled.filter(start_date__gt=now).order_by('start_date').values_list('start_date', flat=True).first()
+            next_end = scheduled.filter(end_date__gte=now).order_by('end_date').values_list('end_date', flat=True).first()
+            if next_start:
+                boundaries.append(next_start)
+            if next_end:
+                # Promotions stop just after their end date
+                boundaries.append(next_end + timedelta(microseconds=1))
+        if not boundaries:
+            return max_sleep
+        return min(max_sleep, max(0.0, (min(boundaries) - timezone.now()).total_seconds()))
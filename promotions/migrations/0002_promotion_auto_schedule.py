@@ -0,0 +1,35 @@
+# Generated by Django 5.2.3 on 2026-10-19 11:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('promotions', '0001_initial'),
+    ]
+
+    # Existing rows are added with auto_schedule off, so sync_promotion_schedule leaves the is_active an
+    # admin has set on them alone; only rows created from now on default to the schedule.
+    operations = [
+        migrations.AddField(
+            model_name='promotion',
+            name='auto_schedule',
+            field=models.BooleanField(default=False, help_text='Let sync_promotion_schedule switch is_active on at start_date and off after end_date'),
+        ),
+        migrations.AddField(
+            model_name='saleevent',
+            name='auto_schedule',
+            field=models.BooleanField(default=False, help_text='Let sync_promotion_schedule switch is_active on at start_date and off after end_date'),
+        ),
+        migrations.AlterField(
+            model_name='promotion',
+            name='auto_schedule',
+            field=models.BooleanField(default=True, help_text='Let sync_promotion_schedule switch is_active on at start_date and off after end_date'),
+        ),
+        migrations.AlterField(
+            model_name='saleevent',
+            name='auto_schedule',
+            field=models.BooleanField(default=True, help_text='Let sync_promotion_schedule switch is_active on at start_date and off after end_date'),
+        ),
+    ]
@@ -16,6 +16,7 @@ class Promotion(models.Model):
     start_date = models.DateTimeField()
     end_date = models.DateTimeField()
     is_active = models.BooleanField(default=False)
+    auto_schedule = models.BooleanField(default=True, help_text="Let sync_promotion_schedule switch is_active on at start_date and off after end_date")
     minimum_purchase = models.DecimalField(max_digits=10, decimal_places=2, default=0.00, help_text="Minimum purchase amount for promotion to apply")
     products = models.ManyToManyField(Product, related_name='promotions', blank=True)
     categories = models.ManyToManyField(Category, related_name='promotions', blank=True)
@@ -54,6 +55,7 @@ class SaleEvent(models.Model):
     start_date = models.DateTimeField()
     end_date = models.DateTimeField()
     is_active = models.BooleanField(default=False)
+    auto_schedule = models.BooleanField(default=True, help_text="Let sync_promotion_schedule switch is_active on at start_date and off after end_date")
     discount_percentage = models.DecimalField(max_digits=5, decimal_places=2, default=0.00)
     products = models.ManyToManyField(Product, related_name='sale_events', blank=True)
     categories = models.ManyToManyField(Category, related_name='sale_events', blank=True)
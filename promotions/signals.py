@@ -0,0 +1,31 @@
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+from .models import Promotion, SaleEvent, DiscountCode
+from .engine import bump_version
+from . import bloom
+
+
+@receiver(post_save, sender=Promotion)
+@receiver(post_delete, sender=Promotion)
+@receiver(post_save, sender=SaleEvent)
+@receiver(post_delete, sender=SaleEvent)
+def invalidate_compiled_promotions(sender, **kwargs):
+    """
+    Make every process recompile its promotion price lookups after a promotion or sale event changes.
+    """
+    bump_version()
+
+
+@receiver(m2m_changed, sender=Promotion.products.through)
+@receiver(m2m_changed, sender=Promotion.categories.through)
+@receiver(m2m_changed, sender=SaleEvent.products.through)
+@receiver(m2m_changed, sender=SaleEvent.categories.through)
+def invalidate_compiled_promotions_on_links(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        bump_version()
+
+
+@receiver(post_save, sender=DiscountCode)
+def add_discount_code_to_bloom(sender, instance, **kwargs):
+    # bulk_create() skips this signal; generate_discount_codes adds its codes itself
+    bloom.add_codes([instance.code])
@@ -3,6 +3,8 @@ from django.contrib import messages
 from django.utils import timezone
 from django.http import JsonResponse
 from .models import Promotion, DiscountCode, SaleEvent
+from .bloom import code_may_exist
+from .engine import active_promotions
 from cart.models import Cart
 
 def apply_discount_code(request):
@@ -12,6 +14,11 @@ def apply_discount_code(request):
             messages.error(request, "Please enter a discount code.")
             return redirect('cart_detail')
         
+        # Most guessed codes are rejected here without a database query
+        if not code_may_exist(code):
+            messages.error(request, "Invalid discount code.")
+            return redirect('cart_detail')
+        
         try:
             discount = DiscountCode.objects.get(code=code, is_active=True)
             now = timezone.now()
@@ -37,9 +44,8 @@ def apply_discount_code(request):
     return redirect('cart_detail')
 
 def current_promotions(request):
-    now = timezone.now()
-    promotions = Promotion.objects.filter(is_active=True, start_date__lte=now, end_date__gte=now)
-    sales = SaleEvent.objects.filter(is_active=True, start_date__lte=now, end_date__gte=now)
+    # Cached until the next start/end boundary or promotion change, see promotions.engine
+    promotions, sales = active_promotions()
     
     context = {
         'promotions': promotions,
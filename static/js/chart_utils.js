@@ -43,3 +43,43 @@ function createDataset(label, data, borderColor, backgroundColor, additionalConf
         ...additionalConfig
     };
 }
+
+/**
+ * Fetch one daily metric from the analytics time series API.
+ * @param {string} metric - The metric name, e.g. 'sales.total_revenue'.
+ * @param {Object} params - Optional start and end (YYYY-MM-DD) and points (downsample to at most this many points).
+ * @returns {Promise<Object>} The series: {timestamps: [...], values: [...]}, timestamps in Unix seconds.
+ */
+function fetchSeries(metric, params = {}) {
+    const query = new URLSearchParams(params).toString();
+    return fetch(`/analytics/api/timeseries/${encodeURIComponent(metric)}/?${query}`, {
+        credentials: 'same-origin',
+        headers: { 'X-Requested-With': 'XMLHttpRequest' }
+    }).then(response => {
+        if (!response.ok) {
+            throw new Error(`Could not load ${metric}: HTTP ${response.status}`);
+        }
+        return response.json();
+    });
+}
+
+/**
+ * Fetch several metrics and line them up for one chart.
+ * Downsampling keeps different days for different metrics, so the labels are the union of all their
+ * days and each metric has null on the days it did not keep (draw such datasets with spanGaps: true).
+ * @param {Array<string>} metrics - The metric names.
+ * @param {Object} params - Passed to fetchSeries for every metric.
+ * @returns {Promise<Object>} {labels: [YYYY-MM-DD, ...], values: {metric: [...]}}.
+ */
+function loadSeries(metrics, params = {}) {
+    return Promise.all(metrics.map(metric => fetchSeries(metric, params))).then(results => {
+        const timestamps = [...new Set(results.flatMap(series => series.timestamps))].sort((a, b) => a - b);
+        const values = {};
+        results.forEach((series, index) => {
+            const byTimestamp = new Map(series.timestamps.map((timestamp, i) => [timestamp, series.values[i]]));
+            values[metrics[index]] = timestamps.map(timestamp => byTimestamp.has(timestamp) ? byTimestamp.get(timestamp) : null);
+        });
+        const labels = timestamps.map(timestamp => new Date(timestamp * 1000).toISOString().slice(0, 10));
+        return { labels: labels, values: values };
+    });
+}